@@ -0,0 +1,243 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from audio_writer import AtomicFileWriter
+from pcm_audio import DEFAULT_OUTPUT_FORMAT, pcm_rate
+from text_normalize import normalize_whitespace
+from tts_backend import DEFAULT_BACKEND
+
+DEFAULT_CACHE_DIR = os.getenv("ELEVENLABS_CACHE_DIR", ".tts_cache")
+DEFAULT_MAX_MB = int(os.getenv("ELEVENLABS_CACHE_MAX_MB", "500"))
+READ_CHUNK_SIZE = 4096
+
+
+def default_cache_dir():
+    """
+    DEFAULT_CACHE_DIR for the ElevenLabs backend. Other backends get a
+    subdirectory of their own, so fake audio is never served for a real request.
+    """
+    if DEFAULT_BACKEND == "elevenlabs":
+        return DEFAULT_CACHE_DIR
+    return os.path.join(DEFAULT_CACHE_DIR, DEFAULT_BACKEND)
+
+
+def voice_identity(voice):
+    """
+    Returns (voice_id, settings) for a Voice object or a plain voice name/id string.
+    """
+    if isinstance(voice, str):
+        return voice, None
+    settings = voice.settings.model_dump() if getattr(voice, "settings", None) else None
+    return voice.voice_id, settings
+
+
+def cache_key(text, voice, model, output_format=DEFAULT_OUTPUT_FORMAT):
+    """
+    Content address of a synthesized line: a hash of the normalized text,
+    voice id, model, voice settings and output format.
+    """
+    voice_id, settings = voice_identity(voice)
+    payload = {
+        "text": normalize_whitespace(text),
+        "voice_id": voice_id,
+        "model": str(model),
+        "settings": settings,
+    }
+    if output_format != DEFAULT_OUTPUT_FORMAT:
+        # Left out for MP3, so existing cache entries and manifests keep their keys
+        payload["output_format"] = output_format
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{digest}.pcm" if pcm_rate(output_format) else digest
+
+
+def entry_name(key):
+    """File name of a cache entry: keys of raw PCM entries already end in .pcm."""
+    return key if key.endswith(".pcm") else f"{key}.mp3"
+
+
+class AudioCache:
+    """
+    On-disk, content-addressed cache of synthesized audio with LRU eviction.
+
+    Entries live in `cache_dir/<key[:2]>/<key>.mp3` (`<key>.pcm` for raw
+    PCM, whose keys carry the suffix). File modification times
+    record recency, so the LRU order survives restarts. Once the total size
+    goes over `max_bytes`, the least recently used entries are deleted.
+
+    Args:
+        cache_dir (str): Directory holding the cached audio
+        max_bytes (int): Size bound for the cache directory
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        # Only <key[:2]>/<key>.mp3|.pcm one level down; another backend's cache
+        # in a subdirectory (e.g. fake/<key[:2]>/...) is not ours to count or evict
+        for prefix in os.listdir(self.cache_dir):
+            directory = os.path.join(self.cache_dir, prefix)
+            if len(prefix) != 2 or not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not name.endswith((".mp3", ".pcm")) or name[:2] != prefix:
+                    continue
+                stat = os.stat(os.path.join(directory, name))
+                found.append((stat.st_mtime, name if name.endswith(".pcm") else name[:-4], stat.st_size))
+        # Oldest first, so the front of the OrderedDict is the eviction candidate
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], entry_name(key))
+
+    def _lookup(self, key):
+        """
+        Returns the path of a cached entry and marks it most recently used,
+        or None on a miss.
+        """
+        path = self.path(key)
+        with self._lock:
+            if key in self._entries and os.path.exists(path):
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                # Missing, or deleted behind our back
+                self._total_bytes -= self._entries.pop(key, 0)
+                self.misses += 1
+                return None
+        os.utime(path)
+        return path
+
+    def paths(self, keys):
+        """
+        Paths of the entries for all `keys`, e.g. the segments of a long line,
+        marked most recently used. Returns None if any of them is missing.
+        Counts as one hit or one miss.
+        """
+        paths = [self.path(key) for key in keys]
+        with self._lock:
+            if not all(key in self._entries and os.path.exists(path) for key, path in zip(keys, paths)):
+                self.misses += 1
+                return None
+            for key in keys:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        for path in paths:
+            os.utime(path)
+        return paths
+
+    def _record(self, key, size):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total_bytes += size
+            self.bytes_written += size
+            self._evict()
+
+    def writer(self, key):
+        """
+        Returns an AtomicFileWriter for a new entry; call `commit_entry` once it is committed.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return AtomicFileWriter(path)
+
+    def commit_entry(self, key, writer):
+        writer.commit()
+        self._record(key, writer.bytes_written)
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def stream(self, text, voice, model, generate_fn, output_format=DEFAULT_OUTPUT_FORMAT):
+        """
+        Read-through streaming: yields cached audio on a hit without calling
+        `generate_fn`. On a miss, yields chunks from `generate_fn` while writing
+        them to a temp file that becomes the cache entry once the stream has
+        been fully consumed. `generate_fn` must produce `output_format`.
+        """
+        key = cache_key(text, voice, model, output_format)
+        path = self._lookup(key)
+        if path is not None:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    with self._lock:
+                        self.bytes_read += len(chunk)
+                    yield chunk
+            return
+
+        writer = self.writer(key)
+        try:
+            for chunk in generate_fn(text, voice, model):
+                writer.write(chunk)
+                yield chunk
+        except BaseException:
+            writer.abort()
+            raise
+        if writer.bytes_written:
+            self.commit_entry(key, writer)
+        else:
+            writer.abort()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_read": self.bytes_read,
+                "bytes_written": self.bytes_written,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Returns the process-wide cache shared by all entry points.
+    Set ELEVENLABS_CACHE_DIR / ELEVENLABS_CACHE_MAX_MB to configure it.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AudioCache(default_cache_dir())
+        return _default_cache
+
+
+def print_cache_stats(cache):
+    stats = cache.stats()
+    print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['bytes_read']} bytes read, {stats['bytes_written']} bytes written")
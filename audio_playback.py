@@ -0,0 +1,337 @@
+import time
+import shutil
+import threading
+import subprocess
+
+DEFAULT_BUFFER_SECONDS = 10
+DECODER_READ_SIZE = 4096
+
+
+class RingBuffer:
+    """
+    Fixed-size byte ring buffer between a producer thread (the decoder) and a
+    consumer (the audio output callback).
+
+    `write` blocks while the buffer is full, which pushes back on the decoder
+    and, through it, on the network stream. `read` never blocks so it is safe to
+    call from an audio callback.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._read_pos = 0
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def available(self):
+        with self._cond:
+            return self._size
+
+    @property
+    def finished(self):
+        """True once the producer has closed the buffer and it has been drained."""
+        with self._cond:
+            return self._closed and self._size == 0
+
+    def write(self, data):
+        view = memoryview(data)
+        while len(view):
+            with self._cond:
+                while self._size == self.capacity and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                write_pos = (self._read_pos + self._size) % self.capacity
+                count = min(len(view), self.capacity - self._size, self.capacity - write_pos)
+                self._view[write_pos:write_pos + count] = view[:count]
+                self._size += count
+            view = view[count:]
+
+    def read(self, count, align=1):
+        """
+        Returns up to `count` bytes; fewer (possibly none) if the buffer is short.
+        Until the producer closes the buffer, only whole multiples of `align`
+        bytes (e.g. one PCM frame) are returned, so a chunk that ends halfway
+        through a sample never shifts the rest of the stream.
+        """
+        with self._cond:
+            count = min(count, self._size)
+            if not self._closed:
+                count -= count % align
+            first = min(count, self.capacity - self._read_pos)
+            # One copy straight out of the ring; the region is reused as soon as the lock is released
+            data = bytes(self._view[self._read_pos:self._read_pos + first])
+            if count > first:
+                data += self._view[:count - first]
+            self._read_pos = (self._read_pos + count) % self.capacity
+            self._size -= count
+            self._cond.notify_all()
+            return data
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class Mp3StreamDecoder:
+    """
+    Incremental MP3 -> PCM decoder backed by an ffmpeg subprocess.
+
+    MP3 chunks are fed to ffmpeg's stdin as they arrive from the network, and a
+    reader thread copies decoded 16-bit PCM from its stdout into `output`
+    (a RingBuffer), so PCM frames are available as soon as the first MP3
+    frames have been decoded.
+    """
+
+    def __init__(self, output, rate=44100, channels=1, ffmpeg="ffmpeg"):
+        if not shutil.which(ffmpeg):
+            raise RuntimeError("ffmpeg not found. It is required to decode streamed MP3 audio.")
+        self.output = output
+        self.process = subprocess.Popen(
+            [ffmpeg, "-hide_banner", "-loglevel", "error",
+             "-probesize", "32", "-analyzeduration", "0", "-fflags", "nobuffer",
+             "-f", "mp3", "-i", "pipe:0",
+             "-f", "s16le", "-ac", str(channels), "-ar", str(rate), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        self._reader = threading.Thread(target=self._read_pcm, daemon=True)
+        self._reader.start()
+
+    def _read_pcm(self):
+        try:
+            while True:
+                data = self.process.stdout.read(DECODER_READ_SIZE)
+                if not data:
+                    break
+                self.output.write(data)
+        finally:
+            self.output.close()
+
+    def feed(self, chunk):
+        self.process.stdin.write(chunk)
+
+    def finish(self):
+        """
+        Signals end of input and waits until all PCM has been handed to the buffer.
+        """
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._reader.join()
+        self.process.wait()
+
+    def abort(self):
+        self.output.close()
+        self.process.kill()
+        self.process.wait()
+        self._reader.join()
+
+
+class PlaybackStats:
+    """Timing figures collected while playing one stream."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_audio_latency = None
+        self.underruns = 0
+        self.bytes_played = 0
+
+    @property
+    def first_audio_at(self):
+        if self.first_audio_latency is None:
+            return None
+        return self.started + self.first_audio_latency
+
+    def __str__(self):
+        latency = "n/a" if self.first_audio_latency is None else f"{self.first_audio_latency * 1000:.0f} ms"
+        return f"first audio after {latency}, {self.underruns} underruns, {self.bytes_played} bytes played"
+
+
+class GapTracker:
+    """
+    Measures the silence between the end of one line and the first audio of
+    the next one, i.e. the turn-to-turn gap a listener actually hears.
+    """
+
+    def __init__(self):
+        self.gaps = []
+        self._last_end = None
+
+    def line_played(self, stats, ended_at=None):
+        if self._last_end is not None and stats.first_audio_at is not None:
+            self.gaps.append(stats.first_audio_at - self._last_end)
+        self._last_end = ended_at if ended_at is not None else time.perf_counter()
+
+    def reset_turn(self):
+        """Forget the previous line, e.g. after a failed one."""
+        self._last_end = None
+
+    def summary(self):
+        if not self.gaps:
+            return "no turn gaps measured"
+        gaps = sorted(self.gaps)
+        mean = sum(gaps) / len(gaps)
+        return (f"turn gaps over {len(gaps)} transitions: mean {mean * 1000:.0f} ms, "
+                f"median {gaps[len(gaps) // 2] * 1000:.0f} ms, max {gaps[-1] * 1000:.0f} ms")
+
+
+class PlaybackState:
+    """
+    Shared callback logic for all sinks: drains the ring buffer, pads short
+    reads with silence and keeps the statistics.
+    """
+
+    def __init__(self, ring, frame_width):
+        self.ring = ring
+        self.frame_width = frame_width
+        self.stats = PlaybackStats()
+        self.done = threading.Event()
+
+    def callback(self, frame_count):
+        """
+        Returns (pcm_bytes, finished) for a request of `frame_count` frames.
+        """
+        wanted = frame_count * self.frame_width
+        data = self.ring.read(wanted, self.frame_width)
+        if data:
+            if self.stats.first_audio_latency is None:
+                self.stats.first_audio_latency = time.perf_counter() - self.stats.started
+            self.stats.bytes_played += len(data)
+
+        if len(data) < wanted:
+            if self.ring.finished:
+                self.done.set()
+                return data + b"\0" * (wanted - len(data)), True
+            if self.stats.first_audio_latency is not None:
+                # Playback has started but the decoder couldn't keep up
+                self.stats.underruns += 1
+            data += b"\0" * (wanted - len(data))
+        return data, False
+
+
+class PyAudioSink:
+    """Plays PCM through a PyAudio output stream driven by a callback."""
+
+    def __init__(self, p, rate, channels, sample_width, frames_per_buffer=1024):
+        self.p = p
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frames_per_buffer = frames_per_buffer
+        self._stream = None
+
+    def start(self, state):
+        import pyaudio
+
+        def callback(in_data, frame_count, time_info, status):
+            data, finished = state.callback(frame_count)
+            return data, pyaudio.paComplete if finished else pyaudio.paContinue
+
+        self._stream = self.p.open(format=self.p.get_format_from_width(self.sample_width),
+                                   channels=self.channels,
+                                   rate=self.rate,
+                                   output=True,
+                                   frames_per_buffer=self.frames_per_buffer,
+                                   stream_callback=callback)
+        self._stream.start_stream()
+
+    def stop(self):
+        if self._stream:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+
+
+class NullSink:
+    """
+    Discards PCM at the real-time rate, calling the playback callback from a
+    thread exactly like an audio device would. Used for headless testing and
+    benchmarks.
+    """
+
+    def __init__(self, rate, channels, sample_width, frames_per_buffer=1024):
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, state):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(state,), daemon=True)
+        self._thread.start()
+
+    def _run(self, state):
+        period = self.frames_per_buffer / self.rate
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            _, finished = state.callback(self.frames_per_buffer)
+            if finished:
+                break
+            deadline += period
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+class PcmPassthrough:
+    """
+    Stand-in for Mp3StreamDecoder when the stream already is raw PCM in the
+    output format: chunks go straight into the ring buffer as memoryviews,
+    with no decoder process and no intermediate copy.
+    """
+
+    def __init__(self, output):
+        self.output = output
+
+    def feed(self, chunk):
+        self.output.write(memoryview(chunk))
+
+    def finish(self):
+        self.output.close()
+
+    def abort(self):
+        self.output.close()
+
+
+def play_stream(audio_stream, sink, rate=44100, channels=1, sample_width=2,
+                buffer_seconds=DEFAULT_BUFFER_SECONDS, on_chunk=None, pcm=False):
+    """
+    Plays an MP3 chunk iterator through `sink` while it is still downloading.
+
+    Chunks are decoded incrementally into a ring buffer that the sink's
+    callback drains, so time-to-first-audio depends on the first chunk rather
+    than the whole utterance. With `pcm=True` the chunks are raw PCM in the
+    sink's format (e.g. a "pcm_44100" request) and skip the decoder entirely.
+
+    Returns:
+        PlaybackStats: first-audio latency, underrun count and bytes played
+    """
+    frame_width = channels * sample_width
+    ring = RingBuffer(rate * frame_width * buffer_seconds)
+    state = PlaybackState(ring, frame_width)
+    decoder = PcmPassthrough(ring) if pcm else Mp3StreamDecoder(ring, rate=rate, channels=channels)
+    sink.start(state)
+    try:
+        for chunk in audio_stream:
+            if on_chunk:
+                on_chunk(chunk)
+            decoder.feed(chunk)
+        decoder.finish()
+        state.done.wait()
+    except BaseException:
+        decoder.abort()
+        raise
+    finally:
+        sink.stop()
+    return state.stats
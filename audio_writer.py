@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import uuid
+
+from pcm_audio import PCM_CHANNELS, PCM_SAMPLE_WIDTH, pcm_rate, wav_header
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process in bytes, or None where unsupported.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def temp_path_for(filename):
+    """
+    A unique hidden temp path in the same directory as `filename`, so the
+    final rename stays on one filesystem and is atomic.
+    """
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.part")
+
+
+def format_rate(bytes_per_second):
+    return f"{bytes_per_second / 1024:.0f} KB/s"
+
+
+class AtomicFileWriter:
+    """
+    Streams audio chunks straight into a temp file next to `filename` and
+    renames it into place on commit.
+
+    Chunks are never accumulated in memory, and readers never see a half
+    written file: the final path either doesn't exist yet or is complete.
+    Use it as a context manager to commit on success and abort on error.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.bytes_written = 0
+        self.chunks = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.temp_path = temp_path_for(filename)
+        # Plain open (not mkstemp) so the file gets the usual umask-based permissions
+        self._file = open(self.temp_path, "xb")
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self.bytes_written += len(chunk)
+        self.chunks += 1
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.temp_path, self.filename)
+        self.elapsed = time.perf_counter() - self.started
+
+    # Lets the writer act as a StreamTee sink
+    close = commit
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    @property
+    def bytes_per_second(self):
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        return self.bytes_written / elapsed if elapsed > 0 else 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+class WavFileWriter(AtomicFileWriter):
+    """
+    AtomicFileWriter for raw PCM chunks that stores them as a WAV file.
+
+    The header is written up front with a zero length and patched with the
+    real sizes on commit, so the samples are still streamed straight to disk.
+    """
+
+    def __init__(self, filename, rate, channels=PCM_CHANNELS, sample_width=PCM_SAMPLE_WIDTH):
+        super().__init__(filename)
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self._file.write(wav_header(rate, channels, sample_width))
+
+    def commit(self):
+        self._file.seek(0)
+        self._file.write(wav_header(self.rate, self.channels, self.sample_width, self.bytes_written))
+        super().commit()
+
+    close = commit
+
+
+def open_writer(filename, output_format=None):
+    """
+    A WavFileWriter for PCM output formats, otherwise a plain AtomicFileWriter.
+    """
+    rate = pcm_rate(output_format)
+    return WavFileWriter(filename, rate) if rate else AtomicFileWriter(filename)
+
+
+def write_stream(chunks, filename, on_chunk=None, output_format=None, writer=None):
+    """
+    Writes a chunk iterator to `filename` atomically (as WAV for PCM output formats),
+    or into `writer` if one is given (e.g. a segment store's SegmentWriter).
+
+    Returns:
+        AtomicFileWriter: the committed writer, for bytes_written / bytes_per_second
+    """
+    with writer or open_writer(filename, output_format) as writer:
+        for chunk in chunks:
+            if on_chunk:
+                on_chunk(chunk)
+            writer.write(chunk)
+    return writer
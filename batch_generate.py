@@ -0,0 +1,220 @@
+import os
+import glob
+import hashlib
+import argparse
+import threading
+from config import require_api_key
+from conversation import iter_lines, load_conversation
+from audio_cache import get_default_cache
+from rate_limiter import get_default_limiter
+from metrics import get_default_metrics
+from voice_catalog import get_default_catalog
+from dedup import DedupIndex
+from manifest import ConversationManifest, plan_incremental, recorded_source
+from segment_store import SegmentStore, compact_stores
+from pcm_audio import DEFAULT_OUTPUT_FORMAT
+from synthesis import DEFAULT_MODEL, DEFAULT_WORKERS, LineJob, SynthesisEngine, add_synthesis_arguments, audio_filename, ensure_dir, print_engine_stats, print_summary
+
+
+def find_conversation_files(inputs):
+    """
+    Expands directories (all *.json and *.jsonl inside) and glob patterns into a sorted list of files.
+    """
+    files = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            files.extend(glob.glob(os.path.join(pattern, "*.json")))
+            files.extend(glob.glob(os.path.join(pattern, "*.jsonl")))
+        else:
+            files.extend(glob.glob(pattern))
+    return sorted(set(files))
+
+
+def conversation_output_dir(output_dir, filename, used):
+    """
+    Per-conversation output directory named after the input file.
+
+    The plain stem is used unless another input of this run took it or
+    another file's manifest is already there. Then the name gets a short
+    hash of the file's path, so it doesn't depend on which other inputs
+    were given or in what order, and never points at another conversation's
+    audio (which an incremental run would delete).
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    name = stem
+    source = recorded_source(os.path.join(output_dir, name))
+    if name in used or (source is not None and os.path.abspath(source) != os.path.abspath(filename)):
+        digest = hashlib.blake2b(os.path.abspath(filename).encode("utf-8"), digest_size=4).hexdigest()
+        name = f"{stem}_{digest}"
+    used.add(name)
+    return os.path.join(output_dir, name)
+
+
+def resolve_voice(name_or_id, catalog):
+    """
+    Finds a Voice by name or id, falling back to the plain string (generate accepts both).
+    """
+    return catalog.find(name_or_id) or name_or_id
+
+
+class BatchPlan:
+    """
+    The jobs for every line of every conversation that isn't already complete,
+    produced while the conversation files are read.
+
+    A conversation with no earlier output is streamed: its jobs are yielded as
+    its lines are parsed, so synthesis starts before a large file has been
+    read to the end. A conversation that was generated before is read whole
+    and matched against its manifest; lines that only moved are renumbered
+    rather than synthesized again (see plan_incremental).
+    With `segment_store`, each conversation's lines are appended to one segment store.
+
+    Iterate it once, e.g. by passing it to SynthesisEngine.run. `tracking`
+    ({job: (manifest, content hash)}) and the counts fill in as it goes.
+    """
+
+    def __init__(self, conversation_files, output_dir, voices_by_role, model, output_format=DEFAULT_OUTPUT_FORMAT,
+                 segment_store=False):
+        self.conversation_files = conversation_files
+        self.output_dir = output_dir
+        self.voices_by_role = voices_by_role
+        self.model = model
+        self.output_format = output_format
+        self.segment_store = segment_store
+        self.tracking = {}
+        # Directories of the segment stores written to, to compact after the run
+        self.store_dirs = []
+        self.planned = 0
+        self.skipped = 0
+
+    def voice_for(self, role):
+        return self.voices_by_role.get(role, self.voices_by_role["customer"])
+
+    def __iter__(self):
+        used_names = set()
+        for filename in self.conversation_files:
+            conversation_dir = conversation_output_dir(self.output_dir, filename, used_names)
+            ensure_dir(conversation_dir)
+            manifest = ConversationManifest(conversation_dir, source=filename, model=self.model)
+            store = SegmentStore(conversation_dir) if self.segment_store else None
+            if store:
+                self.store_dirs.append(conversation_dir)
+            planned = self.planned
+            try:
+                if manifest.data["lines"] or (store and store.segments()):
+                    jobs = self._incremental_jobs(filename, manifest, store)
+                else:
+                    jobs = self._new_jobs(filename, manifest, store)
+                for job in jobs:
+                    self.planned += 1
+                    yield job
+            except (OSError, ValueError) as e:
+                if self.planned == planned:
+                    print(f"Skipping {filename}: {e}")
+                else:
+                    print(f"Stopped reading {filename} after {self.planned - planned} lines: {e}")
+
+    def _new_jobs(self, filename, manifest, store):
+        for i, line in enumerate(iter_lines(filename)):
+            voice = self.voice_for(line.role)
+            target = (store.location(i + 1) if store
+                      else audio_filename(manifest.output_dir, i, line.role, line.text, self.output_format))
+            job = LineJob(i, line.role, line.text, voice, target, store)
+            self.tracking[job] = (manifest, manifest.line_hash(line.text, voice, self.model, self.output_format))
+            yield job
+
+    def _incremental_jobs(self, filename, manifest, store):
+        lines = [(line.role, line.text, self.voice_for(line.role)) for line in load_conversation(filename)]
+        plan = plan_incremental(manifest, lines, self.model, self.output_format, store)
+        if plan.moved or plan.removed:
+            print(f"{filename}: {plan}")
+        self.skipped += len(plan.unchanged) + len(plan.moved)
+        for job in plan.jobs:
+            self.tracking[job] = (manifest, plan.hashes[job])
+            yield job
+
+
+def plan_jobs(conversation_files, output_dir, voices_by_role, model, output_format=DEFAULT_OUTPUT_FORMAT,
+              segment_store=False):
+    """
+    Plans all jobs up front (see BatchPlan).
+
+    Returns:
+        tuple: (jobs, {job: (manifest, content hash)}, number of lines skipped)
+    """
+    plan = BatchPlan(conversation_files, output_dir, voices_by_role, model, output_format, segment_store)
+    jobs = list(plan)
+    return jobs, plan.tracking, plan.skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate audio for many conversation files without interaction. "
+                    "Re-running the same command resumes where a previous run stopped.")
+    parser.add_argument("inputs", nargs="+", help="Conversation JSON files, directories or glob patterns")
+    parser.add_argument("--output_dir", default="batch_output", help="Root directory; one subdirectory per conversation")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Lines synthesized in parallel across all files")
+    parser.add_argument("--agent_voice", default="Daniel", help="Voice name or id for the agent")
+    parser.add_argument("--customer_voice", default="Rachel", help="Voice name or id for the customer")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="ElevenLabs model id")
+    parser.add_argument("--segment_store", action="store_true",
+                        help="Append each conversation's lines to one segment store (segments.dat + index)")
+    add_synthesis_arguments(parser)
+    args = parser.parse_args()
+
+    print("ElevenLabs Batch Conversation Generator")
+    print("=======================================")
+
+    conversation_files = find_conversation_files(args.inputs)
+    if not conversation_files:
+        print("Error: No conversation files found.")
+        return
+
+    require_api_key()
+
+    catalog = get_default_catalog()
+    voices_by_role = {
+        "agent": resolve_voice(args.agent_voice, catalog),
+        "customer": resolve_voice(args.customer_voice, catalog),
+    }
+
+    # Conversations are read while their first lines are already being synthesized
+    plan = BatchPlan(conversation_files, args.output_dir, voices_by_role, args.model,
+                     args.output_format, args.segment_store)
+    print(f"{len(conversation_files)} conversations found.")
+
+    # Manifests with finished lines that haven't been saved yet
+    unsaved = set()
+    unsaved_lock = threading.Lock()
+
+    def on_complete(result):
+        # Checkpoint as lines finish (in batches, see ConversationManifest.record)
+        manifest, content_hash = plan.tracking.pop(result.job)
+        with unsaved_lock:
+            if manifest.record(result, content_hash):
+                unsaved.discard(manifest)
+            else:
+                unsaved.add(manifest)
+
+    def on_result(result):
+        if not result.ok:
+            print(f"Error generating {result.job.filename}: {result.error}")
+
+    engine = SynthesisEngine(workers=args.workers, model=args.model, cache=get_default_cache(),
+                             limiter=get_default_limiter(), segment_chars=args.segment_chars,
+                             metrics=get_default_metrics(), output_format=args.output_format)
+    # Repeats within and across conversations are synthesized once
+    dedup_index = None if args.no_dedup else DedupIndex()
+    results = engine.run(plan, on_result=on_result, on_complete=on_complete, dedup=dedup_index)
+    for manifest in list(unsaved):
+        manifest.flush()
+    print(f"{len(conversation_files)} conversations: {plan.planned} lines generated, "
+          f"{plan.skipped} already complete.")
+    print_summary(results, args.output_dir)
+    # Edits and re-runs leave superseded audio behind in the stores
+    compact_stores(plan.store_dirs)
+    print_engine_stats(engine, dedup_index)
+
+
+if __name__ == "__main__":
+    main()
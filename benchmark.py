@@ -0,0 +1,927 @@
+import io
+import os
+import sys
+import json
+import glob
+import time
+import platform
+import random
+import statistics
+import shutil
+import argparse
+import tempfile
+import subprocess
+import threading
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from combine_audio import combine_audio_files
+from conversation import Conversation, Line
+from audio_cache import AudioCache
+from audio_playback import GapTracker, NullSink, play_stream
+from audio_writer import peak_rss_bytes, write_stream
+from batch_generate import plan_jobs
+from metrics import MetricsRecorder
+from rate_limiter import AdaptiveRateLimiter, ThrottledError
+from stream_hub import StreamHub
+from text_segmenter import DEFAULT_SEGMENT_CHARS
+from synthesis import LineJob, SynthesisEngine, audio_filename, lookahead
+from pcm_audio import MP3_FORMAT
+from tts_backend import DEFAULT_MODEL, FAKE_VOICES, FakeBackend
+from voice_catalog import VoiceCatalog
+
+
+def fake_generate(latency=0.3, chunks=8, chunk_size=2048, chunk_delay=0.02):
+    """
+    Returns a stand-in for elevenlabs.generate that never touches the network.
+    It waits `latency` seconds before the first chunk (time-to-first-byte) and
+    `chunk_delay` between chunks, like a real streaming response.
+    """
+    def generate_fn(text, voice, model, output_format=None):
+        time.sleep(latency)
+        for _ in range(chunks):
+            yield b"\0" * chunk_size
+            time.sleep(chunk_delay)
+    return generate_fn
+
+
+def make_jobs(output_dir, lines):
+    jobs = []
+    for i in range(lines):
+        role = "agent" if i % 2 == 0 else "customer"
+        text = f"Benchmark line number {i+1} for the {role}."
+        jobs.append(LineJob(i, role, text, None, audio_filename(output_dir, i, role, text)))
+    return jobs
+
+
+def bench_synthesis(args):
+    """
+    Compares one-at-a-time synthesis with the concurrent engine on a fake backend.
+    """
+    generate_fn = fake_generate(latency=args.latency)
+    timings = {}
+    for workers in sorted({1, args.workers}):
+        output_dir = tempfile.mkdtemp(prefix="bench_synthesis_")
+        try:
+            engine = SynthesisEngine(workers=workers, generate_fn=generate_fn)
+            start = time.perf_counter()
+            results = engine.run(make_jobs(output_dir, args.lines))
+            timings[workers] = time.perf_counter() - start
+
+            files = sorted(os.listdir(output_dir))
+            assert len(files) == args.lines and all(r.ok for r in results)
+        finally:
+            shutil.rmtree(output_dir)
+        print(f"workers={workers:<3d} lines={args.lines}  wall={timings[workers]:.2f}s")
+
+    if len(timings) > 1:
+        print(f"Speedup: {timings[1] / timings[args.workers]:.1f}x")
+
+
+def synthetic_mp3(seconds, rate=44100):
+    """
+    Encodes a sine tone with ffmpeg so benchmarks have real MP3 data to decode.
+    """
+    return subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error",
+         "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}:sample_rate={rate}",
+         "-ac", "1", "-f", "mp3", "pipe:1"],
+        check=True, stdout=subprocess.PIPE,
+    ).stdout
+
+
+def paced_stream(data, chunk_size, chunk_delay, latency):
+    time.sleep(latency)
+    for offset in range(0, len(data), chunk_size):
+        yield data[offset:offset + chunk_size]
+        time.sleep(chunk_delay)
+
+
+def bench_playback(args):
+    """
+    Plays a slowly arriving MP3 stream into a null sink and reports how soon
+    audio starts compared to how long the full download takes.
+    """
+    data = synthetic_mp3(args.seconds)
+    chunks = -(-len(data) // args.chunk_size)
+    download_time = args.latency + chunks * args.chunk_delay
+
+    sink = NullSink(44100, 1, 2)
+    start = time.perf_counter()
+    stats = play_stream(paced_stream(data, args.chunk_size, args.chunk_delay, args.latency), sink)
+    total = time.perf_counter() - start
+
+    print(f"{len(data)} bytes in {chunks} chunks, download takes ~{download_time:.2f}s")
+    print(f"First audio after {stats.first_audio_latency * 1000:.0f} ms "
+          f"(buffer-then-play would wait ~{download_time * 1000:.0f} ms)")
+    print(f"Underruns: {stats.underruns}, played {stats.bytes_played / 88200:.2f}s of audio in {total:.2f}s")
+
+
+def bench_prefetch(args):
+    """
+    Plays a conversation into a null sink with and without look-ahead and
+    compares the turn-to-turn gaps.
+    """
+    data = synthetic_mp3(args.seconds)
+
+    def open_stream(line):
+        return paced_stream(data, 2048, 0.005, args.latency)
+
+    for depth in sorted({0, args.depth}):
+        gaps = GapTracker()
+        for line, audio_stream in lookahead(range(args.lines), open_stream, depth):
+            gaps.line_played(play_stream(audio_stream, NullSink(44100, 1, 2)))
+            time.sleep(args.silence / 1000)
+        print(f"lookahead={depth}: {gaps.summary()}")
+
+
+def _collect(method, total_bytes, chunk_size, output_dir):
+    """
+    Runs one chunk-collection strategy; executed in a fresh process so peak RSS is per strategy.
+    """
+    chunk = b"\x55" * chunk_size
+    chunks = (chunk for _ in range(total_bytes // chunk_size))
+    filename = os.path.join(output_dir, f"{method}.mp3")
+    start = time.perf_counter()
+    if method == "bytes_concat":
+        audio_data = bytes()
+        for c in chunks:
+            audio_data += c
+        with open(filename, "wb") as f:
+            f.write(audio_data)
+    elif method == "bytearray":
+        audio_data = bytearray()
+        for c in chunks:
+            audio_data += c
+        with open(filename, "wb") as f:
+            f.write(audio_data)
+    else:
+        write_stream(chunks, filename)
+    return time.perf_counter() - start, peak_rss_bytes()
+
+
+def bench_writer(args):
+    """
+    Compares immutable bytes concatenation with a bytearray and the streaming writer.
+    """
+    total_bytes = args.megabytes * 1024 * 1024
+    output_dir = tempfile.mkdtemp(prefix="bench_writer_")
+    try:
+        for method in ("bytes_concat", "bytearray", "streaming_writer"):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                elapsed, peak = executor.submit(_collect, method, total_bytes, args.chunk_size, output_dir).result()
+            rate = total_bytes / elapsed / (1024 * 1024)
+            peak = f"{peak / (1024 * 1024):.1f} MB" if peak else "n/a"
+            print(f"{method:<17s} {elapsed * 1000:8.1f} ms  {rate:8.1f} MB/s  peak RSS {peak}")
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def write_corpus(output_dir, clips, seconds, extension="mp3"):
+    """
+    Generates a directory of numbered synthetic clips like the ones generate_audio writes
+    (WAV clips like the ones a pcm_44100 output format produces with extension="wav").
+    """
+    codec = ["-c:a", "pcm_s16le", "-bitexact"] if extension == "wav" else ["-b:a", "128k"]
+
+    def encode(i):
+        role = "agent" if i % 2 == 0 else "customer"
+        subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error",
+             "-f", "lavfi", "-i", f"sine=frequency={200 + i % 50 * 10}:duration={seconds}:sample_rate=44100",
+             "-ac", "1", *codec, os.path.join(output_dir, f"{i+1:04d}_{role}_clip.{extension}")],
+            check=True,
+        )
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(encode, range(clips)))
+
+
+def bench_combine(args):
+    """
+    Times the decode path of combine_audio_files with 1..N decode processes,
+    plus the frame-concatenation fast path for reference.
+    """
+    corpus = tempfile.mkdtemp(prefix="bench_combine_")
+    try:
+        write_corpus(corpus, args.clips, args.seconds)
+        output_file = os.path.join(corpus, "combined.out")
+        jobs = 1
+        while True:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                combine_audio_files(corpus, output_file, 500, reencode=True, jobs=jobs)
+            print(f"decode path  jobs={jobs:<3d} {time.perf_counter() - start:7.2f}s")
+            if jobs >= args.max_jobs:
+                break
+            jobs = min(jobs * 2, args.max_jobs)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            combine_audio_files(corpus, output_file, 500)
+        print(f"frame concatenation    {time.perf_counter() - start:7.2f}s")
+    finally:
+        shutil.rmtree(corpus)
+
+
+def cpu_seconds():
+    """User + system CPU time of this process and its finished children (e.g. ffmpeg)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class DrainSink(NullSink):
+    """
+    NullSink without the real-time pacing: drains the ring buffer as fast as
+    the producer fills it, so a run measures CPU rather than wall time.
+    """
+
+    def _run(self, state):
+        while not self._stop.is_set():
+            if not state.ring.available and not state.ring.finished:
+                time.sleep(0.001)
+                continue
+            _, finished = state.callback(self.frames_per_buffer)
+            if finished:
+                break
+
+
+def bench_pcm(args):
+    """
+    CPU spent per minute of audio with MP3 responses (decoded for playback
+    and again for combining) vs. pcm_44100 responses (played as they are,
+    combined without decoding, encoded to MP3 once at export).
+    """
+    minutes = args.clips * args.seconds / 60
+    mp3 = synthetic_mp3(args.clips * args.seconds)
+    pcm = FakeBackend(ms_per_char=args.clips * args.seconds * 1000).audio("x", "bench", "pcm_44100")
+    results = {}
+
+    for label, data, is_pcm in (("mp3", mp3, False), ("pcm", pcm, True)):
+        before = cpu_seconds()
+        play_stream(paced_stream(data, 4096, 0, 0), DrainSink(44100, 1, 2), pcm=is_pcm)
+        results["playback", label] = (cpu_seconds() - before) / minutes
+
+    for extension, label in (("mp3", "mp3"), ("wav", "pcm")):
+        corpus = tempfile.mkdtemp(prefix="bench_pcm_")
+        try:
+            write_corpus(corpus, args.clips, args.seconds, extension)
+            metrics = MetricsRecorder(path=None)
+            before = cpu_seconds()
+            with contextlib.redirect_stdout(io.StringIO()):
+                ok = combine_audio_files(corpus, os.path.join(corpus, "combined.out"), 500, reencode=True,
+                                         jobs=1, metrics=metrics)
+            failed = metrics.summary().get("combine", {}).get("errors", 0)
+            if ok and not failed:
+                results["combine", label] = (cpu_seconds() - before) / minutes
+            else:
+                print(f"combine ({label}): {failed} of {args.clips} clips failed to decode, not measured")
+        finally:
+            shutil.rmtree(corpus)
+
+    print(f"CPU seconds per minute of audio ({minutes:.1f} min, {args.clips} clips):")
+    for stage in ("playback", "combine"):
+        mp3_cpu, pcm_cpu = results.get((stage, "mp3")), results.get((stage, "pcm"))
+        if mp3_cpu is None or pcm_cpu is None:
+            continue
+        print(f"  {stage:<9s} mp3 {mp3_cpu:6.3f}s  pcm {pcm_cpu:6.3f}s  saved {mp3_cpu - pcm_cpu:6.3f}s "
+              f"({(1 - pcm_cpu / mp3_cpu) * 100:.0f}%)")
+
+
+class FakeThrottlingEndpoint:
+    """
+    Local stand-in for the TTS API that answers with 429s (ThrottledError with a
+    Retry-After hint) once more than `max_concurrent` streams are open or more
+    than `max_rate` requests arrive per second.
+    """
+
+    def __init__(self, max_concurrent=3, max_rate=10.0, latency=0.2, retry_after=0.5):
+        self.max_concurrent = max_concurrent
+        self.max_rate = max_rate
+        self.latency = latency
+        self.retry_after = retry_after
+        self.open_streams = 0
+        self.throttled = 0
+        self._recent = []
+        self._lock = threading.Lock()
+
+    def generate(self, text, voice, model, output_format=None):
+        with self._lock:
+            now = time.monotonic()
+            self._recent = [t for t in self._recent if now - t < 1.0]
+            if self.open_streams >= self.max_concurrent or len(self._recent) >= self.max_rate:
+                self.throttled += 1
+                raise ThrottledError("too_many_concurrent_requests", retry_after=self.retry_after)
+            self._recent.append(now)
+            self.open_streams += 1
+        try:
+            time.sleep(self.latency)
+            for _ in range(4):
+                yield b"\0" * 2048
+        finally:
+            with self._lock:
+                self.open_streams -= 1
+
+
+def bench_ratelimit(args):
+    """
+    Runs the same job list against a throttling fake endpoint with and without
+    the adaptive rate limiter.
+    """
+    for limited in (False, True):
+        endpoint = FakeThrottlingEndpoint(args.max_concurrent, args.max_rate)
+        limiter = AdaptiveRateLimiter(rate=args.max_rate * 2, max_concurrency=args.workers) if limited else None
+        output_dir = tempfile.mkdtemp(prefix="bench_ratelimit_")
+        try:
+            engine = SynthesisEngine(workers=args.workers, generate_fn=endpoint.generate, limiter=limiter)
+            start = time.perf_counter()
+            results = engine.run(make_jobs(output_dir, args.lines))
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(output_dir)
+        ok = sum(1 for r in results if r.ok)
+        label = "adaptive limiter" if limited else "no limiter"
+        print(f"{label:<17s} {ok}/{args.lines} lines ok, {endpoint.throttled} 429s, wall {elapsed:.2f}s")
+        if limiter:
+            stats = limiter.stats()
+            print(f"{'':17s} settled at {stats['rate']} req/s, {stats['concurrency']} concurrent")
+
+
+LONG_LINE = ("I've located your order. It appears there was a slight delay in processing due to one item being "
+             "temporarily out of stock. However, I see that your order has now been shipped and should arrive "
+             "within the next two days. You should receive an email confirmation shortly.")
+
+
+def bench_segments(args):
+    """
+    Time to first chunk and total time for long lines, synthesized whole vs.
+    as concurrent sentence segments. The fake backend's latency grows with
+    the text length, like the real API's.
+    """
+    def generate_fn(text, voice, model, output_format=None):
+        time.sleep(args.latency + args.ms_per_char * len(text) / 1000)
+        for _ in range(max(1, len(text) // 20)):
+            yield b"\0" * 2048
+            time.sleep(0.005)
+
+    text = " ".join([LONG_LINE] * args.repeat)
+    for segment_chars in (0, args.segment_chars):
+        engine = SynthesisEngine(generate_fn=generate_fn, segment_chars=segment_chars)
+        start = time.perf_counter()
+        first = None
+        for _ in engine.stream(text, None):
+            if first is None:
+                first = time.perf_counter() - start
+        total = time.perf_counter() - start
+        label = f"segments of {segment_chars}" if segment_chars else "whole line"
+        print(f"{label:<18s} {len(text)} chars: first chunk {first * 1000:.0f} ms, complete {total * 1000:.0f} ms")
+
+
+def bench_stream(args):
+    """
+    Load test for the web UI's /stream path: many listeners request a few
+    distinct lines at staggered times, with and without request coalescing.
+    """
+    generate_fn = fake_generate(latency=args.latency, chunks=args.chunks)
+    texts = [f"Popular line number {i+1}." for i in range(args.distinct)]
+    rng = random.Random(0)
+    schedule = [(rng.uniform(0, args.stagger), texts[i % args.distinct]) for i in range(args.listeners)]
+
+    for coalesce in (False, True):
+        hub = StreamHub()
+        upstream = {"calls": 0, "open": 0, "peak_open": 0}
+        lock = threading.Lock()
+
+        def open_upstream(text):
+            with lock:
+                upstream["calls"] += 1
+                upstream["open"] += 1
+                upstream["peak_open"] = max(upstream["peak_open"], upstream["open"])
+            try:
+                yield from generate_fn(text, None, None)
+            finally:
+                with lock:
+                    upstream["open"] -= 1
+
+        def listen(delay, text):
+            time.sleep(delay)
+            start = time.perf_counter()
+            if coalesce:
+                chunks = hub.subscribe(text, lambda: open_upstream(text))
+            else:
+                chunks = open_upstream(text)
+            first = None
+            received = 0
+            for chunk in chunks:
+                if first is None:
+                    first = time.perf_counter() - start
+                received += len(chunk)
+            assert received == args.chunks * 2048
+            return first
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.listeners) as executor:
+            first_chunk = list(executor.map(lambda item: listen(*item), schedule))
+        wall = time.perf_counter() - start
+
+        label = "coalesced" if coalesce else "direct"
+        print(f"{label:<10s} {args.listeners} listeners: {upstream['calls']} upstream calls "
+              f"(peak {upstream['peak_open']} open), first chunk p50 {statistics.median(first_chunk) * 1000:.0f} ms, "
+              f"wall {wall:.2f}s")
+
+
+class TLSStandIn:
+    """
+    Local HTTPS stand-in for the text-to-speech endpoint, with a self-signed
+    certificate (made with the openssl command line tool).
+
+    It speaks HTTP/1.1 keep-alive and answers like the API, with the
+    FakeBackend's audio. `rtt` simulates a network round trip: a new
+    connection waits two of them before its TLS handshake (TCP, then TLS),
+    and every request waits one. It also counts the connections it accepted.
+    """
+
+    def __init__(self, rtt=0.0, ms_per_char=60.0):
+        import ssl
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.directory = tempfile.mkdtemp(prefix="bench_tls_")
+        self.cert = os.path.join(self.directory, "cert.pem")
+        key = os.path.join(self.directory, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-keyout", key, "-out", self.cert, "-subj", "/CN=127.0.0.1",
+                        "-addext", "subjectAltName=IP:127.0.0.1"], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cert, key)
+        backend = FakeBackend(ms_per_char=ms_per_char)
+        stand_in = self
+        self.connections = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; don't let Nagle hold the body back for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                with stand_in._lock:
+                    stand_in.connections += 1
+                time.sleep(2 * rtt)
+                # Handshake in the connection's own thread, not in the accept loop
+                self.request = context.wrap_socket(self.request, server_side=True)
+                super().setup()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                time.sleep(rtt)
+                voice_id = self.path.split("/")[3]
+                output_format = self.path.partition("output_format=")[2].split("&")[0]
+                audio = backend.audio(body["text"], voice_id, output_format or "mp3_44100_128")
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(len(audio)))
+                self.end_headers()
+                self.wfile.write(audio)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"https://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+
+def bench_http(args):
+    """
+    Synthesis requests against a local TLS stand-in: the SDK's request path
+    (a new connection per call) vs. the pooled keep-alive SynthesisClient.
+    """
+    from elevenlabs import generate
+    from elevenlabs.api import Voice, tts
+    from http_client import SynthesisClient
+
+    if not shutil.which("openssl"):
+        print("openssl not found; it is needed to make the stand-in's certificate")
+        return
+    stand_in = TLSStandIn(rtt=args.rtt / 1000)
+    voices = [Voice(voice_id=voice_id, name=name) for voice_id, name in FAKE_VOICES[:2]]
+    texts = [SUITE_LINES[i % len(SUITE_LINES)] for i in range(args.lines)]
+    # The SDK reads its base URL and CA bundle from the environment / module globals
+    os.environ.update(ELEVEN_API_KEY="bench", REQUESTS_CA_BUNDLE=stand_in.cert)
+    tts.api_base_url_v1 = stand_in.base_url
+    try:
+        for label in ("sdk", "pooled"):
+            client = None
+            if label == "pooled":
+                client = SynthesisClient(pool_size=args.workers, base_url=stand_in.base_url,
+                                         verify=stand_in.cert, api_key="bench")
+                stream = lambda text, voice: client.generate_stream(text, voice, DEFAULT_MODEL, MP3_FORMAT)
+            else:
+                stream = lambda text, voice: generate(text=text, voice=voice, model=DEFAULT_MODEL, stream=True)
+
+            def synthesize(i):
+                start = time.perf_counter()
+                first = None
+                for _ in stream(texts[i], voices[i % 2]):
+                    if first is None:
+                        first = time.perf_counter() - start
+                return first
+
+            connections_before = stand_in.connections
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                first_chunk = list(executor.map(synthesize, range(args.lines)))
+            wall = time.perf_counter() - start
+            connections = stand_in.connections - connections_before
+            print(f"{label:<7s} {args.lines} lines x {args.workers} workers: {connections} TLS connections, "
+                  f"first chunk p50 {statistics.median(first_chunk) * 1000:.0f} ms, wall {wall:.2f}s")
+            if client:
+                print(f"{'':7s} client stats: {client.stats()}")
+                client.close()
+    finally:
+        stand_in.close()
+
+
+# Import-time budget per entry point in milliseconds; `benchmark.py startup` fails above it
+STARTUP_BUDGET_MS = {
+    "conversation_generator": 60,
+    "custom_conversation": 60,
+    "stream_conversation": 60,
+    "batch_generate": 60,
+    "combine_audio": 60,
+    "web_ui": 250,
+}
+
+
+def import_profile(module):
+    """
+    Imports `module` in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        tuple: (cumulative import time of the module in ms, {top-level dependency: ms})
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    total, dependencies = None, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0:
+            # -X importtime lists children before their parent, so a top-level line closes a block
+            if name == module:
+                total = int(cumulative) / 1000
+                break
+            dependencies = {}
+        elif depth == 1:
+            dependencies[name.strip()] = int(cumulative) / 1000
+    return total, dependencies
+
+
+def bench_startup(args):
+    """
+    Measures how long each entry point takes to import (what `--help` or a
+    cache-only run pays before doing anything) and checks it against a budget.
+    """
+    failed = []
+    for module in args.modules or STARTUP_BUDGET_MS:
+        runs = [import_profile(module) for _ in range(args.runs)]
+        total, dependencies = min(runs, key=lambda run: run[0])
+        budget = STARTUP_BUDGET_MS.get(module)
+        heaviest = sorted(dependencies.items(), key=lambda item: -item[1])[:3]
+        status = "" if budget is None else ("ok" if total <= budget else "OVER BUDGET")
+        print(f"{module:<24s} {total:7.1f} ms  (budget {budget} ms) {status}")
+        print(f"{'':24s} heaviest: " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in heaviest))
+        if budget is not None and total > budget:
+            failed.append(module)
+    if failed:
+        sys.exit(f"Startup regression: {', '.join(failed)}")
+
+
+RESULTS_DIR = ".benchmarks"
+
+SUITE_LINES = [
+    "Thank you for calling customer support. How may I assist you today?",
+    "Hi, I'm having trouble with my recent order.",
+    "I'd be happy to look into that for you. Could you please provide your order number?",
+    "Yes, it's order number 78924.",
+]
+
+
+def _fake_backend(args, **overrides):
+    options = dict(latency=args.latency, throughput=args.throughput, chunk_size=4096, seed=args.seed)
+    options.update(overrides)
+    return FakeBackend(**options)
+
+
+def _timing(summary, stage, field, quantile="p50"):
+    value = summary.get(stage, {}).get(field, {}).get(quantile)
+    return round(value * 1000, 1) if value is not None else None
+
+
+def suite_batch(args, workdir):
+    """
+    batch_generate's path: plan jobs from conversation files, synthesize with
+    manifests checkpointed per line, against a fake backend with injected errors.
+    """
+    conversations = os.path.join(workdir, "conversations")
+    os.makedirs(conversations)
+    for n in range(args.conversations):
+        lines = [{"role": "agent" if i % 2 == 0 else "customer", "text": f"{SUITE_LINES[i % len(SUITE_LINES)]} ({n}.{i})"}
+                 for i in range(args.lines)]
+        with open(os.path.join(conversations, f"conversation_{n:03d}.json"), "w") as f:
+            json.dump(lines, f)
+
+    metrics = MetricsRecorder(path=None)
+    backend = _fake_backend(args, error_rate=args.error_rate)
+    engine = SynthesisEngine(workers=args.workers, generate_fn=backend, cache=AudioCache(os.path.join(workdir, "cache")),
+                             limiter=AdaptiveRateLimiter(rate=50, max_concurrency=args.workers), metrics=metrics)
+    files = sorted(glob.glob(os.path.join(conversations, "*.json")))
+    jobs, tracking, _ = plan_jobs(files, os.path.join(workdir, "batch"), {"agent": "Daniel", "customer": "Rachel"},
+                                  engine.model)
+    start = time.perf_counter()
+    results = engine.run(jobs, on_complete=lambda result: tracking[result.job][0].record(result, tracking[result.job][1]))
+    wall = time.perf_counter() - start
+    summary = metrics.summary()
+    return {
+        "lines": len(jobs),
+        "failed": sum(1 for r in results if not r.ok),
+        "wall_s": round(wall, 3),
+        "lines_per_s": round(len(jobs) / wall, 2),
+        "ttfc_p50_ms": _timing(summary, "synthesis", "ttfc"),
+        "ttfc_p95_ms": _timing(summary, "synthesis", "ttfc", "p95"),
+        "total_p95_ms": _timing(summary, "synthesis", "total", "p95"),
+    }
+
+
+def suite_playback(args, workdir):
+    """
+    Live playback into a null sink with look-ahead (needs ffmpeg).
+    """
+    from stream_conversation import LiveConversationPlayer
+
+    player = LiveConversationPlayer(null_sink=True)
+    player.engine = SynthesisEngine(generate_fn=_fake_backend(args, ms_per_char=10),
+                                    cache=AudioCache(os.path.join(workdir, "cache")),
+                                    limiter=AdaptiveRateLimiter(rate=50))
+    player.metrics = metrics = MetricsRecorder(path=None)
+    player.conversation = Conversation(Line("agent" if i % 2 == 0 else "customer", SUITE_LINES[i % len(SUITE_LINES)])
+                                       for i in range(args.playback_lines))
+    player.agent_voice, player.customer_voice = "Daniel", "Rachel"
+    with contextlib.redirect_stdout(io.StringIO()):
+        gaps = player.play_conversation(lookahead_depth=2, silence=0.1)
+    summary = metrics.summary()
+    return {
+        "lines": len(player.conversation),
+        "first_audio_p50_ms": _timing(summary, "playback", "first_audio"),
+        "first_audio_p95_ms": _timing(summary, "playback", "first_audio", "p95"),
+        "gap_max_ms": round(max(gaps.gaps) * 1000, 1) if gaps.gaps else None,
+        "underruns": summary.get("playback", {}).get("underruns", 0),
+    }
+
+
+def suite_web(args, workdir):
+    """
+    Concurrent /stream requests against the Flask app served on a local port.
+    """
+    import urllib.parse
+    import urllib.request
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import web_ui
+
+    backend = _fake_backend(args)
+    web_ui.engine = SynthesisEngine(generate_fn=backend, cache=AudioCache(os.path.join(workdir, "cache")),
+                                    limiter=AdaptiveRateLimiter(rate=50, max_concurrency=16))
+    web_ui.catalog = VoiceCatalog(os.path.join(workdir, "voices.json"), fetch_fn=backend.list_voices)
+    web_ui.hub = StreamHub()
+    web_ui.metrics = metrics = MetricsRecorder(path=None)
+    voice_ids = [voice.voice_id for voice in web_ui.catalog.all()]
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    server = make_server("127.0.0.1", 0, web_ui.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def listen(i):
+        query = urllib.parse.urlencode({"text": SUITE_LINES[i % len(SUITE_LINES)], "voice": voice_ids[i % 2]})
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/stream?{query}") as response:
+            return len(response.read())
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.listeners) as executor:
+            received = list(executor.map(listen, range(args.listeners)))
+    finally:
+        server.shutdown()
+    wall = time.perf_counter() - start
+    summary = metrics.summary()
+    return {
+        "requests": args.listeners,
+        "upstream_calls": backend.requests,
+        "bytes": sum(received),
+        "wall_s": round(wall, 3),
+        "requests_per_s": round(args.listeners / wall, 2),
+        "ttfc_p50_ms": _timing(summary, "web_stream", "ttfc"),
+        "ttfc_p95_ms": _timing(summary, "web_stream", "ttfc", "p95"),
+    }
+
+
+def suite_combine(args, workdir):
+    """
+    Combining fake-backend clips: frame concatenation, then the decode path (needs ffmpeg).
+    """
+    clips = os.path.join(workdir, "clips")
+    os.makedirs(clips)
+    backend = _fake_backend(args, latency=0, throughput=0)
+    for i in range(args.clips):
+        role = "agent" if i % 2 == 0 else "customer"
+        text = SUITE_LINES[i % len(SUITE_LINES)]
+        write_stream(backend(text, role, None), audio_filename(clips, i, role, text))
+
+    result = {"clips": args.clips}
+    for label, reencode in (("frames", False), ("decode", True)):
+        metrics = MetricsRecorder(path=None)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok = combine_audio_files(clips, os.path.join(workdir, f"combined_{label}.mp3"), 500,
+                                     reencode=reencode, jobs=os.cpu_count() or 1, metrics=metrics)
+        errors = sum(stats["errors"] for stats in metrics.summary().values())
+        if not ok or errors:
+            result[f"{label}_error"] = f"{errors} clips failed" if ok else "combine failed"
+            continue
+        result[f"{label}_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+SUITE = {"batch": suite_batch, "playback": suite_playback, "web": suite_web, "combine": suite_combine}
+
+
+def git_revision():
+    def git(*command):
+        result = subprocess.run(["git", *command], capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(git("status", "--porcelain", "--untracked-files=no"))
+    return commit + ("-dirty" if dirty else "")
+
+
+def compare_results(previous, current):
+    print(f"\nCompared with {previous['revision']} ({previous['timestamp']}):")
+    for name, metrics in current["results"].items():
+        before = previous["results"].get(name, {})
+        for key, value in metrics.items():
+            old = before.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"  {name}.{key:<20s} {old:>10} -> {value:<10} {change}")
+
+
+def bench_suite(args):
+    """
+    Runs the end-to-end scenarios against the fake backend, stores the results
+    in .benchmarks/<git revision>.json and compares them with an earlier run.
+    """
+    results = {}
+    for name in args.scenarios or SUITE:
+        workdir = tempfile.mkdtemp(prefix=f"bench_suite_{name}_")
+        try:
+            results[name] = SUITE[name](args, workdir)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"{name:<9s} " + ", ".join(f"{key}={value}" for key, value in results[name].items()))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    run = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "options": {key: value for key, value in vars(args).items() if key != "func"},
+        "results": results,
+    }
+    path = os.path.join(RESULTS_DIR, f"{run['revision']}.json")
+    previous_path = args.compare or max(
+        (p for p in glob.glob(os.path.join(RESULTS_DIR, "*.json")) if os.path.abspath(p) != os.path.abspath(path)),
+        key=os.path.getmtime, default=None)
+    with open(path, "w") as f:
+        json.dump(run, f, indent=4)
+    print(f"Results saved to {path}")
+    if previous_path:
+        if not previous_path.endswith(".json"):
+            previous_path = os.path.join(RESULTS_DIR, f"{previous_path}.json")
+        with open(previous_path) as f:
+            compare_results(json.load(f), run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the conversation tools")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    synthesis = subparsers.add_parser("synthesis", help="Concurrent line synthesis vs. one line at a time")
+    synthesis.add_argument("--lines", type=int, default=50, help="Number of conversation lines")
+    synthesis.add_argument("--workers", type=int, default=8, help="Worker count for the concurrent run")
+    synthesis.add_argument("--latency", type=float, default=0.3, help="Fake time-to-first-byte in seconds")
+    synthesis.set_defaults(func=bench_synthesis)
+
+    playback = subparsers.add_parser("playback", help="Time-to-first-audio of streaming playback (needs ffmpeg)")
+    playback.add_argument("--seconds", type=int, default=5, help="Length of the synthetic utterance")
+    playback.add_argument("--chunk_size", type=int, default=2048, help="Bytes per network chunk")
+    playback.add_argument("--chunk_delay", type=float, default=0.02, help="Delay between chunks in seconds")
+    playback.add_argument("--latency", type=float, default=0.2, help="Fake time-to-first-byte in seconds")
+    playback.set_defaults(func=bench_playback)
+
+    prefetch = subparsers.add_parser("prefetch", help="Turn-to-turn gaps with and without look-ahead (needs ffmpeg)")
+    prefetch.add_argument("--lines", type=int, default=6, help="Number of conversation lines")
+    prefetch.add_argument("--seconds", type=int, default=1, help="Length of each synthetic line")
+    prefetch.add_argument("--depth", type=int, default=2, help="Look-ahead depth to compare against 0")
+    prefetch.add_argument("--latency", type=float, default=0.5, help="Fake time-to-first-byte in seconds")
+    prefetch.add_argument("--silence", type=int, default=100, help="Silence between lines in milliseconds")
+    prefetch.set_defaults(func=bench_prefetch)
+
+    writer = subparsers.add_parser("writer", help="Chunk collection: bytes concatenation vs. streaming writer")
+    writer.add_argument("--megabytes", type=int, default=8, help="Size of the synthetic stream")
+    writer.add_argument("--chunk_size", type=int, default=2048, help="Bytes per chunk")
+    writer.set_defaults(func=bench_writer)
+
+    combine = subparsers.add_parser("combine", help="Combining a synthetic corpus with 1..N decode jobs (needs ffmpeg)")
+    combine.add_argument("--clips", type=int, default=200, help="Number of synthetic clips")
+    combine.add_argument("--seconds", type=int, default=3, help="Length of each clip")
+    combine.add_argument("--max_jobs", type=int, default=os.cpu_count() or 1, help="Largest job count to try")
+    combine.set_defaults(func=bench_combine)
+
+    pcm = subparsers.add_parser("pcm", help="CPU per minute of audio, MP3 vs. PCM responses (needs ffmpeg)")
+    pcm.add_argument("--clips", type=int, default=20, help="Number of clips")
+    pcm.add_argument("--seconds", type=float, default=6, help="Length of each clip in seconds")
+    pcm.set_defaults(func=bench_pcm)
+
+    ratelimit = subparsers.add_parser("ratelimit", help="Adaptive rate limiting against a fake endpoint that injects 429s")
+    ratelimit.add_argument("--lines", type=int, default=60, help="Number of conversation lines")
+    ratelimit.add_argument("--workers", type=int, default=12, help="Worker threads")
+    ratelimit.add_argument("--max_concurrent", type=int, default=3, help="Streams the fake endpoint allows at once")
+    ratelimit.add_argument("--max_rate", type=float, default=10.0, help="Requests per second the fake endpoint allows")
+    ratelimit.set_defaults(func=bench_ratelimit)
+
+    stream = subparsers.add_parser("stream", help="Concurrent /stream listeners with and without request coalescing")
+    stream.add_argument("--listeners", type=int, default=200, help="Concurrent listeners")
+    stream.add_argument("--distinct", type=int, default=5, help="Distinct lines they request")
+    stream.add_argument("--stagger", type=float, default=0.5, help="Listeners arrive within this many seconds")
+    stream.add_argument("--chunks", type=int, default=40, help="Chunks per utterance")
+    stream.add_argument("--latency", type=float, default=0.3, help="Fake time-to-first-byte in seconds")
+    stream.set_defaults(func=bench_stream)
+
+    segments = subparsers.add_parser("segments", help="First audio for long lines, whole vs. sentence segments")
+    segments.add_argument("--repeat", type=int, default=2, help="How many copies of the long sample line to join")
+    segments.add_argument("--segment_chars", type=int, default=DEFAULT_SEGMENT_CHARS, help="Segment size limit")
+    segments.add_argument("--latency", type=float, default=0.2, help="Fake fixed time-to-first-byte in seconds")
+    segments.add_argument("--ms_per_char", type=float, default=3.0, help="Fake extra latency per character")
+    segments.set_defaults(func=bench_segments)
+
+    suite = subparsers.add_parser("suite", help="End-to-end scenarios on the fake backend, stored in .benchmarks/")
+    suite.add_argument("scenarios", nargs="*", choices=[[]] + list(SUITE), help="Scenarios to run (default: all)")
+    suite.add_argument("--compare", help="Revision or results file to compare with (default: the latest other run)")
+    suite.add_argument("--conversations", type=int, default=5, help="Conversation files for the batch scenario")
+    suite.add_argument("--lines", type=int, default=10, help="Lines per conversation in the batch scenario")
+    suite.add_argument("--workers", type=int, default=8, help="Workers for the batch scenario")
+    suite.add_argument("--error_rate", type=float, default=0.05, help="Injected failure rate for the batch scenario")
+    suite.add_argument("--playback_lines", type=int, default=4, help="Lines in the playback scenario")
+    suite.add_argument("--listeners", type=int, default=32, help="Concurrent requests in the web scenario")
+    suite.add_argument("--clips", type=int, default=40, help="Clips in the combine scenario")
+    suite.add_argument("--latency", type=float, default=0.2, help="Fake time-to-first-byte in seconds")
+    suite.add_argument("--throughput", type=float, default=64000, help="Fake stream rate in bytes per second")
+    suite.add_argument("--seed", type=int, default=0, help="Seed for injected failures")
+    suite.set_defaults(func=bench_suite)
+
+    http = subparsers.add_parser("http", help="Per-call connections vs. the pooled keep-alive session, over local TLS")
+    http.add_argument("--lines", type=int, default=100, help="Synthesis requests")
+    http.add_argument("--workers", type=int, default=4, help="Requests in flight at once (and pool size)")
+    http.add_argument("--rtt", type=float, default=20.0, help="Simulated network round trip in milliseconds")
+    http.set_defaults(func=bench_http)
+
+    startup = subparsers.add_parser("startup", help="Import time of each entry point against its budget")
+    startup.add_argument("modules", nargs="*", help="Modules to measure (default: all entry points)")
+    startup.add_argument("--runs", type=int, default=3, help="Runs per module; the fastest one counts")
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
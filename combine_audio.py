@@ -1,84 +1,632 @@
+import io
 import os
 import glob
-from pydub import AudioSegment
+import json
+import mmap
+import time
+import shutil
+import contextlib
+import subprocess
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import argparse
+from audio_writer import AtomicFileWriter, temp_path_for
+from metrics import get_default_metrics, print_metrics_summary
+from mp3_frames import id3v2_size, iter_frames, iter_frames_prefix, read_first_header, silent_frames
+from pcm_audio import PCM_CHANNELS, PCM_SAMPLE_WIDTH, pcm_rate, read_wav
+from segment_store import SegmentStore, read_segment
 
-def combine_audio_files(input_dir="audio_output", output_file="combined_conversation.mp3", silence_duration=1000):
+# Sidecar next to a frame-concatenated output describing where each clip ended up in it
+PARTS_SUFFIX = ".parts.json"
+
+
+class StoredClip(namedtuple("StoredClip", ["data_path", "segment"])):
+    """
+    A line in a segment store. Accepted wherever the combiner takes a clip
+    path, and cheap to send to a decode worker.
+    """
+
+    def __str__(self):
+        return f"line {self.segment.line} ({self.segment.role})"
+
+
+def clip_name(clip):
+    return str(clip) if isinstance(clip, StoredClip) else os.path.basename(clip)
+
+
+def is_pcm_clip(clip):
+    """True for clips that are PCM already: WAV files and stored pcm_* segments."""
+    if isinstance(clip, StoredClip):
+        return clip.segment.pcm
+    return clip.lower().endswith(".wav")
+
+
+def clip_data(clip):
+    if isinstance(clip, StoredClip):
+        return read_segment(clip.data_path, clip.segment)
+    with open(clip, "rb") as f:
+        return f.read()
+
+
+@contextlib.contextmanager
+def mapped_clip(clip):
+    """
+    Like clip_data, but a stored clip's mapping of the store is closed again
+    when the block ends, instead of whenever the view is garbage collected.
+    """
+    if not isinstance(clip, StoredClip):
+        yield clip_data(clip)
+        return
+    segment = clip.segment
+    with open(clip.data_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        with memoryview(data) as view, view[segment.offset:segment.offset + segment.length] as clip_view:
+            yield clip_view
+
+
+def first_header(clip):
+    """Header of the first MP3 frame of a clip, or None."""
+    if not isinstance(clip, StoredClip):
+        return read_first_header(clip)
+    data = clip_data(clip)
+    for header, _ in iter_frames_prefix(data, id3v2_size(data)):
+        return header
+    return None
+
+
+def read_pcm_clip(clip):
+    """
+    (rate, channels, sample_width, memoryview of the samples) of a PCM clip.
+    """
+    if isinstance(clip, StoredClip):
+        return pcm_rate(clip.segment.format), PCM_CHANNELS, PCM_SAMPLE_WIDTH, clip_data(clip)
+    return read_wav(clip)
+
+
+def numeric_prefix(path):
+    """
+    Sort key for generated clips: the line number before the first underscore.
+    """
+    return int(os.path.basename(path).split('_')[0])
+
+
+def probe_format(mp3_files, silence_duration):
+    """
+    Works out the PCM format of the combined audio without decoding anything
+    (PCM clips contribute their own format).
+    
+    Mirrors pydub's `+=`, which converts both sides to the highest frame rate,
+    channel count and sample width involved (including the 11025 Hz silence).
+    """
+    from pydub import AudioSegment
+    from pydub.utils import mediainfo
+
+    frame_rate, channels = 1, 1
+    if len(mp3_files) > 1 and silence_duration > 0:
+        frame_rate = AudioSegment.silent(duration=silence_duration).frame_rate
+    for mp3_file in mp3_files:
+        try:
+            header = None if is_pcm_clip(mp3_file) else first_header(mp3_file)
+            if header:
+                file_rate, file_channels = header.sample_rate, header.channels
+            elif is_pcm_clip(mp3_file):
+                file_rate, file_channels, _, _ = read_pcm_clip(mp3_file)
+            else:
+                info = mediainfo(mp3_file)
+                file_rate, file_channels = int(info.get("sample_rate", 0)), int(info.get("channels", 0))
+            frame_rate = max(frame_rate, file_rate)
+            channels = max(channels, file_channels)
+        except (OSError, ValueError):
+            # Unreadable files are reported and skipped when they are decoded
+            pass
+    return frame_rate, channels, PCM_SAMPLE_WIDTH
+
+
+class PcmEncoder:
+    """
+    Streams raw PCM into a single ffmpeg MP3 encoder process.
+    
+    This runs the same encode as `AudioSegment.export(format="mp3")`, but
+    reads its input from a pipe, so the decoded audio never has to be held in
+    memory. The output is written to a temp file and renamed into place
+    when the encoder has finished cleanly.
+    """
+    
+    def __init__(self, output_file, frame_rate, channels, sample_width=PCM_SAMPLE_WIDTH):
+        if not shutil.which("ffmpeg"):
+            raise RuntimeError("ffmpeg not found. It is required to encode the combined audio.")
+        self.output_file = output_file
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.bytes_written = 0
+        # Time spent blocked on the encoder, i.e. roughly the encode time
+        self.encode_time = 0.0
+        self.temp_path = temp_path_for(output_file)
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+             "-f", f"s{sample_width * 8}le", "-ar", str(frame_rate), "-ac", str(channels), "-i", "pipe:0",
+             "-f", "mp3", self.temp_path],
+            stdin=subprocess.PIPE,
+        )
+    
+    @property
+    def duration(self):
+        """Seconds of audio written so far."""
+        return self.bytes_written / (self.frame_rate * self.channels * self.sample_width)
+    
+    def write(self, pcm):
+        start = time.perf_counter()
+        self.process.stdin.write(pcm)
+        self.encode_time += time.perf_counter() - start
+        self.bytes_written += len(pcm)
+    
+    def close(self):
+        start = time.perf_counter()
+        self.process.stdin.close()
+        returncode = self.process.wait()
+        self.encode_time += time.perf_counter() - start
+        if returncode != 0:
+            self.abort()
+            raise RuntimeError(f"ffmpeg exited with status {self.process.returncode}")
+        os.replace(self.temp_path, self.output_file)
+    
+    def abort(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class Crossfader:
+    """
+    Joins consecutive pieces of raw PCM with a crossfade, as a stream.
+    
+    Each piece fades in over the last `crossfade_ms` of what came before,
+    which fades out, the same way pydub's `append(..., crossfade=...)`
+    overlaps two segments. Only that tail is held back in memory; everything
+    before it is returned for writing as soon as it is final.
+    """
+    
+    def __init__(self, frame_rate, channels, sample_width, crossfade_ms):
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.crossfade_ms = crossfade_ms
+        self.tail_bytes = int(frame_rate * crossfade_ms / 1000) * channels * sample_width
+        self._tail = b""
+    
+    def _segment(self, pcm):
+        from pydub import AudioSegment
+        return AudioSegment(data=bytes(pcm), sample_width=self.sample_width, frame_rate=self.frame_rate,
+                            channels=self.channels)
+    
+    def push(self, pcm):
+        """
+        Adds the next piece and returns the PCM that is ready to be written.
+        """
+        if self._tail and pcm:
+            before, after = self._segment(self._tail), self._segment(pcm)
+            # Short pieces get a shorter crossfade; pydub wants it in whole milliseconds
+            overlap = min(self.crossfade_ms, len(before), len(after))
+            pcm = before.append(after, crossfade=overlap).raw_data
+        else:
+            pcm = self._tail + pcm
+        split = max(0, len(pcm) - self.tail_bytes)
+        self._tail = pcm[split:]
+        return pcm[:split]
+    
+    def flush(self):
+        """
+        Returns the held-back tail once there are no more pieces.
+        """
+        tail, self._tail = self._tail, b""
+        return tail
+
+
+def common_frame_format(mp3_files):
+    """
+    Returns the first frame header shared by all files if they have the same
+    MPEG version, sample rate, channel count and bitrate, otherwise None.
+    """
+    first = None
+    for mp3_file in mp3_files:
+        try:
+            header = first_header(mp3_file)
+        except OSError:
+            return None
+        if header is None or (first and header.stream_format != first.stream_format):
+            return None
+        first = first or header
+    return first
+
+
+def clip_id(clip):
+    """
+    Identifies the content of a clip across runs without reading it: the
+    content hash of a stored segment, or size, mtime and inode of a file
+    (all of which survive the renames of an incremental re-run).
+    """
+    if isinstance(clip, StoredClip):
+        segment = clip.segment
+        return segment.hash or f"{os.path.basename(clip.data_path)}:{segment.offset}:{segment.length}"
+    st = os.stat(clip)
+    return f"{st.st_size}:{st.st_mtime_ns}:{st.st_ino}"
+
+
+def load_parts(output_file, header, silence_duration):
     """
-    Combines all MP3 files in the input directory into a single MP3 file.
+    The parts sidecar of a previous frame concatenation into `output_file`,
+    or None if there is none or it doesn't describe the file as it is now.
+    """
+    try:
+        with open(output_file + PARTS_SUFFIX, "r") as f:
+            parts = json.load(f)
+        st = os.stat(output_file)
+    except (OSError, ValueError):
+        return None
+    if (parts.get("format") != list(header.stream_format) or parts.get("silence") != silence_duration
+            or parts.get("size") != st.st_size or parts.get("mtime_ns") != st.st_mtime_ns):
+        return None
+    return parts
+
+
+def save_parts(output_file, header, silence_duration, clips):
+    st = os.stat(output_file)
+    parts = {"format": list(header.stream_format), "silence": silence_duration,
+             "size": st.st_size, "mtime_ns": st.st_mtime_ns, "clips": clips}
+    with AtomicFileWriter(output_file + PARTS_SUFFIX) as writer:
+        writer.write(json.dumps(parts).encode("utf-8"))
+
+
+def write_clip_frames(writer, mp3_file, header):
+    """
+    Copies the MP3 frames of one clip to `writer`.
+    
+    Returns:
+        tuple: (bytes written, frames written)
+    """
+    length = frames = 0
+    with mapped_clip(mp3_file) as data, memoryview(data) as view:
+        for frame, offset in iter_frames(data):
+            if frame.stream_format != header.stream_format:
+                raise ValueError(f"{mp3_file} changes format mid-stream")
+            writer.write(view[offset:offset + frame.frame_length])
+            length += frame.frame_length
+            frames += 1
+    return length, frames
+
+
+def concatenate_frames(mp3_files, output_file, silence_duration, header, incremental=True):
+    """
+    Lossless fast path: copies the MP3 frames of every file into the output
+    and inserts pre-encoded silent frames between files. ID3 tags and
+    Xing/Info headers are dropped. Nothing is decoded or re-encoded.
+    
+    With `incremental`, a sidecar (`<output_file>.parts.json`) records where
+    each clip went. When the script was edited and only some lines were
+    re-synthesized, the next run copies unchanged clips straight out of the
+    previous output instead of parsing them again. If only the end changed,
+    the unchanged prefix is copied over in one piece. The new output is
+    written to a temp file and renamed over the old one before the sidecar
+    is saved, so a crash never leaves a sidecar next to a partial file.
+    
+    Returns:
+        tuple: (duration of the combined audio in seconds, number of clips reused from the previous output)
+    
+    Raises:
+        ValueError: if a file turns out not to be a clean, matching MP3 stream
+    """
+    silence = silent_frames(header, silence_duration)
+    silence_count = len(silence) // header.frame_length if silence else 0
+    previous = load_parts(output_file, header, silence_duration) if incremental else None
+    old = previous["clips"] if previous else []
+    ids = [clip_id(mp3_file) for mp3_file in mp3_files]
+    reusable = {part["id"]: part for part in old}
+    
+    prefix = 0
+    while prefix < min(len(ids), len(old)) and ids[prefix] == old[prefix]["id"]:
+        prefix += 1
+    # Nothing after the shared prefix is in the old output: copy that prefix in one piece
+    keep_prefix = prefix > 0 and not any(clip in reusable for clip in ids[prefix:])
+    
+    # Until the new sidecar is written the old one no longer describes the output
+    if previous:
+        os.remove(output_file + PARTS_SUFFIX)
+    
+    with contextlib.ExitStack() as stack:
+        source = None
+        if keep_prefix or any(clip in reusable for clip in ids):
+            f = stack.enter_context(open(output_file, "rb"))
+            source = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        # Renamed over the old output on success, before the mapping of the old file is closed
+        writer = stack.enter_context(AtomicFileWriter(output_file))
+        parts, position = [], 0
+        if keep_prefix:
+            parts = old[:prefix]
+            position = parts[-1]["offset"] + parts[-1]["length"]
+            with memoryview(source) as view:
+                writer.write(view[:position])
+            print(f"Keeping the first {prefix} clips of {output_file}.")
+        reused = len(parts)
+        
+        for i in range(len(parts), len(mp3_files)):
+            # Add silence if this isn't the first file
+            if i > 0:
+                writer.write(silence)
+                position += len(silence)
+            
+            part = reusable.get(ids[i]) if source is not None else None
+            if part:
+                with memoryview(source) as view:
+                    writer.write(view[part["offset"]:part["offset"] + part["length"]])
+                length, frames = part["length"], part["frames"]
+                reused += 1
+            else:
+                print(f"Adding file {i+1}/{len(mp3_files)}: {clip_name(mp3_files[i])}")
+                length, frames = write_clip_frames(writer, mp3_files[i], header)
+            parts.append({"id": ids[i], "offset": position, "length": length, "frames": frames})
+            position += length
+    
+    if incremental:
+        save_parts(output_file, header, silence_duration, parts)
+    frame_count = sum(part["frames"] for part in parts) + silence_count * (len(parts) - 1)
+    return frame_count * header.samples_per_frame / header.sample_rate, reused
+
+
+def decode_clip(mp3_file, frame_rate, channels, sample_width):
+    """
+    Decodes one MP3 file to raw PCM in the output format. Runs in a worker process.
+    """
+    from pydub import AudioSegment
+
+    if isinstance(mp3_file, StoredClip):
+        audio = AudioSegment.from_file(io.BytesIO(clip_data(mp3_file)), format="mp3")
+    else:
+        audio = AudioSegment.from_mp3(mp3_file)
+    return (audio.set_channels(channels)
+                 .set_frame_rate(frame_rate)
+                 .set_sample_width(sample_width)
+                 .raw_data)
+
+
+def load_pcm_clip(clip, frame_rate, channels, sample_width):
+    """
+    PCM of a WAV clip or stored PCM segment (saved from a pcm_* output
+    format) in the output format.
+    
+    When the clip already is in the output format, which is the usual case,
+    this is a memoryview of the memory-mapped file: nothing is decoded or
+    copied before the samples are handed to the encoder.
+    """
+    rate, clip_channels, clip_width, pcm = read_pcm_clip(clip)
+    if (rate, clip_channels, clip_width) == (frame_rate, channels, sample_width):
+        return pcm
+    from pydub import AudioSegment
+    audio = AudioSegment(data=bytes(pcm), sample_width=clip_width, frame_rate=rate, channels=clip_channels)
+    return (audio.set_channels(channels)
+                 .set_frame_rate(frame_rate)
+                 .set_sample_width(sample_width)
+                 .raw_data)
+
+
+def timed_decode_clip(mp3_file, frame_rate, channels, sample_width):
+    """
+    decode_clip (or load_pcm_clip), also returning how long the decode took in the worker.
+    """
+    start = time.perf_counter()
+    load = load_pcm_clip if is_pcm_clip(mp3_file) else decode_clip
+    pcm = load(mp3_file, frame_rate, channels, sample_width)
+    return pcm, time.perf_counter() - start
+
+
+def decode_in_order(mp3_files, frame_rate, channels, sample_width, jobs):
+    """
+    Yields (mp3_file, pcm, error, decode_seconds) in the original order while up to `jobs`
+    processes decode ahead. At most 2 * jobs decoded clips are held at once,
+    so memory stays bounded however many files there are. PCM clips need no
+    decoding and are loaded in this process, so their samples aren't copied
+    back from a worker.
+    """
+    if jobs <= 1:
+        for mp3_file in mp3_files:
+            try:
+                pcm, seconds = timed_decode_clip(mp3_file, frame_rate, channels, sample_width)
+            except Exception as e:
+                yield mp3_file, None, e, None
+            else:
+                yield mp3_file, pcm, None, seconds
+        return
+    
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        files = iter(mp3_files)
+        while True:
+            while len(pending) < jobs * 2:
+                mp3_file = next(files, None)
+                if mp3_file is None:
+                    break
+                future = None if is_pcm_clip(mp3_file) else executor.submit(
+                    timed_decode_clip, mp3_file, frame_rate, channels, sample_width)
+                pending.append((mp3_file, future))
+            if not pending:
+                return
+            mp3_file, future = pending.popleft()
+            try:
+                if future is None:
+                    pcm, seconds = timed_decode_clip(mp3_file, frame_rate, channels, sample_width)
+                else:
+                    pcm, seconds = future.result()
+            except Exception as e:
+                yield mp3_file, None, e, None
+            else:
+                yield mp3_file, pcm, None, seconds
+
+
+def combine_audio_files(input_dir="audio_output", output_file="combined_conversation.mp3", silence_duration=1000,
+                        reencode=False, jobs=1, crossfade=0, metrics=None, incremental=True):
+    """
+    Combines all MP3 (and WAV) files in the input directory into a single MP3 file.
     Files are combined in order based on their filename prefix (assumed to be numerical).
     
+    When all files share the same sample rate, channel layout and bitrate,
+    their MP3 frames are concatenated directly (no quality loss, no ffmpeg),
+    and after an incremental re-synthesis only the changed clips are read
+    again (see concatenate_frames).
+    Otherwise files are decoded one at a time and their PCM is streamed into a
+    single encoder, so memory use stays flat no matter how long the conversation is.
+    WAV files (lines synthesized in a pcm_* format) are not decoded at all:
+    their samples go to the encoder as they are, so the conversation is
+    encoded to MP3 exactly once.
+    
+    If the directory holds a segment store (see segment_store), its lines
+    are combined in line order, sliced from the mapped store instead of
+    read from separate files.
+    
     Args:
-        input_dir (str): Directory containing MP3 files to combine
+        input_dir (str): Directory containing MP3 files or a segment store to combine
         output_file (str): Path to save the combined audio file
         silence_duration (int): Duration of silence between clips in milliseconds
+        reencode (bool): Always decode and re-encode, even if the fast path is possible
+        jobs (int): Number of processes decoding files in parallel on the decode path
+        crossfade (int): Milliseconds over which each clip (and silence) fades into the
+            next one. Clips are whole lines; the segments inside a line were
+            already joined when it was synthesized. Needs the decode path.
+        metrics (MetricsRecorder): Optional recorder for per-clip decode/encode times
+        incremental (bool): Reuse unchanged clips of the previous output on the frame path
     """
     if not os.path.exists(input_dir):
         print(f"Error: Input directory '{input_dir}' does not exist.")
         return False
     
-    # Get all MP3 files in the directory
-    mp3_files = glob.glob(os.path.join(input_dir, "*.mp3"))
+    if SegmentStore.exists(input_dir):
+        # The index already knows every line and its order; no globbing or filename parsing
+        store = SegmentStore(input_dir)
+        mp3_files = [StoredClip(store.data_path, segment) for segment in store.segments()]
+        source = "segments in the segment store"
+    else:
+        # Get all MP3 and WAV files in the directory, sorted by their numerical prefix
+        mp3_files = glob.glob(os.path.join(input_dir, "*.mp3")) + glob.glob(os.path.join(input_dir, "*.wav"))
+        mp3_files.sort(key=numeric_prefix)
+        source = "audio files"
     
     if not mp3_files:
-        print(f"Error: No MP3 files found in '{input_dir}'.")
+        print(f"Error: No MP3 or WAV files found in '{input_dir}'.")
         return False
     
-    # Sort files by their numerical prefix
-    mp3_files.sort(key=lambda x: int(os.path.basename(x).split('_')[0]))
+    print(f"Found {len(mp3_files)} {source} to combine.")
+    started = time.perf_counter()
     
-    print(f"Found {len(mp3_files)} audio files to combine.")
+    wav_files = sum(1 for f in mp3_files if is_pcm_clip(f))
+    header = None if reencode or crossfade > 0 or wav_files else common_frame_format(mp3_files)
+    if header:
+        print(f"All files are {header.bitrate} kbps / {header.sample_rate} Hz MP3, concatenating frames without re-encoding.")
+        try:
+            duration, reused = concatenate_frames(mp3_files, output_file, silence_duration, header, incremental)
+            if metrics:
+                metrics.record("combine_total", ok=True, path="frames", files=len(mp3_files), reused=reused,
+                               total=time.perf_counter() - started, bytes=os.path.getsize(output_file))
+            if reused:
+                print(f"Reused {reused} unchanged clips from the previous output.")
+            print(f"\nSuccessfully combined audio files into: {output_file}")
+            print(f"Total duration: {duration:.2f} seconds")
+            return True
+        except (OSError, ValueError) as e:
+            print(f"Frame concatenation failed ({e}), falling back to decoding.")
     
-    # Create silence segment
-    silence = AudioSegment.silent(duration=silence_duration)
+    try:
+        frame_rate, channels, sample_width = probe_format(mp3_files, silence_duration)
+        encoder = PcmEncoder(output_file, frame_rate, channels, sample_width)
+    except Exception as e:
+        print(f"Error exporting combined audio: {e}")
+        return False
     
-    # Start with an empty audio segment
-    combined = AudioSegment.empty()
+    # Create silence segment, already in the output format
+    from pydub import AudioSegment
+    silence = (AudioSegment.silent(duration=silence_duration)
+               .set_channels(channels).set_frame_rate(frame_rate).set_sample_width(sample_width)
+               .raw_data)
+    
+    # With a crossfade, each piece is mixed into the held-back tail of the one before
+    fader = Crossfader(frame_rate, channels, sample_width, crossfade) if crossfade > 0 else None
+    write = (lambda pcm: encoder.write(fader.push(pcm))) if fader else encoder.write
     
     # Add each audio file with silence in between
-    for i, mp3_file in enumerate(mp3_files):
-        print(f"Adding file {i+1}/{len(mp3_files)}: {os.path.basename(mp3_file)}")
-        
-        # Load the audio file
-        try:
-            audio = AudioSegment.from_mp3(mp3_file)
+    if wav_files:
+        print(f"{wav_files} PCM clips are passed to the encoder without decoding.")
+    if jobs > 1 and wav_files < len(mp3_files):
+        print(f"Decoding with {jobs} parallel jobs.")
+    try:
+        decoded = decode_in_order(mp3_files, frame_rate, channels, sample_width, jobs)
+        for i, (mp3_file, pcm, error, decode_time) in enumerate(decoded):
+            print(f"Adding file {i+1}/{len(mp3_files)}: {clip_name(mp3_file)}")
             
+            if error:
+                print(f"Error processing file {mp3_file}: {error}")
+                print("Skipping this file and continuing...")
+                if metrics:
+                    metrics.record("combine", file=clip_name(mp3_file), ok=False)
+                continue
+            
+            encode_before = encoder.encode_time
             # Add silence if this isn't the first file
-            if i > 0:
-                combined += silence
+            if i > 0 and silence:
+                write(silence)
             
             # Add the audio
-            combined += audio
-            
-        except Exception as e:
-            print(f"Error processing file {mp3_file}: {e}")
-            print("Skipping this file and continuing...")
+            write(pcm)
+            if metrics:
+                metrics.record("combine", file=clip_name(mp3_file), ok=True, decode=decode_time,
+                               encode=encoder.encode_time - encode_before, bytes=len(pcm))
+        if fader:
+            encoder.write(fader.flush())
+    except BaseException:
+        encoder.abort()
+        raise
     
-    # Export the combined audio
+    # Finish the export
     try:
-        combined.export(output_file, format="mp3")
+        encoder.close()
+        if metrics:
+            metrics.record("combine_total", ok=True, path="pcm" if wav_files == len(mp3_files) else "decode",
+                           files=len(mp3_files),
+                           total=time.perf_counter() - started, encode=encoder.encode_time,
+                           bytes=os.path.getsize(output_file))
         print(f"\nSuccessfully combined audio files into: {output_file}")
-        print(f"Total duration: {len(combined) / 1000:.2f} seconds")
+        print(f"Total duration: {encoder.duration:.2f} seconds")
         return True
     except Exception as e:
         print(f"Error exporting combined audio: {e}")
         return False
 
 def main():
-    parser = argparse.ArgumentParser(description="Combine multiple MP3 files into a single conversation audio file")
-    parser.add_argument("--input_dir", default="audio_output", help="Directory containing MP3 files to combine")
+    parser = argparse.ArgumentParser(description="Combine multiple MP3 or WAV files into a single conversation audio file")
+    parser.add_argument("--input_dir", default="audio_output",
+                        help="Directory containing MP3 or WAV files (or a segment store) to combine")
     parser.add_argument("--output_file", default="combined_conversation.mp3", help="Output file path")
     parser.add_argument("--silence", type=int, default=1000, help="Silence duration between clips in milliseconds")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Number of processes decoding files in parallel (default: all cores)")
+    parser.add_argument("--reencode", action="store_true",
+                        help="Always decode and re-encode instead of concatenating MP3 frames")
+    parser.add_argument("--crossfade", type=int, default=0,
+                        help="Crossfade between clips in milliseconds (implies --reencode)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Don't reuse unchanged clips from a previous output; rebuild it from scratch")
     
     args = parser.parse_args()
     
     print("Audio Combiner for ElevenLabs Conversation Generator")
     print("==================================================")
     
-    if combine_audio_files(args.input_dir, args.output_file, args.silence):
+    if combine_audio_files(args.input_dir, args.output_file, args.silence, args.reencode, args.jobs,
+                           args.crossfade, get_default_metrics(), not args.rebuild):
         print("Audio combination completed successfully!")
+        print_metrics_summary(get_default_metrics())
     else:
         print("Audio combination failed.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
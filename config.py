@@ -0,0 +1,57 @@
+import os
+import threading
+
+_lock = threading.Lock()
+_dotenv_loaded = False
+_registered = False
+
+
+def load_api_key():
+    """
+    ELEVENLABS_API_KEY from the environment or `.env`, or None.
+    Cheap: does not import the ElevenLabs SDK.
+    """
+    global _dotenv_loaded
+    with _lock:
+        if not _dotenv_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _dotenv_loaded = True
+    return os.getenv("ELEVENLABS_API_KEY")
+
+
+def ensure_api_key():
+    """
+    Registers the API key with the SDK the first time something actually
+    calls the API. Later calls return at once.
+
+    Raises:
+        RuntimeError: if no API key is configured
+    """
+    global _registered
+    api_key = load_api_key()
+    if not api_key:
+        raise RuntimeError("ELEVENLABS_API_KEY not set")
+    with _lock:
+        if not _registered:
+            from elevenlabs import set_api_key
+            set_api_key(api_key)
+            _registered = True
+    return api_key
+
+
+def require_api_key():
+    """
+    Startup check for command line entry points: prints setup instructions
+    and exits if the key is missing. The SDK itself is still only imported
+    on first use. Backends that don't call the API need no key.
+    """
+    from tts_backend import get_default_backend
+    if not get_default_backend().needs_api_key:
+        return None
+    api_key = load_api_key()
+    if not api_key:
+        print("Error: API key not found. Please add your ElevenLabs API key to a .env file.")
+        print("ELEVENLABS_API_KEY=your_api_key_here")
+        exit(1)
+    return api_key
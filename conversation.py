@@ -0,0 +1,261 @@
+"""
+Conversation scripts: the shared in-memory model and a streaming loader.
+
+A script is a sequence of turns, each a role ("agent", "customer", ...)
+and the text it speaks. Files are either a JSON array of
+{"role", "text"} objects (what the tools have always saved) or JSON Lines
+with one such object per line, which is easier to produce and append to
+for large generated corpora.
+
+`iter_lines` parses either format incrementally and yields each turn as
+soon as it has been read, so synthesis can start on the first lines of a
+multi-gigabyte file while the rest is still being parsed. `Conversation`
+keeps a whole script in memory as two columns (role codes and texts)
+instead of one dict per turn; `Line` objects are only created when a turn
+is accessed.
+"""
+import re
+import sys
+import json
+from array import array
+
+DEFAULT_FILENAME = "conversation.json"
+READ_CHUNK_SIZE = 1 << 16
+# A JSON array element that is still incomplete after this many characters is treated as malformed
+MAX_TURN_CHARS = 1 << 24
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+class ConversationFormatError(ValueError):
+    """A conversation file that isn't a JSON array or JSON Lines of {"role", "text"} objects."""
+
+
+class Line:
+    """
+    One turn of a conversation. Also readable as line["role"] / line["text"],
+    like the dicts scripts used to be loaded into.
+    """
+
+    __slots__ = ("role", "text")
+
+    def __init__(self, role, text):
+        self.role = role
+        self.text = text
+
+    def __getitem__(self, key):
+        if key in Line.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def to_dict(self):
+        return {"role": self.role, "text": self.text}
+
+    def __eq__(self, other):
+        return isinstance(other, Line) and self.role == other.role and self.text == other.text
+
+    def __repr__(self):
+        return f"Line({self.role!r}, {self.text!r})"
+
+
+def as_line(item, number=None, kind="line"):
+    """
+    A Line from a parsed {"role", "text"} object (or a Line). Roles are
+    interned, so a million turns share a handful of role strings.
+
+    Raises:
+        ConversationFormatError: if `item` isn't a turn; the message names it as "{kind} {number}"
+    """
+    if isinstance(item, Line):
+        return item
+    if not isinstance(item, dict) or not isinstance(item.get("role"), str) or not isinstance(item.get("text"), str):
+        raise ConversationFormatError(f"{kind} {number}: expected an object with a string 'role' and 'text'")
+    return Line(sys.intern(item["role"]), item["text"])
+
+
+class Conversation:
+    """
+    A script held as columns: one small integer per turn for its role and
+    the text strings, in order. Indexing and iterating yield Lines.
+
+    Args:
+        lines (iterable): Lines or {"role", "text"} dicts to start with
+    """
+
+    def __init__(self, lines=()):
+        self.roles = []
+        self._role_codes = {}
+        self._codes = array("I")
+        self._texts = []
+        self.extend(lines)
+
+    def append(self, role, text):
+        code = self._role_codes.get(role)
+        if code is None:
+            code = self._role_codes[role] = len(self.roles)
+            self.roles.append(sys.intern(role))
+        self._codes.append(code)
+        self._texts.append(text)
+
+    def extend(self, lines):
+        for number, line in enumerate(lines, len(self) + 1):
+            if not isinstance(line, Line):
+                line = as_line(line, number)
+            self.append(line.role, line.text)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def __getitem__(self, index):
+        return Line(self.roles[self._codes[index]], self._texts[index])
+
+    def __iter__(self):
+        roles = self.roles
+        for code, text in zip(self._codes, self._texts):
+            yield Line(roles[code], text)
+
+    def to_dicts(self):
+        return [line.to_dict() for line in self]
+
+
+class ConversationFile:
+    """
+    A conversation file read lazily: every iteration parses the file again
+    with `iter_lines`, so nothing but the turn at hand is held in memory.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __iter__(self):
+        return iter_lines(self.filename)
+
+
+def _iter_array(f, buffer, chunk_size):
+    """Items of the JSON array starting at buffer[0] ("["), decoded one at a time."""
+    decoder = json.JSONDecoder()
+    pos, count, expect_item = 1, 0, True
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos == len(buffer):
+            more = f.read(chunk_size)
+            if not more:
+                raise ConversationFormatError(f"unexpected end of file after {count} turns")
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        char = buffer[pos]
+        if char == "]" and (not expect_item or count == 0):
+            if _WHITESPACE.match(buffer, pos + 1).end() < len(buffer) or f.read(chunk_size).strip():
+                raise ConversationFormatError("unexpected data after the conversation array")
+            return
+        if not expect_item:
+            if char != ",":
+                raise ConversationFormatError(f"expected ',' or ']' after turn {count}")
+            pos, expect_item = pos + 1, True
+            continue
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # Most likely the turn continues in the next chunk
+            more = f.read(chunk_size)
+            if not more or len(buffer) - pos > MAX_TURN_CHARS:
+                raise ConversationFormatError(f"turn {count + 1}: {e}") from e
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        count += 1
+        expect_item = False
+        yield as_line(item, count, "turn")
+
+
+def iter_lines(filename, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yields the turns of a conversation file as Lines while it is being read.
+
+    Args:
+        filename (str): A JSON array or JSON Lines file
+        chunk_size (int): Characters read at a time from a JSON array
+
+    Raises:
+        OSError: if the file can't be read
+        ConversationFormatError: when a malformed turn is reached; the turns
+            before it have already been yielded
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size)
+        start = _WHITESPACE.match(buffer).end()
+        while start == len(buffer):
+            more = f.read(chunk_size)
+            if not more:
+                return
+            buffer, start = more, _WHITESPACE.match(more).end()
+        if buffer[start] == "[":
+            yield from _iter_array(f, buffer[start:], chunk_size)
+            return
+        # JSON Lines: start over and read line by line
+        f.seek(0)
+        for number, raw in enumerate(f, 1):
+            if not raw.strip():
+                continue
+            try:
+                item = json.loads(raw)
+            except json.JSONDecodeError as e:
+                raise ConversationFormatError(f"line {number}: {e}") from e
+            yield as_line(item, number)
+
+
+def load_conversation(filename):
+    """
+    Reads a whole conversation file into a Conversation.
+
+    Raises:
+        OSError, ConversationFormatError: see iter_lines
+    """
+    return Conversation(iter_lines(filename))
+
+
+def save_conversation(conversation, filename=DEFAULT_FILENAME):
+    """
+    Writes a conversation as JSON Lines if `filename` ends in .jsonl,
+    otherwise as an indented JSON array, one turn at a time.
+    """
+    with open(filename, "w", encoding="utf-8") as f:
+        if filename.endswith(".jsonl"):
+            for line in conversation:
+                f.write(json.dumps(line.to_dict()) + "\n")
+            return
+        separator = "[\n    "
+        for line in conversation:
+            f.write(separator + json.dumps(line.to_dict(), indent=4).replace("\n", "\n    "))
+            separator = ",\n    "
+        f.write("[]\n" if separator.startswith("[") else "\n]\n")
+
+
+def read_conversation_file(filename=DEFAULT_FILENAME):
+    """
+    Loads a conversation for the interactive tools, printing what happened.
+
+    Returns:
+        Conversation: or None if the file is missing or malformed
+    """
+    try:
+        conversation = load_conversation(filename)
+    except FileNotFoundError:
+        print(f"File {filename} not found.")
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error reading conversation from {filename}: {e}")
+        return None
+    print(f"\nConversation loaded from {filename}")
+    return conversation
+
+
+def print_conversation(conversation):
+    if not conversation:
+        print("No conversation to display.")
+        return
+
+    print("\nCurrent Conversation:")
+    print("--------------------")
+    for i, line in enumerate(conversation):
+        line = as_line(line, i + 1)
+        print(f"{i+1}. {line.role.capitalize()}: {line.text}")
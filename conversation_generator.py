@@ -1,35 +1,34 @@
-import os
-import time
-from elevenlabs import generate, save, set_api_key
-from elevenlabs.api import Voices
-from dotenv import load_dotenv
+import argparse
+from config import require_api_key
+from audio_cache import get_default_cache
+from rate_limiter import get_default_limiter
+from metrics import get_default_metrics
+from voice_catalog import get_default_catalog
+from dedup import DedupIndex
+from pcm_audio import DEFAULT_OUTPUT_FORMAT
+from manifest import ConversationManifest, plan_incremental
+from segment_store import SegmentStore, compact_stores
+from text_segmenter import DEFAULT_SEGMENT_CHARS
+from synthesis import DEFAULT_WORKERS, SynthesisEngine, add_synthesis_arguments, ensure_dir, print_result, print_engine_stats, print_summary
 
-# Load API key from .env file
-load_dotenv()
-api_key = os.getenv("ELEVENLABS_API_KEY")
+def select_default_voices():
+    """
+    Picks the agent and customer voices from the persisted voice catalog
+    (no API call once it has been fetched).
+    """
+    catalog = get_default_catalog()
+    voices = catalog.all()
+    if not voices:
+        print("Using default voices instead.")
+        return "Daniel", "Rachel"
 
-if not api_key:
-    print("Error: API key not found. Please add your ElevenLabs API key to a .env file.")
-    print("ELEVENLABS_API_KEY=your_api_key_here")
-    exit(1)
-
-# Set the API key
-set_api_key(api_key)
-
-# Get available voices
-try:
-    voices = Voices.from_api()
     # Select voices for agent and customer
-    agent_voice = next((v for v in voices if v.name == "Daniel"), voices[0])
-    customer_voice = next((v for v in voices if v.name == "Rachel"), voices[1] if len(voices) > 1 else voices[0])
-    
+    agent_voice = catalog.find("Daniel") or voices[0]
+    customer_voice = catalog.find("Rachel") or (voices[1] if len(voices) > 1 else voices[0])
+
     print(f"Agent voice: {agent_voice.name}")
     print(f"Customer voice: {customer_voice.name}")
-except Exception as e:
-    print(f"Error getting voices: {e}")
-    print("Using default voices instead.")
-    agent_voice = "Daniel"
-    customer_voice = "Rachel"
+    return agent_voice, customer_voice
 
 # Conversation script
 conversation = [
@@ -46,66 +45,67 @@ conversation = [
 ]
 
 # Function to generate and save audio for each line of the conversation
-def generate_conversation(conversation_list, output_dir="audio_output", play_audio=True):
-    # Create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def generate_conversation(conversation_list, output_dir="audio_output", play_audio=True, workers=DEFAULT_WORKERS,
+                          segment_chars=DEFAULT_SEGMENT_CHARS, output_format=DEFAULT_OUTPUT_FORMAT,
+                          segment_store=False, dedup=True):
+    ensure_dir(output_dir)
+    # One append-only segments.dat + index instead of a file per line
+    store = SegmentStore(output_dir) if segment_store else None
+    agent_voice, customer_voice = select_default_voices()
+    engine = SynthesisEngine(workers=workers, cache=get_default_cache(), limiter=get_default_limiter(),
+                             segment_chars=segment_chars, metrics=get_default_metrics(), output_format=output_format)
     
-    print("\nGenerating conversation audio files...")
+    print(f"\nGenerating conversation audio files ({workers} parallel workers)...")
     
-    for i, line in enumerate(conversation_list):
+    lines = []
+    for line in conversation_list:
         role = line["role"]
-        text = line["text"]
-        
         # Select voice based on role
-        voice = agent_voice if role == "agent" else customer_voice
-        
-        # Print current line being processed
-        print(f"\nProcessing: {role.capitalize()}: {text}")
-        
-        try:
-            # Generate audio using streaming
-            audio_stream = generate(
-                text=text,
-                voice=voice,
-                model="eleven_multilingual_v2",
-                stream=True
-            )
-            
-            # Create filename for saving
-            filename = f"{output_dir}/{i+1:02d}_{role}_{text[:20].replace(' ', '_')}.mp3"
-            
-            # Initialize audio data for saving
-            audio_data = bytes()
-            
-            # Stream and collect audio data
-            print("Streaming audio...")
-            for chunk in audio_stream:
-                if play_audio:
-                    # In a real application, you would play this chunk
-                    # For demonstration purposes, we're just printing progress
-                    print(".", end="", flush=True)
-                audio_data += chunk
-            
-            # Save the collected audio data
-            with open(filename, 'wb') as f:
-                f.write(audio_data)
-            
-            print(f"\nSaved: {filename}")
-            
-            # Small delay to avoid API rate limits
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"Error generating audio for line {i+1}: {e}")
+        lines.append((role, line["text"], agent_voice if role == "agent" else customer_voice))
+    
+    # Only lines that are new or changed since the last run are synthesized again
+    manifest = ConversationManifest(output_dir, model=engine.model)
+    plan = plan_incremental(manifest, lines, engine.model, output_format, store)
+    print(f"Incremental update: {plan}")
     
-    print("\nConversation generation complete!")
-    print(f"Audio files saved in '{output_dir}' directory.")
+    def on_chunk(job, chunk):
+        if play_audio:
+            # In a real application, you would play this chunk
+            # For demonstration purposes, we're just printing progress
+            print(".", end="", flush=True)
+    
+    def on_result(result):
+        print(f"\nProcessing: {result.job.role.capitalize()}: {result.job.text}")
+        print_result(result)
+    
+    def on_complete(result):
+        manifest.record(result, plan.hashes[result.job])
+    
+    # Repeated lines (same voice, same words) are synthesized once and copied
+    dedup_index = DedupIndex() if dedup else None
+    results = engine.run(plan.jobs, on_result=on_result, on_chunk=on_chunk, on_complete=on_complete, dedup=dedup_index)
+    manifest.flush()
+    print_summary(results, output_dir)
+    if store:
+        # Edits and re-runs leave superseded audio behind in the store
+        compact_stores([output_dir])
+    print_engine_stats(engine, dedup_index)
+    return results
 
 # Main execution
 if __name__ == "__main__":
     print("ElevenLabs API Conversation Generator (Streaming)")
     print("===============================================")
     
+    parser = argparse.ArgumentParser(description="Generate audio for the predefined customer service conversation")
+    parser.add_argument("--output_dir", default="audio_output", help="Directory to save the audio files")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of lines to synthesize in parallel")
+    parser.add_argument("--segment_store", action="store_true",
+                        help="Append all lines to one segment store (segments.dat + index) instead of a file per line")
+    add_synthesis_arguments(parser)
+    args = parser.parse_args()
+    require_api_key()
+    
     # Generate the conversation
-    generate_conversation(conversation) 
\ No newline at end of file
+    generate_conversation(conversation, args.output_dir, workers=args.workers, segment_chars=args.segment_chars,
+                          output_format=args.output_format, segment_store=args.segment_store, dedup=not args.no_dedup) 
\ No newline at end of file
@@ -1,35 +1,26 @@
-import os
-import time
-import json
-from elevenlabs import generate, save, set_api_key
-from elevenlabs.api import Voices
-from dotenv import load_dotenv
-
-# Load API key from .env file
-load_dotenv()
-api_key = os.getenv("ELEVENLABS_API_KEY")
-
-if not api_key:
-    print("Error: API key not found. Please add your ElevenLabs API key to a .env file.")
-    print("ELEVENLABS_API_KEY=your_api_key_here")
-    exit(1)
-
-# Set the API key
-set_api_key(api_key)
+from config import require_api_key
+from conversation import Conversation, print_conversation, read_conversation_file, save_conversation
+from audio_cache import get_default_cache
+from rate_limiter import get_default_limiter
+from metrics import get_default_metrics
+from voice_catalog import get_default_catalog
+from dedup import DedupIndex
+from pcm_audio import DEFAULT_OUTPUT_FORMAT
+from manifest import ConversationManifest, plan_incremental
+from synthesis import DEFAULT_WORKERS, SynthesisEngine, ensure_dir, print_result, print_engine_stats, print_summary
 
 class ConversationGenerator:
     def __init__(self):
-        self.voices = self.get_available_voices()
-        self.conversation = []
+        self.conversation = Conversation()
         self.agent_voice = None
         self.customer_voice = None
     
+    @property
+    def voices(self):
+        return get_default_catalog().all()
+
     def get_available_voices(self):
-        try:
-            return Voices.from_api()
-        except Exception as e:
-            print(f"Error getting voices: {e}")
-            return []
+        return self.voices
     
     def list_available_voices(self):
         if not self.voices:
@@ -97,7 +88,7 @@ class ConversationGenerator:
                 print("Text cannot be empty. Please try again.")
                 continue
             
-            self.conversation.append({"role": role, "text": text})
+            self.conversation.append(role, text)
             line_number += 1
         
         return self.conversation
@@ -107,37 +98,23 @@ class ConversationGenerator:
             print("No conversation to save.")
             return
         
-        with open(filename, "w") as f:
-            json.dump(self.conversation, f, indent=4)
+        save_conversation(self.conversation, filename)
         
         print(f"\nConversation saved to {filename}")
     
     def load_conversation_from_file(self, filename="conversation.json"):
-        try:
-            with open(filename, "r") as f:
-                self.conversation = json.load(f)
-            
-            print(f"\nConversation loaded from {filename}")
-            self.print_conversation()
-            return True
-        except FileNotFoundError:
-            print(f"File {filename} not found.")
-            return False
-        except json.JSONDecodeError:
-            print(f"Error decoding JSON from {filename}.")
+        conversation = read_conversation_file(filename)
+        if conversation is None:
             return False
+        self.conversation = conversation
+        self.print_conversation()
+        return True
     
     def print_conversation(self):
-        if not self.conversation:
-            print("No conversation to display.")
-            return
-        
-        print("\nCurrent Conversation:")
-        print("--------------------")
-        for i, line in enumerate(self.conversation):
-            print(f"{i+1}. {line['role'].capitalize()}: {line['text']}")
+        print_conversation(self.conversation)
     
-    def generate_audio(self, output_dir="audio_output", play_audio=True):
+    def generate_audio(self, output_dir="audio_output", play_audio=True, workers=DEFAULT_WORKERS,
+                       output_format=DEFAULT_OUTPUT_FORMAT, dedup=True):
         if not self.conversation:
             print("No conversation to generate audio for.")
             return
@@ -146,65 +123,49 @@ class ConversationGenerator:
             print("Voices not selected. Please select voices first.")
             self.select_voices()
         
-        # Create output directory if it doesn't exist
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        ensure_dir(output_dir)
+        engine = SynthesisEngine(workers=workers, cache=get_default_cache(), limiter=get_default_limiter(),
+                                 metrics=get_default_metrics(), output_format=output_format)
         
-        print("\nGenerating conversation audio files...")
+        print(f"\nGenerating conversation audio files ({workers} parallel workers)...")
         
-        for i, line in enumerate(self.conversation):
-            role = line["role"]
-            text = line["text"]
-            
+        lines = []
+        for line in self.conversation:
             # Select voice based on role
-            voice = self.agent_voice if role == "agent" else self.customer_voice
-            
-            # Print current line being processed
-            print(f"\nProcessing: {role.capitalize()}: {text}")
-            
-            try:
-                # Generate audio using streaming
-                audio_stream = generate(
-                    text=text,
-                    voice=voice,
-                    model="eleven_multilingual_v2",
-                    stream=True
-                )
-                
-                # Create filename for saving
-                filename = f"{output_dir}/{i+1:02d}_{role}_{text[:20].replace(' ', '_').replace('?', '').replace('!', '')}.mp3"
-                
-                # Initialize audio data for saving
-                audio_data = bytes()
-                
-                # Stream and collect audio data
-                print("Streaming audio...")
-                for chunk in audio_stream:
-                    if play_audio:
-                        # In a real application, you would play this chunk in real-time
-                        # For demonstration purposes, we're just printing progress
-                        print(".", end="", flush=True)
-                    audio_data += chunk
-                
-                # Save the collected audio data
-                with open(filename, 'wb') as f:
-                    f.write(audio_data)
-                
-                print(f"\nSaved: {filename}")
-                
-                # Small delay to avoid API rate limits
-                time.sleep(0.5)
-                
-            except Exception as e:
-                print(f"Error generating audio for line {i+1}: {e}")
-        
-        print("\nConversation generation complete!")
-        print(f"Audio files saved in '{output_dir}' directory.")
+            lines.append((line.role, line.text, self.agent_voice if line.role == "agent" else self.customer_voice))
+        
+        # After editing the conversation, only new or changed lines are synthesized again
+        manifest = ConversationManifest(output_dir, model=engine.model)
+        plan = plan_incremental(manifest, lines, engine.model, output_format)
+        print(f"Incremental update: {plan}")
+        
+        def on_chunk(job, chunk):
+            if play_audio:
+                # In a real application, you would play this chunk in real-time
+                # For demonstration purposes, we're just printing progress
+                print(".", end="", flush=True)
+        
+        def on_result(result):
+            print(f"\n{result.job.role.capitalize()}: {result.job.text}")
+            print_result(result)
+        
+        def on_complete(result):
+            manifest.record(result, plan.hashes[result.job])
+        
+        # Repeated lines (same voice, same words) are synthesized once and copied
+        dedup_index = DedupIndex() if dedup else None
+        results = engine.run(plan.jobs, on_result=on_result, on_chunk=on_chunk, on_complete=on_complete,
+                             dedup=dedup_index)
+        manifest.flush()
+        print_summary(results, output_dir)
+        print_engine_stats(engine, dedup_index)
+        return results
 
 def main():
     print("ElevenLabs API Conversation Generator (Streaming)")
     print("===============================================")
     
+    require_api_key()
     generator = ConversationGenerator()
     
     while True:
@@ -235,7 +196,13 @@ def main():
             output_dir = input("Enter output directory (default: audio_output): ") or "audio_output"
             play_option = input("Play audio while streaming? (y/n, default: y): ").lower() or "y"
             play_audio = play_option.startswith("y")
-            generator.generate_audio(output_dir, play_audio)
+            workers = input(f"Number of parallel workers (default: {DEFAULT_WORKERS}): ") or DEFAULT_WORKERS
+            try:
+                workers = int(workers)
+            except ValueError:
+                print("Invalid number, using the default.")
+                workers = DEFAULT_WORKERS
+            generator.generate_audio(output_dir, play_audio, workers)
         elif choice == "7":
             print("Exiting program. Goodbye!")
             break
@@ -0,0 +1,89 @@
+"""
+Synthesizing each distinct line once.
+
+Scripts repeat themselves ("Thank you for calling.", "Is there anything
+else I can help with?"), and the API bills and rate-limits by character.
+A DedupIndex groups the lines of a run by voice and the speech form of
+their text (see text_normalize). Only the first line of a group is
+synthesized, and the other lines get a copy of its audio. The cache
+already catches exact repeats once the first copy has finished. The
+index also catches repeats that are in flight at the same time, and
+near-identical lines that would otherwise be cached under different keys.
+"""
+import json
+import hashlib
+import threading
+
+from audio_cache import voice_identity
+from text_normalize import normalize_for_speech
+
+
+class DedupIndex:
+    """
+    The first line seen for every (voice, speech form of the text), and how
+    many characters the repeats would have cost. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._first = {}
+        self.lines = 0
+        self.duplicates = 0
+        self.chars = 0
+        self.chars_saved = 0
+
+    @staticmethod
+    def key(text, voice):
+        voice_id, settings = voice_identity(voice) if voice is not None else (None, None)
+        identity = json.dumps([voice_id, settings, normalize_for_speech(text)], sort_keys=True)
+        # A short digest keeps the index small for corpora with millions of distinct lines
+        return hashlib.blake2b(identity.encode("utf-8"), digest_size=16).digest()
+
+    def add(self, text, voice, item):
+        """
+        Registers a line; `item` is what its duplicates will be given (e.g. its job,
+        see settle).
+
+        Returns:
+            The item of the earlier line this one repeats, or None for a new line
+        """
+        key = self.key(text, voice)
+        with self._lock:
+            self.lines += 1
+            self.chars += len(text)
+            first = self._first.get(key)
+            if first is None:
+                self._first[key] = item
+                return None
+            self.duplicates += 1
+            self.chars_saved += len(text)
+            return first
+
+    def settle(self, text, voice, item):
+        """
+        Replaces what duplicates of an added line are given, e.g. its job by
+        where its audio ended up once that is known.
+        """
+        key = self.key(text, voice)
+        with self._lock:
+            self._first[key] = item
+
+    def stats(self):
+        synthesized = self.chars - self.chars_saved
+        return {
+            "lines": self.lines,
+            "duplicates": self.duplicates,
+            "chars": self.chars,
+            "chars_saved": self.chars_saved,
+            # Characters delivered per character synthesized
+            "throughput_gain": round(self.chars / synthesized, 3) if synthesized else 1.0,
+        }
+
+
+def print_dedup_stats(index):
+    if index is None or not index.lines:
+        return
+    stats = index.stats()
+    print(f"Dedup: {stats['duplicates']}/{stats['lines']} lines reused earlier audio, "
+          f"{stats['chars_saved']}/{stats['chars']} characters not synthesized "
+          f"({stats['throughput_gain']:.2f}x effective throughput)")
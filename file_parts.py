@@ -0,0 +1,79 @@
+"""
+A seekable, read-only file assembled from pieces of other files.
+
+The web UI uses it to serve audio that isn't one file on disk as if it
+were, with HTTP range requests: a line in a segment store (a byte range of
+segments.dat), a raw PCM cache entry behind a WAV header, or a long line
+cached as several segments. Nothing is copied up front; each read is
+served from the part it falls into.
+"""
+import io
+import bisect
+
+
+class PartsReader(io.RawIOBase):
+    """
+    Concatenation of `parts`, each either bytes or a (path, offset, length)
+    range of a file. Files are opened on first read and closed with the reader.
+    """
+
+    def __init__(self, parts):
+        super().__init__()
+        self._starts = []
+        self._parts = []
+        self.size = 0
+        for part in parts:
+            length = len(part) if isinstance(part, (bytes, bytearray, memoryview)) else part[2]
+            if not length:
+                continue
+            self._starts.append(self.size)
+            self._parts.append(part)
+            self.size += length
+        self._position = 0
+        self._files = {}
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self._position >= self.size or not len(buffer):
+            return 0
+        index = bisect.bisect_right(self._starts, self._position) - 1
+        part = self._parts[index]
+        within = self._position - self._starts[index]
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            count = min(len(buffer), len(part) - within)
+            buffer[:count] = part[within:within + count]
+        else:
+            path, offset, length = part
+            f = self._files.get(path)
+            if f is None:
+                f = self._files[path] = open(path, "rb")
+            f.seek(offset + within)
+            count = f.readinto(memoryview(buffer)[:min(len(buffer), length - within)])
+            if not count:
+                raise OSError(f"{path} is shorter than expected")
+        self._position += count
+        return count
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        super().close()
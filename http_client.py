@@ -0,0 +1,240 @@
+"""
+Pooled keep-alive HTTP session for the ElevenLabs API.
+
+The SDK sends every request with a bare `requests.post`, so every line of
+a conversation (and every web UI listener) opens a new TCP connection and
+does a new TLS handshake. SynthesisClient sends the same requests over one
+requests.Session per process. Its connection pool holds as many
+connections as requests may be in flight (the rate limiter's concurrency
+cap), so after the first few lines every request finds a warm connection.
+
+A streamed response goes back to the pool only once it has been read to
+the end. A stream abandoned halfway closes its connection instead, so
+the pool never hands out a connection with unread audio on it.
+"""
+import os
+import threading
+
+from config import ensure_api_key
+from rate_limiter import DEFAULT_MAX_CONCURRENCY
+
+DEFAULT_BASE_URL = os.getenv("ELEVEN_BASE_URL", "https://api.elevenlabs.io/v1")
+DEFAULT_POOL_SIZE = int(os.getenv("ELEVENLABS_HTTP_POOL_SIZE", str(DEFAULT_MAX_CONCURRENCY)))
+# (connect, read) timeouts in seconds; the read timeout applies between chunks, not to the whole stream
+DEFAULT_TIMEOUT = (10, 60)
+# Same as the SDK's streaming default
+STREAM_CHUNK_SIZE = 2048
+# The SDK's optimize_streaming_latency default
+STREAMING_LATENCY = 1
+
+
+class APIResponseError(Exception):
+    """
+    An error response from the API. Carries what rate_limiter.is_throttle_error
+    and retry_after_seconds look at: `status_code`, the API's `status` string
+    and the `response` with its headers.
+    """
+
+    def __init__(self, message, status=None, response=None):
+        super().__init__(message)
+        self.status = status
+        self.response = response
+        self.status_code = response.status_code if response is not None else None
+
+
+def error_from_response(response):
+    """
+    An APIResponseError for a non-200 response, with the message and status
+    taken from the body the same way the SDK does.
+    """
+    try:
+        detail = response.json().get("detail")
+    except ValueError:
+        detail = None
+    if isinstance(detail, dict):
+        message, status = detail.get("message", ""), detail.get("status", "")
+    elif detail:
+        message, status = str(detail), str(response.status_code)
+    else:
+        message, status = response.text[:200], str(response.status_code)
+    return APIResponseError(message or f"HTTP {response.status_code}", status, response)
+
+
+def counting_adapter(pool_size, on_connect):
+    """
+    An HTTPAdapter with a pool of `pool_size` connections per host that calls
+    `on_connect()` whenever it opens a connection, including reconnects of
+    pooled connections that were closed.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class CountingHTTPConnection(HTTPConnection):
+        def connect(self):
+            on_connect()
+            super().connect()
+
+    class CountingHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            on_connect()
+            super().connect()
+
+    class CountingHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = CountingHTTPConnection
+
+    class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = CountingHTTPSConnection
+
+    class CountingAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {"http": CountingHTTPConnectionPool,
+                                                       "https": CountingHTTPSConnectionPool}
+
+    # No retries here: throttling and failures are handled by the rate limiter
+    return CountingAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+
+
+class SynthesisClient:
+    """
+    Sends text-to-speech and voice list requests over one pooled keep-alive session.
+
+    Args:
+        pool_size (int): Connections kept open per host; should be at least the
+            number of requests in flight at once
+        base_url (str): API root, e.g. a local stand-in for benchmarks
+        verify (bool or str): TLS verification, or a CA bundle path (e.g. a self-signed test certificate)
+        timeout (tuple): (connect, read) timeouts in seconds
+        api_key (str): API key (default: ELEVENLABS_API_KEY, see config)
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, base_url=DEFAULT_BASE_URL, verify=True,
+                 timeout=DEFAULT_TIMEOUT, api_key=None):
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.api_key = api_key
+        # Passed with every request: a session-level `verify` loses to REQUESTS_CA_BUNDLE
+        self.verify = verify
+        self.session = requests.Session()
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self.pool_size = 0
+        self.ensure_pool_size(pool_size)
+
+    def ensure_pool_size(self, pool_size):
+        """
+        Grows the pool to at least `pool_size` connections, e.g. for an engine
+        with more workers than the default. Streams in flight finish on the old pool.
+        """
+        with self._lock:
+            if pool_size <= self.pool_size:
+                return
+            adapter = counting_adapter(pool_size, self._on_connect)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+            self.pool_size = pool_size
+
+    def _on_connect(self):
+        with self._lock:
+            self.connections += 1
+
+    def _headers(self):
+        return {"xi-api-key": self.api_key or ensure_api_key()}
+
+    def _resolve_voice(self, voice):
+        """(voice id, voice settings) for a Voice object, voice id or voice name."""
+        if isinstance(voice, str):
+            from voice_catalog import get_default_catalog
+
+            voice = get_default_catalog().find(voice) or voice
+            if isinstance(voice, str):
+                return voice, None
+        settings = voice.settings.model_dump() if getattr(voice, "settings", None) else None
+        return voice.voice_id, settings
+
+    def _send(self, method, path, **kwargs):
+        response = self.session.request(method, self.base_url + path, headers=self._headers(),
+                                        timeout=self.timeout, verify=self.verify, **kwargs)
+        with self._lock:
+            self.requests += 1
+            if response.status_code != 200:
+                self.errors += 1
+        if response.status_code != 200:
+            try:
+                raise error_from_response(response)
+            finally:
+                response.close()
+        return response
+
+    def generate_stream(self, text, voice, model, output_format, latency=STREAMING_LATENCY):
+        """
+        Starts a streaming synthesis request and returns an iterator of its audio chunks.
+
+        Raises:
+            APIResponseError: right away if the API answers with an error
+        """
+        voice_id, settings = self._resolve_voice(voice)
+        response = self._send("POST", f"/text-to-speech/{voice_id}/stream",
+                              params={"optimize_streaming_latency": latency, "output_format": output_format},
+                              json={"text": text, "model_id": model, "voice_settings": settings},
+                              stream=True)
+        return self._iter_chunks(response)
+
+    @staticmethod
+    def _iter_chunks(response):
+        try:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                if chunk:
+                    yield chunk
+        finally:
+            # Back to the pool if fully read, otherwise the connection is dropped
+            response.close()
+
+    def list_voices(self):
+        from elevenlabs.api import Voices
+
+        with self._send("GET", "/voices") as response:
+            return list(Voices(**response.json()).voices)
+
+    def stats(self):
+        connections = self.connections
+        return {
+            "pool_size": self.pool_size,
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections": connections,
+            "reused": max(0, self.requests - connections),
+            "reuse_ratio": round(1 - connections / self.requests, 3) if self.requests else 0.0,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """
+    Returns the process-wide client shared by all entry points.
+    Set ELEVENLABS_HTTP_POOL_SIZE to size its pool (default: ELEVENLABS_MAX_CONCURRENCY).
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = SynthesisClient()
+        return _default_client
+
+
+def print_http_stats(client):
+    if client is None or not client.requests:
+        return
+    stats = client.stats()
+    print(f"HTTP: {stats['requests']} requests over {stats['connections']} connections "
+          f"({stats['reuse_ratio']:.0%} reused, pool of {stats['pool_size']})")
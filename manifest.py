@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+
+from audio_cache import cache_key, voice_identity
+from audio_writer import AtomicFileWriter, temp_path_for
+from pcm_audio import DEFAULT_OUTPUT_FORMAT
+from synthesis import LineJob, audio_filename
+
+MANIFEST_NAME = "manifest.json"
+
+# record() saves once this many lines (or this share of the conversation) are unsaved,
+# or after this many seconds, so saving a long conversation doesn't cost O(n^2) bytes
+SAVE_EVERY_LINES = 64
+SAVE_EVERY_FRACTION = 8
+SAVE_INTERVAL_SECONDS = 5.0
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class ConversationManifest:
+    """
+    Records which lines of a conversation have been synthesized into an output directory.
+
+    Each line entry stores the output file and the content hash of (text,
+    voice, model, settings, output format), so a later run can skip lines
+    that are already complete and still regenerate a line whose text or
+    voice changed. The
+    manifest is rewritten atomically, but not after every line: record()
+    batches updates (see SAVE_EVERY_LINES), so a crash loses at most the
+    last few seconds of finished lines. Call flush() once a run is done.
+
+    Args:
+        output_dir (str): Directory holding the conversation's audio files
+        source (str): Conversation file the audio was generated from
+        model (str): Model id used for synthesis
+    """
+
+    def __init__(self, output_dir, source=None, model=None):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self.data = {"source": source, "model": model, "lines": {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.data = json.load(f)
+            except json.JSONDecodeError:
+                print(f"Ignoring unreadable manifest {self.path}")
+        self.data["source"] = source or self.data.get("source")
+        self.data["model"] = model or self.data.get("model")
+
+    @staticmethod
+    def line_hash(text, voice, model, output_format=DEFAULT_OUTPUT_FORMAT):
+        return cache_key(text, voice, model, output_format)
+
+    def entry(self, index):
+        return self.data["lines"].get(str(index + 1))
+
+    def record(self, result, content_hash):
+        """
+        Stores the outcome of a LineResult, saving the manifest if enough
+        lines or time have gone by since the last save.
+
+        Returns:
+            bool: whether the manifest was saved (otherwise flush() is still due)
+        """
+        job = result.job
+        voice_id, _ = voice_identity(job.voice) if job.voice is not None else (None, None)
+        entry = {
+            "role": job.role,
+            "text": job.text,
+            "voice": voice_id,
+            "file": os.path.basename(job.filename),
+            "hash": content_hash,
+            "status": STATUS_DONE if result.ok else STATUS_FAILED,
+            "bytes": result.bytes_written,
+        }
+        if not result.ok:
+            entry["error"] = str(result.error)
+        with self._lock:
+            self.data["lines"][str(job.index + 1)] = entry
+            self._unsaved += 1
+            due = max(SAVE_EVERY_LINES, len(self.data["lines"]) // SAVE_EVERY_FRACTION)
+            if self._unsaved < due and time.monotonic() - self._saved_at < SAVE_INTERVAL_SECONDS:
+                return False
+            self.save()
+            return True
+
+    def flush(self):
+        """Saves the lines recorded since the last save, if any."""
+        with self._lock:
+            if self._unsaved:
+                self.save()
+
+    def save(self):
+        with AtomicFileWriter(self.path) as writer:
+            writer.write(json.dumps(self.data, indent=4).encode("utf-8"))
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+
+def recorded_source(output_dir):
+    """
+    The conversation file recorded in the manifest of `output_dir`, or None
+    if there is no readable manifest or it doesn't name one.
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), "r") as f:
+            return json.load(f).get("source")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class IncrementalPlan:
+    """
+    What a re-run has to do: `jobs` for added or changed lines (with their
+    content hashes in `hashes`), plus the line numbers that were kept,
+    renumbered ({new: old}) or removed.
+    """
+
+    def __init__(self):
+        self.jobs = []
+        self.hashes = {}
+        self.unchanged = []
+        self.moved = {}
+        self.removed = []
+
+    def __str__(self):
+        return (f"{len(self.jobs)} to generate, {len(self.unchanged)} unchanged, "
+                f"{len(self.moved)} renumbered, {len(self.removed)} removed")
+
+
+def plan_incremental(manifest, lines, model, output_format=DEFAULT_OUTPUT_FORMAT, store=None):
+    """
+    Matches a (possibly edited) script against what was generated before and
+    brings the output up to date without synthesizing what already exists.
+
+    Old audio is matched by content hash, not position. A line that didn't
+    change keeps its file. A line that only moved (because lines were
+    inserted or deleted before it) has its file renamed, or its segment
+    renumbered in a segment store. Audio of lines that were removed or
+    changed is deleted, so a failed re-synthesis can't leave stale audio
+    behind. Only the returned jobs still need synthesizing.
+
+    Args:
+        manifest (ConversationManifest): Manifest of the output directory
+        lines (list): (role, text, voice) for every line of the script, in order
+        model (str): Model id
+        output_format (str): Output format the audio is requested in
+        store (SegmentStore): The conversation's segment store, if it uses one
+
+    Returns:
+        IncrementalPlan
+    """
+    output_dir = manifest.output_dir
+    plan = IncrementalPlan()
+
+    # Audio that is still there from earlier runs, by line number
+    old = {}
+    if store:
+        # The store's index is authoritative; it also covers segments the manifest never saw
+        for segment in store.segments():
+            old[segment.line] = {
+                "role": segment.role, "text": segment.text, "voice": segment.voice,
+                "file": os.path.basename(store.location(segment.line)), "hash": segment.hash,
+                "status": STATUS_DONE, "bytes": segment.length,
+            }
+    else:
+        for key, entry in manifest.data["lines"].items():
+            if entry.get("status") == STATUS_DONE and os.path.exists(os.path.join(output_dir, entry["file"])):
+                old[int(key)] = entry
+
+    targets, hashes = [], []
+    for i, (role, text, voice) in enumerate(lines):
+        hashes.append(manifest.line_hash(text, voice, model, output_format))
+        targets.append(store.location(i + 1) if store else audio_filename(output_dir, i, role, text, output_format))
+
+    # Same content in the same place first, then content that moved
+    kept = set()
+    for line, content_hash in enumerate(hashes, 1):
+        entry = old.get(line)
+        if entry and entry["hash"] == content_hash and (store or entry["file"] == os.path.basename(targets[line - 1])):
+            kept.add(line)
+    available = defaultdict(list)
+    for line in sorted(old):
+        if line not in kept:
+            available[old[line]["hash"]].append(line)
+    for line, content_hash in enumerate(hashes, 1):
+        if line not in kept and available[content_hash]:
+            plan.moved[line] = available[content_hash].pop(0)
+    plan.unchanged = sorted(kept)
+    sources = set(plan.moved.values())
+    plan.removed = sorted(line for line in old if line not in kept and line not in sources)
+
+    if store:
+        store.renumber(plan.moved)
+        store.delete([segment.line for segment in store.segments()
+                      if segment.line not in kept and segment.line not in plan.moved])
+    else:
+        # Two phases, so files can swap names: move sources aside, delete, then rename into place
+        staged = {}
+        for line, source in plan.moved.items():
+            staged[line] = temp_path_for(targets[line - 1])
+            os.replace(os.path.join(output_dir, old[source]["file"]), staged[line])
+        for line in plan.removed:
+            try:
+                os.remove(os.path.join(output_dir, old[line]["file"]))
+            except OSError:
+                pass
+        for line, temp in staged.items():
+            os.replace(temp, targets[line - 1])
+
+    with manifest._lock:
+        entries = {}
+        for line in sorted(kept | set(plan.moved)):
+            if line in kept:
+                entries[str(line)] = old[line]
+            else:
+                role, text, _ = lines[line - 1]
+                entries[str(line)] = dict(old[plan.moved[line]], role=role, text=text,
+                                          file=os.path.basename(targets[line - 1]))
+        manifest.data["lines"] = entries
+        manifest.save()
+
+    for i, (role, text, voice) in enumerate(lines):
+        if i + 1 in kept or i + 1 in plan.moved:
+            continue
+        job = LineJob(i, role, text, voice, targets[i], store)
+        plan.jobs.append(job)
+        plan.hashes[job] = hashes[i]
+    return plan
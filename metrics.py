@@ -0,0 +1,202 @@
+"""
+Per-line latency and throughput instrumentation.
+
+Every stage (synthesis to disk, live playback, web streaming, combining)
+records one event per line with its timings and byte counts. Events are
+appended as JSON lines to ELEVENLABS_METRICS_FILE when it is set, and kept
+in memory (a bounded window per stage) for the end-of-run percentile
+summary and the web UI's Prometheus endpoint.
+"""
+import os
+import json
+import math
+import time
+import threading
+from collections import defaultdict, deque
+
+DEFAULT_METRICS_FILE = os.getenv("ELEVENLABS_METRICS_FILE")
+WINDOW = 10000
+
+# Durations in seconds that get percentiles
+TIMING_FIELDS = ("ttfc", "first_audio", "total", "decode", "encode")
+# Counts that are summed
+COUNTER_FIELDS = ("bytes", "chunks", "underruns")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(q * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class StreamTimer:
+    """
+    Wraps a chunk iterator and measures when it was opened, the time to the
+    first chunk, the total time until it was exhausted, bytes and chunks.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.request_start = time.time()
+        self.started = time.perf_counter()
+        self.ttfc = None
+        self.total = None
+        self.bytes = 0
+        self.chunks = 0
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self.ttfc is None:
+                self.ttfc = time.perf_counter() - self.started
+            self.bytes += len(chunk)
+            self.chunks += 1
+            yield chunk
+        self.total = time.perf_counter() - self.started
+
+    def fields(self):
+        return {
+            "request_start": round(self.request_start, 3),
+            "ttfc": self.ttfc,
+            "total": self.total if self.total is not None else time.perf_counter() - self.started,
+            "bytes": self.bytes,
+            "chunks": self.chunks,
+        }
+
+
+def recorded_stream(metrics, stage, chunks, **fields):
+    """
+    Yields `chunks` and records one `stage` event with their timings when
+    the stream ends, fails or is abandoned by the consumer (ok=False).
+    """
+    timer = StreamTimer(chunks)
+    ok = False
+    try:
+        yield from timer
+        ok = True
+    finally:
+        metrics.record(stage, ok=ok, **fields, **timer.fields())
+
+
+class MetricsRecorder:
+    """
+    Collects per-line events.
+
+    Args:
+        path (str): JSON lines file to append events to, or None to keep them in memory only
+    """
+
+    def __init__(self, path=DEFAULT_METRICS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=WINDOW))
+        # All-time sum and count per timing, for Prometheus; the window above only feeds the quantiles
+        self._timing_sums = defaultdict(float)
+        self._timing_counts = defaultdict(int)
+        self._counters = defaultdict(int)
+        self._events = defaultdict(int)
+        self._errors = defaultdict(int)
+
+    def record(self, stage, **fields):
+        """
+        Records one event. Timing fields are in seconds; None values are dropped.
+        """
+        event = {"ts": round(time.time(), 3), "stage": stage}
+        event.update((k, round(v, 6) if isinstance(v, float) else v) for k, v in fields.items() if v is not None)
+        with self._lock:
+            self._events[stage] += 1
+            if event.get("ok") is False:
+                self._errors[stage] += 1
+            for name in TIMING_FIELDS:
+                if name in event:
+                    self._samples[stage, name].append(event[name])
+                    self._timing_sums[stage, name] += event[name]
+                    self._timing_counts[stage, name] += 1
+            for name in COUNTER_FIELDS:
+                if name in event:
+                    self._counters[stage, name] += event[name]
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(event) + "\n")
+        return event
+
+    def summary(self):
+        """
+        {stage: {"count": n, "errors": n, "<timing>": {"p50": s, "p95": s, "p99": s}, "<counter>": total}}
+        """
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+            counters = dict(self._counters)
+            events, errors = dict(self._events), dict(self._errors)
+        result = {}
+        for stage in events:
+            stage_summary = {"count": events[stage], "errors": errors.get(stage, 0)}
+            for name in TIMING_FIELDS:
+                values = samples.get((stage, name))
+                if values:
+                    stage_summary[name] = {f"p{int(q * 100)}": percentile(values, q) for q in QUANTILES}
+            for name in COUNTER_FIELDS:
+                if (stage, name) in counters:
+                    stage_summary[name] = counters[stage, name]
+            result[stage] = stage_summary
+        return result
+
+    def prometheus(self):
+        """
+        The current metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+            sums, counts = dict(self._timing_sums), dict(self._timing_counts)
+            counters = dict(self._counters)
+            events, errors = dict(self._events), dict(self._errors)
+        lines = []
+        for name in TIMING_FIELDS:
+            metric = f"elevenlabs_{name}_seconds"
+            series = [(stage, values) for (stage, field), values in sorted(samples.items()) if field == name]
+            if not series:
+                continue
+            lines.append(f"# TYPE {metric} summary")
+            for stage, values in series:
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{stage="{stage}",quantile="{q}"}} {percentile(values, q)}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {sums[stage, name]}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {counts[stage, name]}')
+        for name in COUNTER_FIELDS:
+            metric = f"elevenlabs_{name}_total"
+            series = [(stage, value) for (stage, field), value in sorted(counters.items()) if field == name]
+            if series:
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f'{metric}{{stage="{stage}"}} {value}' for stage, value in series)
+        for metric, values in (("elevenlabs_events_total", events), ("elevenlabs_errors_total", errors)):
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f'{metric}{{stage="{stage}"}} {value}' for stage, value in sorted(values.items()))
+        return "\n".join(lines) + "\n"
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_default_metrics():
+    """
+    Returns the process-wide recorder shared by all entry points.
+    Set ELEVENLABS_METRICS_FILE to also write every event as a JSON line.
+    """
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = MetricsRecorder()
+        return _default_metrics
+
+
+def print_metrics_summary(metrics):
+    for stage, stats in metrics.summary().items():
+        parts = [f"{stats['count']} events", f"{stats['errors']} errors"]
+        for name in TIMING_FIELDS:
+            if name in stats:
+                values = "/".join(f"{stats[name][k] * 1000:.0f}" for k in ("p50", "p95", "p99"))
+                parts.append(f"{name} p50/p95/p99 {values} ms")
+        print(f"Metrics [{stage}]: " + ", ".join(parts))
@@ -0,0 +1,254 @@
+"""
+Minimal MPEG audio (Layer III) frame parser.
+
+Just enough of the format to concatenate MP3 files frame by frame: frame
+header decoding, ID3v2/ID3v1 and Xing/Info/VBRI header detection, and
+generation of silent frames.
+"""
+from collections import namedtuple
+
+MPEG1, MPEG2, MPEG25 = 1, 2, 25
+MONO = 3  # channel mode value for single channel
+
+_VERSIONS = {0b00: MPEG25, 0b10: MPEG2, 0b11: MPEG1}
+_SAMPLE_RATES = {
+    MPEG1: (44100, 48000, 32000),
+    MPEG2: (22050, 24000, 16000),
+    MPEG25: (11025, 12000, 8000),
+}
+# Layer III bitrates in kbit/s, indexed by the 4-bit bitrate index
+_BITRATES = {
+    MPEG1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    MPEG2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_BITRATES[MPEG25] = _BITRATES[MPEG2]
+
+ID3V1_SIZE = 128
+
+
+class FrameHeader(namedtuple("FrameHeader", [
+        "version", "bitrate", "sample_rate", "padding", "protected", "channel_mode", "raw"])):
+    """Decoded 4-byte MPEG audio frame header (Layer III only)."""
+
+    @property
+    def channels(self):
+        return 1 if self.channel_mode == MONO else 2
+
+    @property
+    def samples_per_frame(self):
+        return 1152 if self.version == MPEG1 else 576
+
+    @property
+    def frame_length(self):
+        coefficient = 144 if self.version == MPEG1 else 72
+        return coefficient * self.bitrate * 1000 // self.sample_rate + self.padding
+
+    @property
+    def side_info_size(self):
+        if self.version == MPEG1:
+            return 17 if self.channel_mode == MONO else 32
+        return 9 if self.channel_mode == MONO else 17
+
+    @property
+    def stream_format(self):
+        """What has to match for two files to be concatenated frame by frame."""
+        return (self.version, self.sample_rate, self.channels, self.bitrate)
+
+
+def parse_header(data, offset=0):
+    """
+    Decodes the frame header at `offset`, or returns None if there isn't a
+    valid Layer III header there.
+    """
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset:offset + 4]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = _VERSIONS.get((b1 >> 3) & 0b11)
+    layer = (b1 >> 1) & 0b11
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0b11
+    if version is None or layer != 0b01 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    return FrameHeader(
+        version=version,
+        bitrate=_BITRATES[version][bitrate_index],
+        sample_rate=_SAMPLE_RATES[version][rate_index],
+        padding=(b2 >> 1) & 1,
+        protected=not (b1 & 1),
+        channel_mode=b3 >> 6,
+        raw=bytes(data[offset:offset + 4]),
+    )
+
+
+def id3v2_size(data):
+    """Length of a leading ID3v2 tag (0 if there is none)."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def is_info_frame(data, offset, header):
+    """
+    True for a Xing/Info or VBRI header frame. These carry no audio and
+    would describe the wrong length once files are concatenated.
+    """
+    xing = offset + 4 + (2 if header.protected else 0) + header.side_info_size
+    return data[xing:xing + 4] in (b"Xing", b"Info") or data[offset + 36:offset + 40] == b"VBRI"
+
+
+def iter_frames(data):
+    """
+    Yields (header, offset) for every audio frame in an MP3 file's bytes,
+    skipping ID3 tags and Xing/Info/VBRI frames, also where several MP3
+    files were written back to back.
+
+    Raises:
+        ValueError: if the data isn't a clean sequence of Layer III frames
+    """
+    offset = id3v2_size(data)
+    end = len(data)
+    if end - offset >= ID3V1_SIZE and data[end - ID3V1_SIZE:end - ID3V1_SIZE + 3] == b"TAG":
+        end -= ID3V1_SIZE
+
+    first = True
+    while offset < end:
+        header = parse_header(data, offset)
+        tag = id3v2_size(data[offset:offset + 10]) if header is None else 0
+        if tag:
+            # Another file starts here, e.g. the next segment of a line saved before
+            # segments were joined frame by frame; skip its tag and Xing frame too
+            offset += tag
+            first = True
+            continue
+        if header is None:
+            # Allow a few stray bytes or an APE tag at the end, but not garbage in the middle
+            if end - offset < 4 or data[offset:offset + 8] == b"APETAGEX":
+                return
+            raise ValueError(f"invalid MPEG audio frame at byte {offset}")
+        if offset + header.frame_length > end:
+            # Truncated last frame
+            return
+        if not (first and is_info_frame(data, offset, header)):
+            yield header, offset
+        first = False
+        offset += header.frame_length
+
+
+def audio_range(data):
+    """
+    (start, end) of the audio frames in an MP3 file's bytes, without its
+    ID3 tags and Xing/Info frame: the part iter_stream_frames passes on.
+    """
+    start = end = 0
+    for header, offset in iter_frames(data):
+        if not end:
+            start = offset
+        end = offset + header.frame_length
+    return start, end
+
+
+def silent_frame(header):
+    """
+    Builds a frame in the same format as `header` that decodes to silence:
+    no CRC, no padding and all-zero side info and main data.
+    """
+    raw = bytearray(header.raw)
+    raw[1] |= 0x01          # protection bit set: no CRC
+    raw[2] &= ~0x02 & 0xFF  # no padding
+    raw[3] &= 0xF0          # mode extension off, keep copyright/original/emphasis
+    silent = header._replace(padding=0, protected=False, raw=bytes(raw))
+    return bytes(raw) + bytes(silent.frame_length - 4)
+
+
+def silent_frames(header, duration_ms):
+    """
+    Pre-encoded silence of roughly `duration_ms` (rounded to whole frames).
+    """
+    count = round(duration_ms / 1000 * header.sample_rate / header.samples_per_frame)
+    return silent_frame(header) * count
+
+
+def read_first_header(path, read_size=16384):
+    """
+    Header of the first audio frame in an MP3 file, without reading the whole file.
+    """
+    with open(path, "rb") as f:
+        data = f.read(read_size)
+        skip = id3v2_size(data)
+        if skip + 4 > len(data):
+            f.seek(skip)
+            data = f.read(read_size)
+            skip = 0
+    for header, _ in iter_frames_prefix(data, skip):
+        return header
+    return None
+
+
+def iter_frames_prefix(data, offset):
+    """
+    Like iter_frames, but over a prefix of a file: stops quietly at the end of the buffer.
+    """
+    first = True
+    while True:
+        header = parse_header(data, offset)
+        if header is None:
+            return
+        if not (first and is_info_frame(data, offset, header)):
+            yield header, offset
+        first = False
+        offset += header.frame_length
+
+
+def iter_stream_frames(chunks):
+    """
+    Re-chunks a streamed MP3 along frame boundaries, e.g. so that other audio
+    can be spliced in between two streams.
+
+    Yields (header of the first frame, bytes of whole frames) as soon as a
+    network chunk completes at least one frame. A leading ID3v2 tag and
+    Xing/Info frame are dropped, a truncated last frame is dropped.
+
+    Raises:
+        ValueError: if the stream isn't a clean sequence of Layer III frames
+    """
+    buffer = bytearray()
+    skip = None
+    first = True
+    for chunk in chunks:
+        buffer += chunk
+        if skip is None:
+            if len(buffer) < 10:
+                continue
+            skip = id3v2_size(buffer)
+        if skip:
+            # Still inside the ID3v2 tag
+            dropped = min(skip, len(buffer))
+            del buffer[:dropped]
+            skip -= dropped
+            if skip:
+                continue
+        offset, start, start_header = 0, None, None
+        while offset + 4 <= len(buffer):
+            header = parse_header(buffer, offset)
+            if header is None:
+                raise ValueError("invalid MPEG audio frame in stream")
+            if offset + header.frame_length > len(buffer):
+                break
+            if first and is_info_frame(buffer, offset, header):
+                # Not audio; drop it by starting after it
+                offset += header.frame_length
+                first = False
+                continue
+            first = False
+            if start is None:
+                start, start_header = offset, header
+            offset += header.frame_length
+        if start is not None:
+            yield start_header, bytes(buffer[start:offset])
+        del buffer[:offset]
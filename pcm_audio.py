@@ -0,0 +1,148 @@
+"""
+Raw PCM output formats and the WAV container used to store them.
+
+ElevenLabs can return 16-bit little-endian mono PCM ("pcm_44100" etc.)
+instead of MP3. Playback and combining need PCM anyway, so requesting it
+directly skips an MP3 encode on the server and a decode on our side; MP3
+is then encoded once, when the combined conversation is exported.
+
+Lines saved in a PCM format are written as WAV files: the same samples
+behind a 44-byte header, so they still open in any audio player and the
+combiner can tell their rate without probing.
+"""
+import sys
+import mmap
+import struct
+from array import array
+
+MP3_FORMAT = "mp3_44100_128"
+OUTPUT_FORMATS = (MP3_FORMAT, "pcm_16000", "pcm_22050", "pcm_24000", "pcm_44100")
+DEFAULT_OUTPUT_FORMAT = MP3_FORMAT
+
+# What the API sends for every pcm_* format
+PCM_SAMPLE_WIDTH = 2
+PCM_CHANNELS = 1
+
+WAV_HEADER_SIZE = 44
+
+
+def pcm_rate(output_format):
+    """
+    Sample rate of a PCM output format such as "pcm_44100", or None for MP3 formats.
+    """
+    if output_format and output_format.startswith("pcm_"):
+        return int(output_format[4:])
+    return None
+
+
+def file_extension(output_format):
+    return "wav" if pcm_rate(output_format) else "mp3"
+
+
+def wav_header(rate, channels=PCM_CHANNELS, sample_width=PCM_SAMPLE_WIDTH, data_size=0):
+    """
+    A canonical 44-byte PCM WAV header for `data_size` bytes of samples.
+    """
+    block_align = channels * sample_width
+    return struct.pack("<4sI4s4sIHHIIHH4sI",
+                       b"RIFF", 36 + data_size, b"WAVE",
+                       b"fmt ", 16, 1, channels, rate, rate * block_align, block_align, sample_width * 8,
+                       b"data", data_size)
+
+
+def read_wav(path):
+    """
+    Maps a PCM WAV file into memory without copying its samples.
+
+    Returns:
+        tuple: (rate, channels, sample_width, memoryview of the sample data)
+
+    Raises:
+        ValueError: if the file isn't uncompressed PCM WAV
+    """
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    if len(view) < 12 or view[:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise ValueError(f"{path} is not a WAV file")
+    offset, fmt = 12, None
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        size = struct.unpack_from("<I", view, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", view, body)
+            if audio_format != 1:
+                raise ValueError(f"{path} is not uncompressed PCM")
+            fmt = (rate, channels, bits // 8)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError(f"{path} has no fmt chunk before its data")
+            # Sizes of streamed files that were never finalized can be too large; trust the file length
+            end = min(body + size, len(view))
+            return fmt + (view[body:end],)
+        offset = body + size + (size & 1)
+    raise ValueError(f"{path} has no data chunk")
+
+
+def _samples(pcm):
+    samples = array("h", bytes(pcm))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+
+def _pcm_bytes(samples):
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def crossfade_pcm(before, after):
+    """
+    Mixes two equally long pieces of 16-bit PCM: `before` fades out linearly
+    while `after` fades in.
+    """
+    a, b = _samples(before), _samples(after)
+    n = len(a)
+    return _pcm_bytes(array("h", ((a[i] * (n - i) + b[i] * (i + 1)) // (n + 1) for i in range(n))))
+
+
+def crossfade_streams(streams, overlap_bytes):
+    """
+    Joins 16-bit PCM streams (iterators of byte chunks) into one, blending the
+    last `overlap_bytes` of each into the start of the next so the joins
+    don't click. Only that tail is held back; everything before it is yielded
+    as soon as it arrives. Short streams get a shorter overlap.
+    """
+    overlap_bytes -= overlap_bytes % PCM_SAMPLE_WIDTH
+    tail = b""
+    for stream in streams:
+        pending = bytearray()
+        chunks = iter(stream)
+        # The start of this stream, to mix into the tail of the previous one
+        for chunk in chunks:
+            pending += chunk
+            if len(pending) >= len(tail):
+                break
+        n = min(len(tail), len(pending))
+        n -= n % PCM_SAMPLE_WIDTH
+        if n:
+            yield tail[:len(tail) - n] + crossfade_pcm(tail[len(tail) - n:], pending[:n])
+            del pending[:n]
+        elif tail:
+            yield tail
+        for chunk in chunks:
+            pending += chunk
+            ready = len(pending) - overlap_bytes
+            ready -= ready % PCM_SAMPLE_WIDTH
+            if ready > 0:
+                yield bytes(pending[:ready])
+                del pending[:ready]
+        ready = max(0, len(pending) - overlap_bytes)
+        ready -= ready % PCM_SAMPLE_WIDTH
+        if ready:
+            yield bytes(pending[:ready])
+        tail = bytes(pending[ready:])
+    if tail:
+        yield tail
@@ -0,0 +1,202 @@
+import os
+import time
+import random
+import threading
+
+DEFAULT_RATE = float(os.getenv("ELEVENLABS_REQUESTS_PER_SECOND", "4"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("ELEVENLABS_MAX_CONCURRENCY", "8"))
+DEFAULT_MAX_RETRIES = 5
+
+# Error statuses the ElevenLabs API uses for "slow down" responses (HTTP 429)
+THROTTLE_STATUSES = {"too_many_concurrent_requests", "system_busy", "rate_limit_exceeded"}
+
+
+class ThrottledError(Exception):
+    """A 429-style response. `retry_after` is the server's hint in seconds, if any."""
+
+    def __init__(self, message="Too many requests", retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_throttle_error(exc):
+    """
+    True if `exc` means the API is throttling us (as opposed to a real failure).
+    """
+    if isinstance(exc, ThrottledError):
+        return True
+    response = getattr(exc, "response", None)
+    if getattr(exc, "status_code", None) == 429 or getattr(response, "status_code", None) == 429:
+        return True
+    return getattr(exc, "status", None) in THROTTLE_STATUSES
+
+
+def retry_after_seconds(exc):
+    """
+    The Retry-After hint carried by a throttle error, in seconds, or None.
+    """
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+        retry_after = headers.get("Retry-After")
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0, retry_after=None):
+    """
+    Exponential backoff with full jitter, never shorter than the server's Retry-After.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class AdaptiveRateLimiter:
+    """
+    Client-side limiter shared by all synthesis calls.
+
+    It combines a token bucket (requests per second) with a cap on requests
+    in flight. Both limits adapt AIMD-style. Every successful request
+    raises them a little, and every throttled response cuts them in half
+    and pauses new requests for the server's Retry-After. Throughput
+    converges on what the account's quota actually allows.
+
+    Args:
+        rate (float): Initial requests per second
+        max_concurrency (int): Upper bound for requests in flight
+        min_rate (float): Lower bound for the request rate
+        max_rate (float): Upper bound for the request rate
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, max_concurrency=DEFAULT_MAX_CONCURRENCY, min_rate=0.2, max_rate=50.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max(1, min(max_concurrency, 4)))
+        self.active = 0
+        self.requests = 0
+        self.throttled = 0
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        capacity = max(1.0, self.rate)
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """
+        Blocks until a request may start: a token is available, a concurrency
+        slot is free and no throttling pause is in effect.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.active >= int(self.concurrency):
+                    wait = None  # woken up by release()
+                elif self._tokens < 1.0:
+                    wait = (1.0 - self._tokens) / self.rate
+                else:
+                    self._tokens -= 1.0
+                    self.active += 1
+                    self.requests += 1
+                    return
+                self._cond.wait(wait)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        # Additive increase: about +1 concurrent request and +1 req/s per "window" of successes
+        with self._cond:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+            self.rate = min(self.max_rate, self.rate + 1.0 / self.rate)
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after=None):
+        # Multiplicative decrease, plus a global pause if the server asked for one
+        with self._cond:
+            self.throttled += 1
+            self.concurrency = max(1.0, self.concurrency / 2)
+            self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "rate": round(self.rate, 2),
+                "concurrency": int(self.concurrency),
+                "active": self.active,
+            }
+
+
+def limited_stream(limiter, open_stream, max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Runs `open_stream()` under `limiter`, retrying throttled attempts.
+
+    The request is considered started once the first chunk arrives. Only
+    that part is retried; a stream that fails halfway is not replayed. The
+    concurrency slot is held until the stream has been fully consumed,
+    because the API counts an open stream as a concurrent request.
+    """
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            chunks = iter(open_stream())
+            first = next(chunks, None)
+            break
+        except Exception as e:
+            limiter.release()
+            if not is_throttle_error(e) or attempt >= max_retries:
+                raise
+            retry_after = retry_after_seconds(e)
+            limiter.on_throttle(retry_after)
+            time.sleep(backoff_delay(attempt, retry_after=retry_after))
+            attempt += 1
+
+    try:
+        limiter.on_success()
+        if first is not None:
+            yield first
+        for chunk in chunks:
+            yield chunk
+    finally:
+        limiter.release()
+
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_default_limiter():
+    """
+    Returns the process-wide limiter shared by all entry points.
+    Set ELEVENLABS_REQUESTS_PER_SECOND / ELEVENLABS_MAX_CONCURRENCY to tune the starting point.
+    """
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = AdaptiveRateLimiter()
+        return _default_limiter
+
+
+def print_limiter_stats(limiter):
+    stats = limiter.stats()
+    print(f"Rate limiter: {stats['requests']} requests, {stats['throttled']} throttled, "
+          f"settled at {stats['rate']} req/s and {stats['concurrency']} concurrent")
@@ -0,0 +1,367 @@
+"""
+Append-only segment store: all the audio of one conversation in one file.
+
+Instead of one loose file per line, a conversation directory can hold
+
+- `segments.dat`: the audio of every line, appended back to back
+- `segments.idx`: a JSON lines index with one entry per appended line
+  (line number, role, voice, offset, length, duration, content hash,
+  output format); the last entry for a line wins. Renumbering a line
+  appends an entry pointing at the same bytes, removing it appends a
+  tombstone, so neither touches the audio. Repeated lines can share the
+  bytes of one segment (see `link`).
+
+Readers memory-map the data file and slice any turn out of it, so the
+combiner, the web UI and replay don't have to open (or glob and sort)
+thousands of small files. Audio is appended before its index entry, so an
+interrupted write leaves at most some unreferenced bytes at the end.
+"""
+import os
+import json
+import mmap
+import shutil
+import threading
+from collections import namedtuple
+
+from audio_writer import temp_path_for
+from mp3_frames import iter_frames
+from pcm_audio import PCM_CHANNELS, PCM_SAMPLE_WIDTH, pcm_rate
+
+DATA_NAME = "segments.dat"
+INDEX_NAME = "segments.idx"
+INDEX_VERSION = 1
+READ_CHUNK_SIZE = 4096
+# Stores are compacted at the end of a run once this share of their data file is superseded audio
+COMPACT_GARBAGE_RATIO = 0.5
+
+
+class Segment(namedtuple("Segment", [
+        "line", "role", "voice", "offset", "length", "duration", "hash", "format", "text"])):
+    """Index entry of one line (`line` is 1-based)."""
+
+    @property
+    def pcm(self):
+        return pcm_rate(self.format) is not None
+
+
+def audio_duration(data, output_format):
+    """
+    Seconds of audio in `data`: counted from the frame headers for MP3,
+    from the byte count for raw PCM.
+    """
+    rate = pcm_rate(output_format)
+    if rate:
+        return len(data) / (rate * PCM_CHANNELS * PCM_SAMPLE_WIDTH)
+    duration = 0.0
+    for header, _ in iter_frames(data):
+        duration += header.samples_per_frame / header.sample_rate
+    return duration
+
+
+def read_segment(data_path, segment):
+    """
+    The audio of `segment` as a memoryview of the mapped data file, without
+    a SegmentStore (e.g. in a worker process).
+    """
+    with open(data_path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(data)[segment.offset:segment.offset + segment.length]
+
+
+class SegmentWriter:
+    """
+    Receives the chunks of one line in a spill file next to the store and
+    appends them to the store in one piece on commit, so lines synthesized
+    in parallel never interleave. Has the AtomicFileWriter interface.
+    """
+
+    def __init__(self, store, line, role, voice, content_hash, output_format, text=None):
+        self.store = store
+        self.entry = {"line": line, "role": role, "voice": voice, "hash": content_hash,
+                      "format": output_format, "text": text}
+        self.bytes_written = 0
+        self.chunks = 0
+        self.segment = None
+        self.temp_path = temp_path_for(store.data_path)
+        self._file = open(self.temp_path, "xb")
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self.bytes_written += len(chunk)
+        self.chunks += 1
+
+    def commit(self):
+        self._file.close()
+        try:
+            duration = 0.0
+            if self.bytes_written:
+                with open(self.temp_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    try:
+                        duration = round(audio_duration(data, self.entry["format"]), 3)
+                    except ValueError:
+                        # Not clean MP3 frames; the audio is still stored, just without a duration
+                        duration = None
+            self.segment = self.store._append_file(self.temp_path, self.bytes_written, duration, self.entry)
+        finally:
+            os.remove(self.temp_path)
+
+    close = commit
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+class SegmentStore:
+    """
+    The segment store of one conversation directory.
+
+    Args:
+        directory (str): Conversation output directory holding segments.dat / segments.idx
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.data_path = os.path.join(directory, DATA_NAME)
+        self._lock = threading.Lock()
+        self._segments = {}
+        self._map = None
+        self._map_size = 0
+        self._load_index()
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, INDEX_NAME))
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        with open(self.index_path, "r") as f:
+            for number, raw in enumerate(f):
+                try:
+                    entry = json.loads(raw)
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted append
+                    print(f"Ignoring unreadable entry {number + 1} in {self.index_path}")
+                    continue
+                if "version" in entry:
+                    self.data_path = os.path.join(self.directory, entry.get("data", DATA_NAME))
+                    data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+                    continue
+                if entry.get("deleted"):
+                    self._segments.pop(entry["line"], None)
+                    continue
+                segment = Segment(**{field: entry.get(field) for field in Segment._fields})
+                if segment.offset + segment.length <= data_size:
+                    self._segments[segment.line] = segment
+
+    def _write_header(self, f, data_name):
+        f.write(json.dumps({"version": INDEX_VERSION, "data": data_name}) + "\n")
+
+    def _append_entries(self, entries):
+        new_index = not os.path.exists(self.index_path)
+        with open(self.index_path, "a") as index:
+            if new_index:
+                self._write_header(index, os.path.basename(self.data_path))
+            for entry in entries:
+                index.write(json.dumps(entry) + "\n")
+
+    def _append_file(self, path, length, duration, entry):
+        """
+        Appends the audio in `path` to the data file, then its index entry.
+        """
+        with self._lock:
+            with open(self.data_path, "ab") as data, open(path, "rb") as source:
+                offset = data.tell()
+                shutil.copyfileobj(source, data)
+            segment = Segment(offset=offset, length=length, duration=duration, **entry)
+            self._append_entries([segment._asdict()])
+            self._segments[segment.line] = segment
+            return segment
+
+    def renumber(self, moves):
+        """
+        Gives existing segments new line numbers without copying audio.
+
+        Args:
+            moves (dict): {new line: old line}; all old lines are read before any is replaced,
+                so lines can swap places
+        """
+        with self._lock:
+            moved = [self._segments[old]._replace(line=new) for new, old in moves.items()]
+            self._append_entries([segment._asdict() for segment in moved])
+            for segment in moved:
+                self._segments[segment.line] = segment
+
+    def link(self, line, segment, role, text, content_hash):
+        """
+        Gives line `line` the audio of `segment`, e.g. for a repeat of a line
+        that is already stored, without copying it.
+        """
+        with self._lock:
+            linked = segment._replace(line=line, role=role, text=text, hash=content_hash)
+            self._append_entries([linked._asdict()])
+            self._segments[line] = linked
+            return linked
+
+    def delete(self, lines):
+        """
+        Removes lines from the index. Their bytes stay in the data file until `compact`.
+        """
+        with self._lock:
+            lines = [line for line in lines if line in self._segments]
+            self._append_entries([{"line": line, "deleted": True} for line in lines])
+            for line in lines:
+                del self._segments[line]
+
+    def writer(self, line, role, voice, content_hash, output_format, text=None):
+        """
+        A SegmentWriter for line `line` (1-based); the segment replaces any earlier one for that line.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        return SegmentWriter(self, line, role, voice, content_hash, output_format, text)
+
+    def append(self, line, role, voice, data, content_hash=None, output_format=None, text=None):
+        with self.writer(line, role, voice, content_hash, output_format, text) as writer:
+            writer.write(data)
+        return writer.segment
+
+    def location(self, line):
+        """How a line is referred to in messages and LineJob.filename, e.g. out/segments.dat#3."""
+        return f"{self.data_path}#{line}"
+
+    def get(self, line):
+        return self._segments.get(line)
+
+    def segments(self):
+        """
+        The current segment of every line, in line order.
+        """
+        with self._lock:
+            return [self._segments[line] for line in sorted(self._segments)]
+
+    def _view(self, end):
+        """
+        A memoryview of the data file covering at least `end` bytes, remapped only when the file has grown.
+        """
+        with self._lock:
+            if self._map is None or self._map_size < end:
+                with open(self.data_path, "rb") as f:
+                    self._map = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                self._map_size = len(self._map)
+            return self._map
+
+    def read(self, segment):
+        """
+        The audio of `segment` as a zero-copy memoryview of the mapped data file.
+        """
+        end = segment.offset + segment.length
+        return self._view(end)[segment.offset:end]
+
+    def iter_chunks(self, segment, chunk_size=READ_CHUNK_SIZE):
+        """
+        Yields the audio of `segment` in chunks, like a synthesis stream.
+        """
+        view = self.read(segment)
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+
+    def garbage_bytes(self):
+        """Bytes in the data file no longer referenced by the index."""
+        if not os.path.exists(self.data_path):
+            return 0
+        # Linked lines share their bytes, so each range counts once
+        ranges = {(s.offset, s.length) for s in self._segments.values()}
+        return os.path.getsize(self.data_path) - sum(length for _, length in ranges)
+
+    def compact(self):
+        """
+        Rewrites the store with only the current segments, in line order.
+
+        The new data file gets a new name and the index is swapped atomically
+        to point at it, so a crash at any point leaves a consistent store, and
+        readers that still have the old file mapped keep working.
+        """
+        with self._lock:
+            segments = [self._segments[line] for line in sorted(self._segments)]
+            old_data = self.data_path
+            new_name = f"segments.{os.urandom(4).hex()}.dat"
+            new_data = os.path.join(self.directory, new_name)
+            compacted, offset, moved = [], 0, {}
+            with open(old_data, "rb") as source, open(new_data, "xb") as data:
+                for segment in segments:
+                    # Linked lines keep sharing one copy
+                    new_offset = moved.get((segment.offset, segment.length))
+                    if new_offset is None:
+                        source.seek(segment.offset)
+                        data.write(source.read(segment.length))
+                        new_offset = moved[segment.offset, segment.length] = offset
+                        offset += segment.length
+                    compacted.append(segment._replace(offset=new_offset))
+            temp_index = temp_path_for(self.index_path)
+            with open(temp_index, "x") as index:
+                self._write_header(index, new_name)
+                for segment in compacted:
+                    index.write(json.dumps(segment._asdict()) + "\n")
+            os.replace(temp_index, self.index_path)
+            self.data_path = new_data
+            self._segments = {segment.line: segment for segment in compacted}
+            self._map, self._map_size = None, 0
+        os.remove(old_data)
+
+    def compact_if_wasteful(self, ratio=COMPACT_GARBAGE_RATIO):
+        """
+        Compacts the store if more than `ratio` of its data file is garbage.
+
+        Returns:
+            int: bytes reclaimed (0 if the store was left alone)
+        """
+        garbage = self.garbage_bytes()
+        if not garbage or garbage <= ratio * os.path.getsize(self.data_path):
+            return 0
+        self.compact()
+        return garbage
+
+    def stats(self):
+        return {
+            "segments": len(self._segments),
+            "duration_seconds": round(sum(s.duration or 0 for s in self._segments.values()), 3),
+            "data_bytes": os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0,
+            "garbage_bytes": self.garbage_bytes(),
+        }
+
+
+def compact_stores(directories, ratio=COMPACT_GARBAGE_RATIO):
+    """
+    Compacts the segment stores in `directories` that are mostly garbage
+    (see SegmentStore.compact_if_wasteful) and prints what was reclaimed
+    and what is left.
+    """
+    compacted = reclaimed = garbage = 0
+    for directory in directories:
+        if not SegmentStore.exists(directory):
+            continue
+        store = SegmentStore(directory)
+        freed = store.compact_if_wasteful(ratio)
+        if freed:
+            compacted += 1
+            reclaimed += freed
+        garbage += store.garbage_bytes()
+    if compacted or garbage:
+        print(f"Segment store: {compacted} compacted, {reclaimed} bytes reclaimed, "
+              f"{garbage} bytes of superseded audio left")
@@ -1,70 +1,68 @@
 import os
-import json
 import time
-import pyaudio
-import wave
-import io
-import tempfile
-from elevenlabs import generate, set_api_key
-from elevenlabs.api import Voices
-from dotenv import load_dotenv
-
-# Load API key from .env file
-load_dotenv()
-api_key = os.getenv("ELEVENLABS_API_KEY")
-
-if not api_key:
-    print("Error: API key not found. Please add your ElevenLabs API key to a .env file.")
-    print("ELEVENLABS_API_KEY=your_api_key_here")
-    exit(1)
-
-# Set the API key
-set_api_key(api_key)
+import argparse
+from config import require_api_key
+from conversation import ConversationFile, as_line, print_conversation, read_conversation_file
+from audio_cache import cache_key, get_default_cache
+from rate_limiter import get_default_limiter
+from metrics import get_default_metrics
+from voice_catalog import get_default_catalog
+from dedup import DedupIndex
+from audio_playback import GapTracker, NullSink, PyAudioSink, play_stream
+from audio_writer import open_writer
+from metrics import StreamTimer
+from stream_tee import BackgroundSink, StreamTee
+from pcm_audio import DEFAULT_OUTPUT_FORMAT, pcm_rate
+from segment_store import SegmentStore
+from stream_hub import StreamHub
+from text_segmenter import DEFAULT_SEGMENT_CHARS
+from synthesis import DEFAULT_LOOKAHEAD, SynthesisEngine, add_synthesis_arguments, audio_filename, lookahead, print_engine_stats
 
 class LiveConversationPlayer:
-    def __init__(self):
-        # Initialize PyAudio
-        self.p = pyaudio.PyAudio()
-        self.voices = self.get_available_voices()
+    def __init__(self, null_sink=False, segment_chars=DEFAULT_SEGMENT_CHARS, output_format=DEFAULT_OUTPUT_FORMAT,
+                 dedup=True):
+        self.null_sink = null_sink
+        self.dedup = dedup
         self.conversation = []
         self.agent_voice = None
         self.customer_voice = None
         self.chunk_size = 1024
         self.sample_width = 2  # 16-bit audio
         self.channels = 1  # Mono
-        self.rate = 44100  # Sample rate
+        # With a PCM output format the API sends samples the sound card can play as they are
+        self.pcm = pcm_rate(output_format) is not None
+        self.rate = pcm_rate(output_format) or 44100  # Sample rate
+        self.engine = SynthesisEngine(cache=get_default_cache(), limiter=get_default_limiter(),
+                                      segment_chars=segment_chars, output_format=output_format)
+        self.metrics = get_default_metrics()
+        
+        if null_sink:
+            # Test mode: discard audio at the real-time rate and report latency/underruns
+            self.p = None
+            self.sink = NullSink(self.rate, self.channels, self.sample_width, self.chunk_size)
+        else:
+            # Initialize PyAudio (imported here so headless and null-sink runs don't need it)
+            import pyaudio
+            self.p = pyaudio.PyAudio()
+            self.sink = PyAudioSink(self.p, self.rate, self.channels, self.sample_width, self.chunk_size)
     
+    @property
+    def voices(self):
+        return get_default_catalog().all()
+
     def get_available_voices(self):
-        try:
-            return Voices.from_api()
-        except Exception as e:
-            print(f"Error getting voices: {e}")
-            return []
+        return self.voices
     
     def load_conversation_from_file(self, filename="conversation.json"):
-        try:
-            with open(filename, "r") as f:
-                self.conversation = json.load(f)
-            
-            print(f"\nConversation loaded from {filename}")
-            self.print_conversation()
-            return True
-        except FileNotFoundError:
-            print(f"File {filename} not found.")
-            return False
-        except json.JSONDecodeError:
-            print(f"Error decoding JSON from {filename}.")
+        conversation = read_conversation_file(filename)
+        if conversation is None:
             return False
+        self.conversation = conversation
+        self.print_conversation()
+        return True
     
     def print_conversation(self):
-        if not self.conversation:
-            print("No conversation to display.")
-            return
-        
-        print("\nCurrent Conversation:")
-        print("--------------------")
-        for i, line in enumerate(self.conversation):
-            print(f"{i+1}. {line['role'].capitalize()}: {line['text']}")
+        print_conversation(self.conversation)
     
     def select_voices(self):
         if not self.voices:
@@ -104,52 +102,30 @@ class LiveConversationPlayer:
         
         print(f"\nSelected voices: Agent = {self.agent_voice.name}, Customer = {self.customer_voice.name}")
     
-    def play_audio_stream(self, audio_stream):
+    def play_audio_stream(self, audio_stream, pcm=None):
         """
-        Plays audio directly from the stream in real-time
+        Plays audio directly from the stream in real-time.
+        MP3 chunks are decoded incrementally and played as soon as the first frames arrive;
+        PCM chunks are played without decoding.
         """
-        # We'll use a temporary file to collect the audio chunks
-        # This is because the audio chunks from ElevenLabs may not be in a format directly playable by PyAudio
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-            temp_filename = temp_file.name
-        
-        # First, collect all audio chunks
-        audio_data = bytes()
-        for chunk in audio_stream:
-            print(".", end="", flush=True)
-            audio_data += chunk
-        
-        # Save to temporary WAV file for playback
-        with open(temp_filename, 'wb') as f:
-            f.write(audio_data)
-        
-        # Open the temporary file for playback
-        with wave.open(temp_filename, 'rb') as wf:
-            # Get basic info
-            sample_width = wf.getsampwidth()
-            channels = wf.getnchannels()
-            rate = wf.getframerate()
-            
-            # Open stream
-            stream = self.p.open(format=self.p.get_format_from_width(sample_width),
-                                 channels=channels,
-                                 rate=rate,
-                                 output=True)
-            
-            # Read and play data
-            data = wf.readframes(self.chunk_size)
-            while data:
-                stream.write(data)
-                data = wf.readframes(self.chunk_size)
-            
-            # Stop and close the stream
-            stream.stop_stream()
-            stream.close()
-        
-        # Clean up temporary file
-        os.unlink(temp_filename)
+        stats = play_stream(audio_stream, self.sink,
+                            rate=self.rate, channels=self.channels, sample_width=self.sample_width,
+                            on_chunk=lambda chunk: print(".", end="", flush=True),
+                            pcm=self.pcm if pcm is None else pcm)
+        if self.null_sink:
+            print(f" [{stats}]", end="")
+        return stats
     
-    def play_conversation(self, save_dir=None):
+    def voice_for(self, role):
+        # Select voice based on role
+        return self.agent_voice if role == "agent" else self.customer_voice
+    
+    def play_conversation(self, save_dir=None, lookahead_depth=DEFAULT_LOOKAHEAD, silence=0.5):
+        """
+        Plays the conversation while the next `lookahead_depth` lines are
+        synthesized in the background, so the gap between turns is just
+        `silence` seconds instead of a full request round-trip.
+        """
         if not self.conversation:
             print("No conversation to play. Please load a conversation first.")
             return
@@ -164,73 +140,135 @@ class LiveConversationPlayer:
         
         print("\nPlaying conversation...\n")
         
-        for i, line in enumerate(self.conversation):
-            role = line["role"]
-            text = line["text"]
-            
-            # Select voice based on role
-            voice = self.agent_voice if role == "agent" else self.customer_voice
+        # Per-line request timers, reported once the line has played
+        timers = {}
+        # Repeats of a line (same voice, same words) share its request: one still
+        # in flight is joined, one that has finished is served from the cache
+        dedup_index = DedupIndex() if self.dedup else None
+        hub = StreamHub()
+        
+        def lines():
+            # Runs on this thread as lookahead pulls lines, so repeats are matched in script order
+            for i, line in enumerate(self.conversation):
+                # A plain list of {"role", "text"} dicts works too
+                line = as_line(line, i + 1)
+                voice = self.voice_for(line.role)
+                spoken = line.text
+                if dedup_index is not None:
+                    spoken = dedup_index.add(line.text, voice, line.text) or line.text
+                yield i, line, voice, spoken
+        
+        def open_stream(item):
+            i, _, voice, spoken = item
+            # Generate audio using streaming (served from the cache when possible)
+            if dedup_index is None:
+                audio_stream = self.engine.stream(spoken, voice)
+            else:
+                key = cache_key(spoken, voice, self.engine.model, self.engine.output_format)
+                audio_stream = hub.subscribe(key, lambda: self.engine.stream(spoken, voice))
+            timers[i] = StreamTimer(audio_stream)
+            return timers[i]
+        
+        gaps = GapTracker()
+        for (i, line, _, _), audio_stream in lookahead(lines(), open_stream, lookahead_depth):
+            role = line.role
+            text = line.text
             
             # Print current line before playing
             print(f"{role.capitalize()}: {text}")
             
             try:
-                # Generate audio using streaming
-                audio_stream = generate(
-                    text=text,
-                    voice=voice,
-                    model="eleven_multilingual_v2",
-                    stream=True
-                )
+                # Tee the stream to disk while it plays, so each line is synthesized only once
+                file_sink = None
+                if save_dir:
+                    filename = audio_filename(save_dir, i, role, text, self.engine.output_format)
+                    file_sink = BackgroundSink(open_writer(filename, self.engine.output_format))
+                    audio_stream = StreamTee(audio_stream, [file_sink])
                 
                 # Play the audio stream in real-time
                 print("Playing: ", end="", flush=True)
-                self.play_audio_stream(audio_stream)
+                stats = self.play_audio_stream(audio_stream)
+                gaps.line_played(stats)
                 print(" Done.")
+                self.metrics.record("playback", line=i + 1, role=role, ok=True, first_audio=stats.first_audio_latency,
+                                    underruns=stats.underruns, **timers.pop(i).fields())
                 
-                # Save audio if directory specified
-                if save_dir:
-                    # Re-generate the audio for saving (since we already consumed the stream)
-                    audio_stream = generate(
-                        text=text,
-                        voice=voice,
-                        model="eleven_multilingual_v2",
-                        stream=True
-                    )
-                    
-                    # Create filename for saving
-                    filename = f"{save_dir}/{i+1:02d}_{role}_{text[:20].replace(' ', '_').replace('?', '').replace('!', '')}.mp3"
-                    
-                    # Initialize audio data for saving
-                    audio_data = bytes()
-                    for chunk in audio_stream:
-                        audio_data += chunk
-                    
-                    # Save the collected audio data
-                    with open(filename, 'wb') as f:
-                        f.write(audio_data)
-                    
+                if file_sink:
+                    file_sink.join()
                     print(f"Saved: {filename}")
                 
-                # Small delay between lines
-                time.sleep(0.5)
+                # Pause between lines
+                time.sleep(silence)
                 
             except Exception as e:
                 print(f"Error processing line {i+1}: {e}")
+                gaps.reset_turn()
+                timer = timers.pop(i, None)
+                self.metrics.record("playback", line=i + 1, role=role, ok=False, **(timer.fields() if timer else {}))
         
         print("\nConversation playback complete!")
+        print(f"Lookahead {lookahead_depth}, silence {silence * 1000:.0f} ms: {gaps.summary()}")
+        print_engine_stats(self.engine, dedup_index, self.metrics)
+        return gaps
+    
+    def replay_segment_store(self, directory, silence=0.5):
+        """
+        Plays a conversation saved with --segment_store straight from its
+        store: every turn is sliced from the mapped file, no API calls.
+        """
+        if not SegmentStore.exists(directory):
+            print(f"No segment store found in {directory}.")
+            return
+        store = SegmentStore(directory)
+        print(f"\nReplaying {len(store.segments())} lines from {store.data_path}...\n")
+        gaps = GapTracker()
+        for segment in store.segments():
+            print(f"{segment.role.capitalize()}: {segment.text}")
+            if segment.pcm and pcm_rate(segment.format) != self.rate:
+                print(f"Skipping line {segment.line}: {segment.format} doesn't match the {self.rate} Hz output.")
+                gaps.reset_turn()
+                continue
+            print("Playing: ", end="", flush=True)
+            stats = self.play_audio_stream(store.iter_chunks(segment), pcm=segment.pcm)
+            gaps.line_played(stats)
+            print(" Done.")
+            time.sleep(silence)
+        print(f"\nReplay complete: {gaps.summary()}")
+        return gaps
     
     def cleanup(self):
         # Terminate PyAudio instance
-        self.p.terminate()
+        if self.p:
+            self.p.terminate()
 
 def main():
     print("ElevenLabs Live Conversation Player")
     print("=================================")
     
-    player = LiveConversationPlayer()
+    parser = argparse.ArgumentParser(description="Play conversations with real-time streaming")
+    parser.add_argument("--null_sink", action="store_true",
+                        help="Test mode: play into a null sink and report first-audio latency and underruns")
+    parser.add_argument("--lookahead", type=int, default=DEFAULT_LOOKAHEAD,
+                        help="Number of upcoming lines to synthesize while the current one plays")
+    parser.add_argument("--silence", type=int, default=500, help="Silence between lines in milliseconds")
+    parser.add_argument("--conversation",
+                        help="Play this file (JSON array or JSON Lines) right away, reading it as playback goes")
+    add_synthesis_arguments(parser)
+    args = parser.parse_args()
+    require_api_key()
+    
+    player = LiveConversationPlayer(null_sink=args.null_sink, segment_chars=args.segment_chars,
+                                    output_format=args.output_format, dedup=not args.no_dedup)
     
     try:
+        if args.conversation:
+            # Playback starts as soon as the first lines are parsed, however large the file
+            player.conversation = ConversationFile(args.conversation)
+            try:
+                player.play_conversation(None, args.lookahead, args.silence / 1000)
+            except (OSError, ValueError) as e:
+                print(f"\nStopped reading {args.conversation}: {e}")
+        
         # Menu loop
         while True:
             print("\nMenu:")
@@ -238,9 +276,10 @@ def main():
             print("2. Select voices")
             print("3. Play conversation (live streaming)")
             print("4. Play and save conversation")
-            print("5. Exit")
+            print("5. Replay a saved segment store")
+            print("6. Exit")
             
-            choice = input("\nEnter your choice (1-5): ")
+            choice = input("\nEnter your choice (1-6): ")
             
             if choice == "1":
                 filename = input("Enter filename to load (default: conversation.json): ") or "conversation.json"
@@ -248,11 +287,14 @@ def main():
             elif choice == "2":
                 player.select_voices()
             elif choice == "3":
-                player.play_conversation()
+                player.play_conversation(None, args.lookahead, args.silence / 1000)
             elif choice == "4":
                 save_dir = input("Enter directory to save audio files (default: audio_output): ") or "audio_output"
-                player.play_conversation(save_dir)
+                player.play_conversation(save_dir, args.lookahead, args.silence / 1000)
             elif choice == "5":
+                directory = input("Enter the conversation directory (default: audio_output): ") or "audio_output"
+                player.replay_segment_store(directory, args.silence / 1000)
+            elif choice == "6":
                 print("Exiting program. Goodbye!")
                 break
             else:
@@ -0,0 +1,162 @@
+import threading
+
+
+# Chunks of a shared stream are kept for late joiners up to this size; past it, chunks
+# every subscriber has read are dropped and new requests get a stream of their own
+MAX_REPLAY_BYTES = 4 * 1024 * 1024
+
+
+class SharedStream:
+    """
+    One upstream audio stream fanned out to any number of subscribers.
+
+    A background thread pulls chunks from `open_stream()` into a buffer.
+    Each subscriber iterates over that buffer from the start, so a listener
+    that joins late first replays what was already received and then
+    follows the live stream. The upstream keeps going even if every
+    subscriber disconnects, so the cache entry it writes still completes.
+
+    The buffer holds at most about `max_replay_bytes` plus what the slowest
+    subscriber hasn't read yet. Once chunks have been dropped, the stream
+    can't be replayed from the start and `subscribe` returns None.
+
+    Args:
+        open_stream (callable): Returns the upstream chunk iterator
+        max_replay_bytes (int): Buffer size from which read chunks are dropped
+    """
+
+    def __init__(self, open_stream, on_done=None, max_replay_bytes=MAX_REPLAY_BYTES):
+        self.chunks = []
+        self.bytes = 0
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.max_replay_bytes = max_replay_bytes
+        # Absolute index of chunks[0], and of the next chunk of every subscriber
+        self._base = 0
+        self._buffered = 0
+        self._positions = {}
+        self._on_done = on_done
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._pump, args=(open_stream,), daemon=True)
+        self._thread.start()
+
+    def _pump(self, open_stream):
+        try:
+            for chunk in open_stream():
+                with self._cond:
+                    self.chunks.append(chunk)
+                    self.bytes += len(chunk)
+                    self._buffered += len(chunk)
+                    self._trim()
+                    self._cond.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            # Unregister before waking subscribers, so a new request doesn't join a finished stream
+            if self._on_done:
+                self._on_done(self)
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def _trim(self):
+        """Drops the chunks every subscriber has read, once the buffer is over its limit."""
+        # Nothing is dropped before the first subscriber (the one that started the stream) is in
+        if self._buffered <= self.max_replay_bytes or not self.subscribers:
+            return
+        end = self._base + len(self.chunks)
+        drop = min(self._positions.values(), default=end) - self._base
+        if drop > 0:
+            self._buffered -= sum(len(chunk) for chunk in self.chunks[:drop])
+            del self.chunks[:drop]
+            self._base += drop
+
+    def subscribe(self):
+        """
+        Returns an iterator over every chunk of the stream from the beginning,
+        or None if the start has already been dropped from the buffer.
+
+        The iterator raises whatever the upstream raised, once the buffered
+        chunks are delivered.
+        """
+        with self._cond:
+            if self._base:
+                return None
+            self.subscribers += 1
+            token = object()
+            self._positions[token] = 0
+        return self._follow(token)
+
+    def _follow(self, token):
+        try:
+            while True:
+                with self._cond:
+                    index = self._positions[token]
+                    while index - self._base >= len(self.chunks) and not self.done:
+                        self._cond.wait()
+                    pending = self.chunks[index - self._base:]
+                    finished = self.done
+                for chunk in pending:
+                    yield chunk
+                with self._cond:
+                    self._positions[token] = index = index + len(pending)
+                    self._trim()
+                    if finished and index - self._base >= len(self.chunks):
+                        break
+        finally:
+            with self._cond:
+                del self._positions[token]
+                self._trim()
+        if self.error is not None:
+            raise self.error
+
+
+class StreamHub:
+    """
+    Coalesces identical in-flight requests onto one SharedStream.
+
+    Requests with the same key (text, voice and model) that arrive while a
+    stream for that key is still running share its upstream call instead of
+    starting their own. Finished streams are dropped from the hub. A later
+    request for the same line starts a new stream, which is normally served
+    from the audio cache.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.upstream_calls = 0
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key, open_stream):
+        """
+        Returns a chunk iterator for `key`, starting `open_stream()` only if
+        no stream for that key is already in flight.
+        """
+        with self._lock:
+            self.requests += 1
+            shared = self._streams.get(key)
+            # A stream whose start was already dropped can't be joined; a new one is
+            # normally served from the cache once the first has finished writing it
+            chunks = shared.subscribe() if shared is not None else None
+            if chunks is None:
+                self.upstream_calls += 1
+                shared = SharedStream(open_stream, on_done=lambda s, key=key: self._finished(key, s))
+                self._streams[key] = shared
+                chunks = shared.subscribe()
+        return chunks
+
+    def _finished(self, key, shared):
+        with self._lock:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "upstream_calls": self.upstream_calls,
+                "coalesced": self.requests - self.upstream_calls,
+                "in_flight": len(self._streams),
+            }
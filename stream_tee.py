@@ -0,0 +1,112 @@
+import io
+import queue
+import threading
+
+_END = object()
+
+
+class MemorySink:
+    """Collects chunks in memory; `getvalue()` returns the audio once closed."""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+
+    def write(self, chunk):
+        self._buffer.write(chunk)
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class BackgroundSink:
+    """
+    Runs another sink on its own thread behind an unbounded queue.
+
+    `write` never blocks, so a slow disk can't stall the consumer driving the
+    tee (e.g. playback). The queue holds at most one utterance, which keeps
+    memory bounded in practice. Errors from the wrapped sink are kept and
+    re-raised by `join`.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                self.sink.close()
+                return
+            if item is None:
+                self.sink.abort()
+                return
+            try:
+                self.sink.write(item)
+            except Exception as e:
+                self.error = e
+                self.sink.abort()
+                # Drain the remaining chunks without writing them
+                while self._queue.get() not in (_END, None):
+                    pass
+                return
+
+    def write(self, chunk):
+        self._queue.put(chunk)
+
+    def close(self):
+        self._queue.put(_END)
+
+    def abort(self):
+        self._queue.put(None)
+
+    def join(self):
+        """
+        Waits until everything has been written, then re-raises any write error.
+        """
+        self._thread.join()
+        if self.error:
+            raise self.error
+
+
+class StreamTee:
+    """
+    Fans one chunk iterator out to several consumers.
+
+    The tee itself is iterated by the primary consumer (the playback sink)
+    and every chunk is also handed to each of `sinks`. When the source is
+    exhausted the sinks are closed; if iteration fails or is abandoned they
+    are aborted instead, so no truncated files are left behind.
+
+    Args:
+        source (iterable): Audio chunk iterator, e.g. from SynthesisEngine.stream
+        sinks (list): Objects with write(chunk), close() and abort()
+    """
+
+    def __init__(self, source, sinks):
+        self.source = source
+        self.sinks = list(sinks)
+
+    def __iter__(self):
+        completed = False
+        try:
+            for chunk in self.source:
+                for sink in self.sinks:
+                    sink.write(chunk)
+                yield chunk
+            completed = True
+        finally:
+            for sink in self.sinks:
+                if completed:
+                    sink.close()
+                else:
+                    sink.abort()
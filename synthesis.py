@@ -0,0 +1,464 @@
+import os
+import time
+import queue
+import shutil
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from audio_cache import cache_key, print_cache_stats, voice_identity
+from audio_writer import format_rate, peak_rss_bytes, temp_path_for, write_stream
+from dedup import print_dedup_stats
+from http_client import print_http_stats
+from metrics import StreamTimer, print_metrics_summary
+from mp3_frames import iter_stream_frames
+from pcm_audio import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS, PCM_SAMPLE_WIDTH, crossfade_streams, file_extension, pcm_rate
+from rate_limiter import limited_stream, print_limiter_stats
+from text_segmenter import DEFAULT_SEGMENT_CHARS, split_text
+from tts_backend import DEFAULT_MODEL, get_default_backend
+
+DEFAULT_WORKERS = 4
+DEFAULT_LOOKAHEAD = 2
+# Overlap between the segments of a long line in a PCM format
+DEFAULT_SEGMENT_CROSSFADE_MS = 10
+# Jobs queued per worker by SynthesisEngine.run before it waits for the oldest one
+RUN_QUEUE_PER_WORKER = 8
+
+_END = object()
+
+
+def audio_filename(output_dir, index, role, text, output_format=DEFAULT_OUTPUT_FORMAT):
+    """
+    Builds the output filename for a conversation line, e.g. 01_agent_Thank_you_for_call.mp3
+    (.wav for PCM output formats)
+    """
+    snippet = text[:20].replace(' ', '_')
+    # Drop characters that aren't allowed (or are awkward) in filenames
+    snippet = "".join(c for c in snippet if c not in '?!/\\:*"<>|')
+    return f"{output_dir}/{index+1:02d}_{role}_{snippet}.{file_extension(output_format)}"
+
+
+class LineJob:
+    """
+    A single conversation line waiting to be synthesized.
+
+    The audio goes to `filename`, or is appended to `store` (a SegmentStore)
+    when one is given.
+    """
+
+    def __init__(self, index, role, text, voice, filename, store=None):
+        self.index = index
+        self.role = role
+        self.text = text
+        self.voice = voice
+        self.filename = filename
+        self.store = store
+
+
+class SavedLine(namedtuple("SavedLine", ["index", "filename", "store"])):
+    """
+    Where a finished line's audio was saved: all that repeats of it need
+    (see SynthesisEngine.copy_audio), without its text or voice.
+    """
+
+    @classmethod
+    def of(cls, job):
+        return cls(job.index, job.filename, job.store)
+
+
+class LineResult:
+    """
+    Outcome of synthesizing one line: either a saved file or an error.
+    For a duplicate line, `original` is the SavedLine whose audio was copied.
+    """
+
+    def __init__(self, job, bytes_written=0, elapsed=0.0, error=None, original=None):
+        self.job = job
+        self.bytes_written = bytes_written
+        self.elapsed = elapsed
+        self.error = error
+        self.original = original
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes_written / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class SynthesisEngine:
+    """
+    Synthesizes conversation lines on a bounded pool of worker threads.
+
+    Lines don't depend on each other, so up to `workers` requests are kept in
+    flight at once. Results are always reported in script order and a failing
+    line never stops the rest of the run.
+
+    Args:
+        workers (int): Maximum number of concurrent synthesis requests
+        generate_fn (callable): Function (text, voice, model, output_format) -> iterator of
+            audio chunks, e.g. a TTSBackend (default: the backend selected by ELEVENLABS_BACKEND)
+        model (str): ElevenLabs model id
+        cache (AudioCache): Optional read-through cache; hits skip the network
+        limiter (AdaptiveRateLimiter): Optional rate limiter for requests that reach the API
+        segment_chars (int): Lines longer than this are synthesized as several
+            shorter segments (see text_segmenter); 0 or None disables splitting
+        metrics (MetricsRecorder): Optional recorder for per-line timings
+        output_format (str): Audio format to request, e.g. "mp3_44100_128" or "pcm_44100"
+            (raw 16-bit PCM, saved as WAV; see pcm_audio)
+        segment_crossfade_ms (int): Milliseconds over which the segments of a
+            long line blend into each other in a PCM format; 0 joins them end to end
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, generate_fn=None, model=DEFAULT_MODEL, cache=None, limiter=None,
+                 segment_chars=DEFAULT_SEGMENT_CHARS, metrics=None, output_format=DEFAULT_OUTPUT_FORMAT,
+                 segment_crossfade_ms=DEFAULT_SEGMENT_CROSSFADE_MS):
+        self.workers = max(1, int(workers))
+        self.generate_fn = generate_fn or get_default_backend()
+        self.model = model
+        self.cache = cache
+        self.limiter = limiter
+        self.segment_chars = segment_chars
+        self.metrics = metrics
+        self.output_format = output_format
+        self.segment_crossfade_ms = segment_crossfade_ms
+        # One pooled connection per worker, for backends that keep a connection pool
+        reserve = getattr(self.generate_fn, "reserve_connections", None)
+        if reserve:
+            reserve(self.workers)
+
+    @property
+    def http_client(self):
+        """The backend's pooled HTTP client (see http_client), or None."""
+        return getattr(self.generate_fn, "client", None)
+
+    def _generate(self, text, voice, model):
+        if self.limiter:
+            return limited_stream(self.limiter, lambda: self.generate_fn(text, voice, model, self.output_format))
+        return self.generate_fn(text, voice, model, self.output_format)
+
+    def _stream_segment(self, text, voice):
+        if self.cache:
+            return self.cache.stream(text, voice, self.model, self._generate, self.output_format)
+        return self._generate(text, voice, self.model)
+
+    def _stream_segments(self, segments, voice):
+        # Every segment is requested ahead (up to one per worker) and played back in order,
+        # so the first one streams out while the later ones are still being synthesized
+        streams = (segment_stream for _, segment_stream in
+                   lookahead(segments, lambda segment: self._stream_segment(segment, voice),
+                             depth=min(len(segments) - 1, self.workers)))
+        rate = pcm_rate(self.output_format)
+        if rate:
+            overlap = int(rate * self.segment_crossfade_ms / 1000) * PCM_SAMPLE_WIDTH
+            yield from crossfade_streams(streams, overlap)
+            return
+        # Each segment is a complete MP3 with its own ID3 tag and Xing header;
+        # keep only the audio frames so the line is a single clean stream
+        for segment_stream in streams:
+            for _, frames in iter_stream_frames(segment_stream):
+                yield frames
+
+    def segments(self, text):
+        """The pieces `text` is synthesized (and cached) in."""
+        return split_text(text, self.segment_chars) if self.segment_chars else [text]
+
+    def cache_keys(self, text, voice):
+        """Cache keys of the pieces of a line, in order."""
+        return [cache_key(segment, voice, self.model, self.output_format) for segment in self.segments(text)]
+
+    def stream(self, text, voice):
+        """
+        Returns an iterator of audio chunks for a single line of text.
+
+        Long lines are split into segments that are synthesized concurrently
+        and cached individually. MP3 segments are joined on frame boundaries,
+        without their per-segment ID3 tags and Xing headers; PCM segments
+        blend into each other over `segment_crossfade_ms`.
+        """
+        segments = self.segments(text)
+        if len(segments) == 1:
+            return self._stream_segment(text, voice)
+        return self._stream_segments(segments, voice)
+
+    def render(self, job, on_chunk=None):
+        """
+        Synthesizes one job and writes it to its output file.
+        Errors are captured on the returned LineResult rather than raised.
+        """
+        start = time.perf_counter()
+        timer = None
+        try:
+            timer = StreamTimer(self.stream(job.text, job.voice))
+            # Chunks go straight to disk; the file appears only once it is complete
+            report = (lambda chunk: on_chunk(job, chunk)) if on_chunk else None
+            writer = write_stream(timer, job.filename, report, self.output_format, self._store_writer(job))
+            result = LineResult(job, writer.bytes_written, time.perf_counter() - start)
+        except Exception as e:
+            result = LineResult(job, elapsed=time.perf_counter() - start, error=e)
+        if self.metrics:
+            self.metrics.record("synthesis", line=job.index + 1, role=job.role, ok=result.ok,
+                                **(timer.fields() if timer else {}))
+        return result
+
+    def _store_writer(self, job):
+        if job.store is None:
+            return None
+        voice_id = voice_identity(job.voice)[0] if job.voice is not None else None
+        return job.store.writer(job.index + 1, job.role, voice_id,
+                                cache_key(job.text, job.voice, self.model, self.output_format),
+                                self.output_format, job.text)
+
+    def _render_and_notify(self, job, on_chunk, on_complete):
+        result = self.render(job, on_chunk)
+        on_complete(result)
+        return result
+
+    def copy_audio(self, source, job):
+        """
+        Gives `job` the audio already saved for `source` (a job or SavedLine)
+        of a line with the same voice and speech. Within one segment store the new line points at the
+        same bytes; otherwise the audio is copied.
+
+        Returns:
+            int: bytes of audio, or None if `source` and `job` aren't saved the
+            same way (a file and a segment store) and the audio can't be copied
+        """
+        if (source.store is None) != (job.store is None):
+            return None
+        if job.store is None:
+            temp = temp_path_for(job.filename)
+            shutil.copyfile(source.filename, temp)
+            os.replace(temp, job.filename)
+            return os.path.getsize(job.filename)
+        segment = source.store.get(source.index + 1)
+        content_hash = cache_key(job.text, job.voice, self.model, self.output_format)
+        if job.store is source.store:
+            return job.store.link(job.index + 1, segment, job.role, job.text, content_hash).length
+        with self._store_writer(job) as writer:
+            writer.write(source.store.read(segment))
+        return writer.bytes_written
+
+    def _render_duplicate(self, original, job, on_complete):
+        start = time.perf_counter()
+        source = SavedLine.of(original.job)
+        if not original.ok:
+            result = LineResult(job, error=original.error, original=source)
+        else:
+            try:
+                bytes_written = self.copy_audio(source, job)
+                if bytes_written is None:
+                    result = self.render(job)
+                else:
+                    result = LineResult(job, bytes_written, time.perf_counter() - start, original=source)
+            except Exception as e:
+                result = LineResult(job, elapsed=time.perf_counter() - start, error=e, original=source)
+        if on_complete:
+            on_complete(result)
+        return result
+
+    def _after(self, original_future, job, on_complete):
+        """A future for the result of duplicate `job`, filled in once the line it repeats is done."""
+        future = Future()
+
+        def fan_out(done):
+            try:
+                future.set_result(self._render_duplicate(done.result(), job, on_complete))
+            except BaseException as e:
+                future.set_exception(e)
+
+        original_future.add_done_callback(fan_out)
+        return future
+
+    @staticmethod
+    def _track_original(dedup, job, future):
+        """
+        Points repeats of `job` at its future while it is in flight, and at
+        where its audio was saved once it is done, so the index keeps no
+        futures or results of finished lines.
+        """
+        dedup.settle(job.text, job.voice, future)
+
+        def saved(done):
+            if done.exception() is None:
+                result = done.result()
+                dedup.settle(job.text, job.voice, LineResult(SavedLine.of(job), error=result.error))
+
+        future.add_done_callback(saved)
+
+    def run(self, jobs, on_result=None, on_chunk=None, on_complete=None, dedup=None):
+        """
+        Synthesizes all jobs concurrently.
+
+        `jobs` is consumed as the workers make progress, a bounded number of
+        jobs ahead of the oldest unfinished one, so it can be a generator that
+        is still reading its script: synthesis starts with the first job.
+
+        Args:
+            jobs (iterable): LineJob instances
+            on_result (callable): Called with each LineResult, in script order
+            on_chunk (callable): Called with (job, chunk) from worker threads as audio arrives
+            on_complete (callable): Called with each LineResult from its worker thread
+                as soon as it finishes, e.g. to checkpoint progress
+            dedup (DedupIndex): Synthesize each distinct (voice, speech) once; repeats
+                get a copy of the first line's audio when it is done (see dedup).
+                The index holds each first line's future while it is in flight
+                and only its SavedLine afterwards
+
+        Returns:
+            list: LineResult instances in script order
+        """
+        results = []
+
+        def collect(future):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for job in jobs:
+                original = dedup.add(job.text, job.voice, job) if dedup is not None else None
+                if isinstance(original, Future):
+                    pending.append(self._after(original, job, on_complete))
+                elif original is not None:
+                    pending.append(executor.submit(self._render_duplicate, original, job, on_complete))
+                elif on_complete:
+                    pending.append(executor.submit(self._render_and_notify, job, on_chunk, on_complete))
+                else:
+                    pending.append(executor.submit(self.render, job, on_chunk))
+                if dedup is not None and original is None:
+                    self._track_original(dedup, job, pending[-1])
+                if len(pending) > self.workers * RUN_QUEUE_PER_WORKER:
+                    collect(pending.popleft())
+            while pending:
+                collect(pending.popleft())
+        return results
+
+
+class PrefetchedStream:
+    """
+    Downloads an audio stream on a background thread as soon as it is created.
+
+    Iterating it yields the chunks received so far and then waits for the
+    rest, so a line that was prefetched while the previous one was playing
+    can start immediately. Errors from the download are re-raised on iteration.
+    """
+
+    def __init__(self, open_stream):
+        self._chunks = queue.Queue()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._download, args=(open_stream,), daemon=True)
+        self._thread.start()
+
+    def _download(self, open_stream):
+        try:
+            for chunk in open_stream():
+                if self._cancelled.is_set():
+                    return
+                self._chunks.put(chunk)
+            self._chunks.put(_END)
+        except Exception as e:
+            self._chunks.put(e)
+
+    def __iter__(self):
+        while True:
+            item = self._chunks.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+def lookahead(items, open_stream, depth=DEFAULT_LOOKAHEAD):
+    """
+    Yields (item, PrefetchedStream) pairs in order while the next `depth`
+    items are already being synthesized in the background.
+
+    Args:
+        items (iterable): Anything describing a line, e.g. conversation dicts
+        open_stream (callable): Function item -> iterator of audio chunks
+        depth (int): How many upcoming lines to synthesize ahead of the current one
+    """
+    items = iter(items)
+    pending = deque()
+    try:
+        while True:
+            # Keep the current line plus `depth` upcoming lines in flight
+            while len(pending) < depth + 1:
+                item = next(items, _END)
+                if item is _END:
+                    break
+                pending.append((item, PrefetchedStream(lambda item=item: open_stream(item))))
+            if not pending:
+                return
+            yield pending.popleft()
+    finally:
+        for _, stream in pending:
+            stream.cancel()
+
+
+def print_result(result):
+    """
+    Default progress reporter used by the command-line scripts.
+    """
+    job = result.job
+    if result.ok and result.original is not None:
+        print(f"Saved: {job.filename} (same audio as {result.original.filename})")
+    elif result.ok:
+        print(f"Saved: {job.filename} ({result.elapsed:.2f}s, {format_rate(result.bytes_per_second)})")
+    else:
+        print(f"Error generating audio for line {job.index+1}: {result.error}")
+
+
+def print_summary(results, output_dir):
+    failed = [r for r in results if not r.ok]
+    print("\nConversation generation complete!")
+    print(f"{len(results) - len(failed)}/{len(results)} lines saved in '{output_dir}' directory.")
+    peak = peak_rss_bytes()
+    if peak:
+        print(f"Total: {sum(r.bytes_written for r in results)} bytes, peak RSS {peak / (1024 * 1024):.1f} MB")
+    if failed:
+        print("Failed lines: " + ", ".join(str(r.job.index + 1) for r in failed))
+
+
+def add_synthesis_arguments(parser):
+    """
+    Adds the command-line options every synthesizing tool shares:
+    --segment_chars, --output_format and --no_dedup.
+    """
+    parser.add_argument("--segment_chars", type=int, default=DEFAULT_SEGMENT_CHARS,
+                        help="Split lines longer than this many characters into segments synthesized in parallel (0: never)")
+    parser.add_argument("--output_format", default=DEFAULT_OUTPUT_FORMAT, choices=OUTPUT_FORMATS,
+                        help="Audio format to request; pcm_* formats skip MP3 decoding and are saved as WAV")
+    parser.add_argument("--no_dedup", action="store_true",
+                        help="Synthesize repeated lines again instead of reusing the audio of their first occurrence")
+
+
+def print_engine_stats(engine, dedup_index=None, metrics=None):
+    """
+    Prints what a run cost: duplicates reused, cache, rate limiter and HTTP
+    counters, and the timing summary of `metrics` (default: the engine's).
+    """
+    print_dedup_stats(dedup_index)
+    if engine.cache is not None:
+        print_cache_stats(engine.cache)
+    if engine.limiter is not None:
+        print_limiter_stats(engine.limiter)
+    print_http_stats(engine.http_client)
+    metrics = metrics or engine.metrics
+    if metrics is not None:
+        print_metrics_summary(metrics)
+
+
+def ensure_dir(path):
+    # Create output directory if it doesn't exist
+    if path and not os.path.exists(path):
+        os.makedirs(path)
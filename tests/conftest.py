@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the top of the repository, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Never reach the real API or the user's cache from the tests
+os.environ["ELEVENLABS_BACKEND"] = "fake"
+os.environ.setdefault("ELEVENLABS_CACHE_DIR", tempfile.mkdtemp(prefix="elevenlabs-tests-"))
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from conversation import (Conversation, ConversationFormatError, Line, as_line, iter_lines, load_conversation,
+                          print_conversation, save_conversation)
+
+TURNS = [
+    {"role": "agent", "text": "Hello, how can I help? [menu], options"},
+    {"role": "customer", "text": "A \"quoted\" ] bracket, and a comma"},
+    {"role": "agent", "text": "Done – goodbye"},
+]
+
+
+def write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1 << 16])
+def test_iter_lines_array_across_chunk_boundaries(tmp_path, chunk_size):
+    path = write(tmp_path, "script.json", "  \n" + json.dumps(TURNS, indent=4) + "\n")
+    assert list(iter_lines(path, chunk_size=chunk_size)) == [as_line(turn) for turn in TURNS]
+
+
+def test_iter_lines_json_lines(tmp_path):
+    path = write(tmp_path, "script.jsonl", "\n".join(json.dumps(turn) for turn in TURNS) + "\n\n")
+    assert list(iter_lines(path)) == [as_line(turn) for turn in TURNS]
+
+
+@pytest.mark.parametrize("content", ["", "   \n", "[]", " [ ] \n"])
+def test_iter_lines_empty(tmp_path, content):
+    assert list(iter_lines(write(tmp_path, "script.json", content), chunk_size=2)) == []
+
+
+def test_iter_lines_yields_turns_before_a_malformed_one(tmp_path):
+    path = write(tmp_path, "script.json", json.dumps(TURNS[:2] + [{"role": "agent"}]))
+    turns = iter_lines(path, chunk_size=4)
+    assert next(turns) == as_line(TURNS[0])
+    assert next(turns) == as_line(TURNS[1])
+    with pytest.raises(ConversationFormatError, match="turn 3"):
+        next(turns)
+
+
+@pytest.mark.parametrize("content, message", [
+    (json.dumps(TURNS) + " []", "after the conversation array"),
+    (json.dumps(TURNS)[:-1], "unexpected end of file"),
+    (json.dumps(TURNS)[:-1] + ";]", "expected ',' or ']'"),
+    ('[{"role": "agent", "text": "unterminated}]', "turn 1"),
+])
+def test_iter_lines_malformed_array(tmp_path, content, message):
+    with pytest.raises(ConversationFormatError, match=message):
+        list(iter_lines(write(tmp_path, "script.json", content), chunk_size=5))
+
+
+def test_iter_lines_malformed_json_line(tmp_path):
+    path = write(tmp_path, "script.jsonl", json.dumps(TURNS[0]) + "\n{not json}\n")
+    with pytest.raises(ConversationFormatError, match="line 2"):
+        list(iter_lines(path))
+
+
+@pytest.mark.parametrize("name", ["script.json", "script.jsonl"])
+def test_save_and_load_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    save_conversation(Conversation(TURNS), path)
+    conversation = load_conversation(path)
+    assert conversation.to_dicts() == TURNS
+    assert conversation.roles == ["agent", "customer"]
+
+
+def test_save_empty_conversation(tmp_path):
+    path = str(tmp_path / "script.json")
+    save_conversation(Conversation(), path)
+    assert len(load_conversation(path)) == 0
+
+
+def test_line_reads_like_a_dict():
+    line = Line("agent", "Hi")
+    assert (line["role"], line["text"]) == ("agent", "Hi")
+    with pytest.raises(KeyError):
+        line["voice"]
+
+
+def test_print_conversation_accepts_dicts(capsys):
+    print_conversation(TURNS)
+    print_conversation(Conversation(TURNS))
+    out = capsys.readouterr().out
+    assert out.count(TURNS[1]["text"]) == 2
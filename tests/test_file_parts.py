@@ -0,0 +1,96 @@
+import io
+
+import pytest
+
+from file_parts import PartsReader
+
+
+@pytest.fixture
+def parts(tmp_path):
+    path = tmp_path / "segments.dat"
+    path.write_bytes(b"0123456789")
+    # "hdr" + "2345" + "" + "xyz" + "89"
+    return [b"hdr", (str(path), 2, 4), b"", (str(path), 0, 0), b"xyz", (str(path), 8, 2)]
+
+
+EXPECTED = b"hdr2345xyz89"
+
+
+def test_read_everything(parts):
+    with PartsReader(parts) as reader:
+        assert reader.size == len(EXPECTED)
+        assert reader.read() == EXPECTED
+
+
+def test_small_reads_cross_part_boundaries(parts):
+    with io.BufferedReader(PartsReader(parts), buffer_size=2) as reader:
+        assert b"".join(iter(lambda: reader.read(1), b"")) == EXPECTED
+
+
+@pytest.mark.parametrize("start", range(len(EXPECTED) + 2))
+def test_seek_then_read(parts, start):
+    # Raw reads stop at the end of a part; the buffered reader fills the request
+    with io.BufferedReader(PartsReader(parts)) as reader:
+        assert reader.seek(start) == start
+        assert reader.read(5) == EXPECTED[start:start + 5]
+
+
+def test_seek_relative(parts):
+    with PartsReader(parts) as reader:
+        reader.seek(-2, io.SEEK_END)
+        assert reader.read() == b"89"
+        reader.seek(3)
+        reader.seek(4, io.SEEK_CUR)
+        assert reader.read(3) == b"xyz"
+        with pytest.raises(ValueError):
+            reader.seek(-1)
+
+
+def test_truncated_file_is_an_error(tmp_path):
+    path = tmp_path / "short.dat"
+    path.write_bytes(b"abc")
+    with PartsReader([(str(path), 0, 10)]) as reader:
+        reader.read(3)
+        with pytest.raises(OSError):
+            reader.read(1)
+
+
+@pytest.fixture
+def send(parts):
+    web_ui = pytest.importorskip("web_ui")
+
+    def send(headers=None):
+        with web_ui.app.test_request_context("/", headers=headers or {}):
+            response = web_ui.send_parts(parts, "audio/mpeg", "tag")
+            return response, b"".join(response.response)
+    return send
+
+
+def test_send_parts_whole(send):
+    response, body = send()
+    assert response.status_code == 200
+    assert body == EXPECTED
+    assert response.headers["ETag"] == '"tag"'
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+
+@pytest.mark.parametrize("header, start, end", [("bytes=2-5", 2, 5), ("bytes=5-", 5, 11), ("bytes=-3", 9, 11)])
+def test_send_parts_range(send, header, start, end):
+    response, body = send({"Range": header})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes {start}-{end}/{len(EXPECTED)}"
+    assert body == EXPECTED[start:end + 1]
+
+
+def test_send_parts_unsatisfiable_range(send):
+    from werkzeug.exceptions import RequestedRangeNotSatisfiable
+    with pytest.raises(RequestedRangeNotSatisfiable):
+        send({"Range": f"bytes={len(EXPECTED)}-"})
+
+
+def test_send_parts_not_modified(send):
+    response, _ = send({"If-None-Match": '"tag"'})
+    assert response.status_code == 304
+    response, body = send({"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert body == EXPECTED
@@ -0,0 +1,122 @@
+import os
+
+from manifest import ConversationManifest, plan_incremental
+from segment_store import SegmentStore
+from synthesis import LineResult
+from tts_backend import DEFAULT_MODEL
+
+SCRIPT = [
+    ("agent", "Hello there", "Daniel"),
+    ("customer", "Hi, my order is late", "Rachel"),
+    ("agent", "Let me check", "Daniel"),
+    ("customer", "Thanks", "Rachel"),
+]
+
+
+def run(output_dir, lines, store=None):
+    """Plans a run and "synthesizes" its jobs by writing each line's text as its audio."""
+    manifest = ConversationManifest(output_dir, model=DEFAULT_MODEL)
+    plan = plan_incremental(manifest, lines, DEFAULT_MODEL, store=store)
+    for job in plan.jobs:
+        audio = job.text.encode("utf-8")
+        if store:
+            store.append(job.index + 1, job.role, job.voice, audio, plan.hashes[job], text=job.text)
+        else:
+            with open(job.filename, "wb") as f:
+                f.write(audio)
+        manifest.record(LineResult(job, len(audio)), plan.hashes[job])
+    manifest.flush()
+    return plan
+
+
+def audio(output_dir):
+    """The audio files of the output directory, in line order."""
+    names = sorted(name for name in os.listdir(output_dir) if name.endswith(".mp3"))
+    return [(name[:2], open(os.path.join(output_dir, name), "rb").read().decode("utf-8")) for name in names]
+
+
+def texts(lines):
+    return [(f"{i:02d}", text) for i, (_, text, _) in enumerate(lines, 1)]
+
+
+def test_first_run_generates_everything(tmp_path):
+    plan = run(str(tmp_path), SCRIPT)
+    assert [job.index for job in plan.jobs] == [0, 1, 2, 3]
+    assert audio(str(tmp_path)) == texts(SCRIPT)
+
+
+def test_rerun_generates_nothing(tmp_path):
+    run(str(tmp_path), SCRIPT)
+    plan = run(str(tmp_path), SCRIPT)
+    assert plan.jobs == []
+    assert plan.unchanged == [1, 2, 3, 4]
+
+
+def test_insert_renumbers_the_following_lines(tmp_path):
+    run(str(tmp_path), SCRIPT)
+    lines = [("agent", "Welcome", "Daniel")] + SCRIPT
+    plan = run(str(tmp_path), lines)
+    assert [job.index for job in plan.jobs] == [0]
+    assert plan.moved == {2: 1, 3: 2, 4: 3, 5: 4}
+    assert plan.removed == []
+    assert audio(str(tmp_path)) == texts(lines)
+
+
+def test_delete_renumbers_and_removes(tmp_path):
+    run(str(tmp_path), SCRIPT)
+    lines = SCRIPT[:1] + SCRIPT[2:]
+    plan = run(str(tmp_path), lines)
+    assert plan.jobs == []
+    assert plan.unchanged == [1]
+    assert plan.moved == {2: 3, 3: 4}
+    assert plan.removed == [2]
+    assert audio(str(tmp_path)) == texts(lines)
+
+
+def test_swapped_lines_trade_files(tmp_path):
+    run(str(tmp_path), SCRIPT)
+    lines = [SCRIPT[1], SCRIPT[0]] + SCRIPT[2:]
+    plan = run(str(tmp_path), lines)
+    assert plan.jobs == []
+    assert plan.moved == {1: 2, 2: 1}
+    assert audio(str(tmp_path)) == texts(lines)
+
+
+def test_changed_text_is_regenerated_and_old_audio_removed(tmp_path):
+    run(str(tmp_path), SCRIPT)
+    lines = list(SCRIPT)
+    lines[2] = ("agent", "Let me look that up", "Daniel")
+    plan = run(str(tmp_path), lines)
+    assert [job.index for job in plan.jobs] == [2]
+    assert plan.removed == [3]
+    assert audio(str(tmp_path)) == texts(lines)
+
+
+def test_changed_voice_is_regenerated(tmp_path):
+    run(str(tmp_path), SCRIPT)
+    lines = list(SCRIPT)
+    lines[0] = ("agent", "Hello there", "Rachel")
+    plan = run(str(tmp_path), lines)
+    assert [job.index for job in plan.jobs] == [0]
+
+
+def test_missing_file_is_regenerated(tmp_path):
+    run(str(tmp_path), SCRIPT)
+    os.remove(os.path.join(str(tmp_path), sorted(os.listdir(str(tmp_path)))[0]))
+    plan = run(str(tmp_path), SCRIPT)
+    assert [job.index for job in plan.jobs] == [0]
+    assert audio(str(tmp_path)) == texts(SCRIPT)
+
+
+def test_segment_store_insert_and_delete(tmp_path):
+    output_dir = str(tmp_path)
+    run(output_dir, SCRIPT, SegmentStore(output_dir))
+    lines = [("agent", "Welcome", "Daniel")] + SCRIPT[:1] + SCRIPT[2:]
+    store = SegmentStore(output_dir)
+    plan = run(output_dir, lines, store)
+    assert [job.index for job in plan.jobs] == [0]
+    assert plan.moved == {2: 1}
+    assert plan.unchanged == [3, 4]
+    assert plan.removed == [2]
+    segments = sorted(store.segments(), key=lambda segment: segment.line)
+    assert [(segment.line, segment.text) for segment in segments] == [(i, text) for i, (_, text, _) in enumerate(lines, 1)]
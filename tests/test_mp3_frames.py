@@ -0,0 +1,79 @@
+import pytest
+
+from mp3_frames import (MPEG1, audio_range, id3v2_size, iter_frames, iter_stream_frames, parse_header,
+                        silent_frame, silent_frames)
+
+# MPEG-1 Layer III, no CRC, 128 kbit/s, 44.1 kHz, mono
+HEADER = parse_header(b"\xff\xfb\x90\xc0")
+FRAME = silent_frame(HEADER)
+TAG = b"ID3\x04\x00\x00\x00\x00\x00\x14" + bytes(20)
+
+
+def xing_frame():
+    frame = bytearray(FRAME)
+    position = 4 + HEADER.side_info_size
+    frame[position:position + 4] = b"Xing"
+    return bytes(frame)
+
+
+def test_parse_header():
+    assert HEADER.version == MPEG1
+    assert (HEADER.bitrate, HEADER.sample_rate, HEADER.channels) == (128, 44100, 1)
+    assert HEADER.frame_length == len(FRAME) == 417
+    assert HEADER.samples_per_frame == 1152
+
+
+@pytest.mark.parametrize("data", [
+    b"\xff\xfb\x90",          # too short
+    b"\x00\xfb\x90\xc0",      # no sync
+    b"\xff\xfd\x90\xc0",      # layer II
+    b"\xff\xfb\xf0\xc0",      # bad bitrate index
+    b"\xff\xfb\x9c\xc0",      # reserved sample rate
+])
+def test_parse_header_rejects(data):
+    assert parse_header(data) is None
+
+
+def test_id3v2_size():
+    assert id3v2_size(TAG + FRAME) == len(TAG)
+    assert id3v2_size(FRAME) == 0
+
+
+def test_iter_frames_skips_tag_and_xing():
+    data = TAG + xing_frame() + FRAME * 3
+    offsets = [offset for _, offset in iter_frames(data)]
+    assert offsets == [len(TAG) + len(FRAME) * i for i in (1, 2, 3)]
+
+
+def test_iter_frames_skips_tags_of_concatenated_files():
+    segment = TAG + xing_frame() + FRAME * 2
+    assert len(list(iter_frames(segment * 3))) == 6
+
+
+def test_iter_frames_drops_truncated_last_frame_and_id3v1():
+    assert len(list(iter_frames(FRAME * 2 + FRAME[:100]))) == 2
+    assert len(list(iter_frames(FRAME * 2 + b"TAG" + bytes(125)))) == 2
+
+
+def test_iter_frames_rejects_garbage_in_the_middle():
+    with pytest.raises(ValueError):
+        list(iter_frames(FRAME + b"garbage!" + FRAME))
+
+
+def test_iter_stream_frames_across_chunk_boundaries():
+    data = TAG + xing_frame() + FRAME * 5
+    chunks = [data[i:i + 97] for i in range(0, len(data), 97)]
+    frames = b"".join(frames for _, frames in iter_stream_frames(chunks))
+    assert frames == FRAME * 5
+
+
+def test_audio_range():
+    data = TAG + xing_frame() + FRAME * 4 + FRAME[:10]
+    start, end = audio_range(data)
+    assert data[start:end] == FRAME * 4
+
+
+def test_silent_frames_duration():
+    silence = silent_frames(HEADER, 1000)
+    assert len(silence) % HEADER.frame_length == 0
+    assert len(silence) // HEADER.frame_length == round(44100 / 1152)
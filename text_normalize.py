@@ -0,0 +1,48 @@
+"""
+Text normalization for cache keys and duplicate detection.
+
+Two levels:
+
+- `normalize_whitespace` collapses runs of whitespace. It is part of every
+  cache key and manifest hash (and of how long lines are segmented), so it
+  must never change: a stricter rule would orphan every cached line.
+- `normalize_for_speech` also folds differences that don't change what is
+  spoken: typographic quotes and dashes, spaces before punctuation,
+  repeated "!!" / "??", thousands separators in numbers and the like. Two
+  lines with the same speech form are duplicates of each other, and only
+  one of them needs to be synthesized (see dedup).
+"""
+import re
+import unicodedata
+
+_TYPOGRAPHY = str.maketrans({
+    "‘": "'", "’": "'", "‚": "'", "′": "'",
+    "“": '"', "”": '"', "„": '"', "″": '"',
+    "–": "-", "—": "-", "−": "-",
+    "…": "...",
+})
+_SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([,.!?;:%])")
+_REPEATED_PUNCTUATION = re.compile(r"([!?,;:])\1+")
+_THOUSANDS = re.compile(r"(?<![\d,.])\d{1,3}(?:,\d{3})+(?!,?\d)")
+
+
+def normalize_whitespace(text):
+    """
+    Collapses whitespace so trivially different copies of a line share a cache entry.
+    """
+    return " ".join(text.split())
+
+
+def normalize_for_speech(text):
+    """
+    The form of `text` used to find duplicate lines: whitespace collapsed,
+    Unicode compatibility characters (full-width digits, non-breaking spaces,
+    "…") and typographic quotes and dashes replaced by ASCII, no space before
+    punctuation, "!!!" reduced to "!", and "1,000,000" written as "1000000".
+    Case and the words themselves are left alone.
+    """
+    text = unicodedata.normalize("NFKC", text).translate(_TYPOGRAPHY)
+    text = normalize_whitespace(text)
+    text = _SPACE_BEFORE_PUNCTUATION.sub(r"\1", text)
+    text = _REPEATED_PUNCTUATION.sub(r"\1", text)
+    return _THOUSANDS.sub(lambda match: match.group(0).replace(",", ""), text)
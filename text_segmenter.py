@@ -0,0 +1,77 @@
+"""
+Splits long lines of dialogue into shorter segments for synthesis.
+
+A long line is cut at sentence boundaries. A sentence that is still too
+long is cut after a clause (comma, semicolon, colon, dash), and as a last
+resort between words. Neighbouring short pieces are packed back together
+so segments stay close to the size limit, because very short requests cost
+a round trip each and lose intonation.
+"""
+import re
+
+from text_normalize import normalize_whitespace
+
+DEFAULT_SEGMENT_CHARS = 250
+
+# Whitespace after sentence-ending punctuation, optionally followed by a closing quote or bracket
+_SENTENCE_BREAK = re.compile(r'(?:(?<=[.!?…])|(?<=[.!?…]["\')\]]))\s+')
+_CLAUSE_BREAK = re.compile(r'(?<=[,;:–—])\s+')
+
+
+def _split_at(pattern, text):
+    return [piece for piece in pattern.split(text) if piece]
+
+
+def _pieces(text, max_chars):
+    """
+    Breaks `text` into pieces no longer than `max_chars`, using the
+    coarsest boundary that works.
+    """
+    pieces = []
+    for sentence in _split_at(_SENTENCE_BREAK, text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in _split_at(_CLAUSE_BREAK, sentence):
+            if len(clause) <= max_chars:
+                pieces.append(clause)
+            else:
+                pieces.extend(clause.split())
+    return pieces
+
+
+def _pack(pieces, limits):
+    segments, current = [], ""
+    for piece in pieces:
+        limit = limits[min(len(segments), len(limits) - 1)]
+        candidate = f"{current} {piece}" if current else piece
+        if current and len(candidate) > limit:
+            segments.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        segments.append(current)
+    return segments
+
+
+def split_text(text, max_chars=DEFAULT_SEGMENT_CHARS, first_max_chars=None):
+    """
+    Splits `text` into segments of at most `max_chars` characters
+    (single words longer than that are kept whole).
+
+    Args:
+        text (str): The line to split
+        max_chars (int): Size limit per segment; lines up to this length are not split
+        first_max_chars (int): Smaller limit for the first segment, so the first
+            audio arrives sooner (default: half of `max_chars`)
+
+    Returns:
+        list: Segments in reading order; joined with spaces they give back the
+        text with whitespace normalized
+    """
+    text = normalize_whitespace(text)
+    if not max_chars or len(text) <= max_chars:
+        return [text]
+    first_max_chars = first_max_chars or max_chars // 2
+    return _pack(_pieces(text, max_chars), (first_max_chars, max_chars))
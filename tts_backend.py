@@ -0,0 +1,237 @@
+"""
+Synthesis backends.
+
+A backend turns (text, voice, model) into an iterator of audio chunks and
+can list the voices it offers. SynthesisEngine and the voice catalog talk
+to the backend selected with ELEVENLABS_BACKEND:
+
+- `elevenlabs` (default): the ElevenLabs API, over the pooled keep-alive
+  session in http_client
+- `fake`: a local, deterministic stand-in for tests, CI and benchmarks that
+  needs no API key or network. It is configured with ELEVENLABS_FAKE_OPTIONS,
+  e.g. "latency=0.2,throughput=32000,error_rate=0.05" (see FakeBackend).
+
+Both honour the `output_format` of a request: MP3 or raw 16-bit PCM (see pcm_audio).
+"""
+import os
+import math
+import time
+import struct
+import hashlib
+import threading
+
+from mp3_frames import parse_header, silent_frame
+from pcm_audio import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS, pcm_rate
+from rate_limiter import ThrottledError
+
+DEFAULT_BACKEND = os.getenv("ELEVENLABS_BACKEND", "elevenlabs")
+DEFAULT_MODEL = "eleven_multilingual_v2"
+
+
+class TTSBackend:
+    """
+    Interface for synthesis backends. Instances are callable like the
+    `generate_fn` SynthesisEngine has always accepted.
+    """
+
+    name = None
+    # Whether the entry points should insist on ELEVENLABS_API_KEY
+    needs_api_key = False
+    # The http_client.SynthesisClient requests go through, for backends that make HTTP calls
+    client = None
+
+    def generate(self, text, voice, model=DEFAULT_MODEL, output_format=DEFAULT_OUTPUT_FORMAT):
+        """Returns an iterator of audio chunks in `output_format` for `text` spoken by `voice`."""
+        raise NotImplementedError
+
+    def list_voices(self):
+        """Returns the Voice objects this backend offers."""
+        raise NotImplementedError
+
+    def reserve_connections(self, count):
+        """Makes room for `count` requests in flight at once, e.g. an engine's workers."""
+
+    def __call__(self, text, voice, model=DEFAULT_MODEL, output_format=DEFAULT_OUTPUT_FORMAT):
+        return self.generate(text, voice, model, output_format)
+
+
+class ElevenLabsBackend(TTSBackend):
+    """
+    The ElevenLabs API. All requests share one pooled session (see http_client).
+
+    Args:
+        client (SynthesisClient): Client to send requests with (default: the process-wide one)
+    """
+
+    name = "elevenlabs"
+    needs_api_key = True
+
+    def __init__(self, client=None):
+        self._client = client
+        self._reserved = 0
+
+    @property
+    def client(self):
+        # Created on first use, so that importing an entry point doesn't import requests
+        if self._client is None:
+            from http_client import get_default_client
+
+            self._client = get_default_client()
+            self._client.ensure_pool_size(self._reserved)
+        return self._client
+
+    def generate(self, text, voice, model=DEFAULT_MODEL, output_format=DEFAULT_OUTPUT_FORMAT):
+        return self.client.generate_stream(text, voice, model, output_format)
+
+    def list_voices(self):
+        return self.client.list_voices()
+
+    def reserve_connections(self, count):
+        self._reserved = max(self._reserved, count)
+        if self._client is not None:
+            self._client.ensure_pool_size(count)
+
+
+class InjectedError(RuntimeError):
+    """A failure produced on purpose by FakeBackend."""
+
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, mono, no CRC: ElevenLabs' default output format
+FAKE_MP3_HEADER = parse_header(bytes([0xFF, 0xFB, 0x90, 0xC4]))
+FAKE_VOICES = (("fake-daniel", "Daniel"), ("fake-rachel", "Rachel"), ("fake-alex", "Alex"))
+
+
+class FakeBackend(TTSBackend):
+    """
+    Deterministic offline backend.
+
+    The audio for a line depends only on its text and voice. Its length is
+    `ms_per_char` per character. MP3 output consists of valid silent
+    frames in ElevenLabs' format. PCM output is a 16-bit mono sine tone at
+    the requested rate whose pitch depends on the voice. Injected failures are deterministic too:
+    whether attempt n of a given line fails depends only on the seed, the
+    line and n, not on thread scheduling.
+
+    Args:
+        latency (float): Seconds before the first chunk
+        chunk_size (int): Bytes per chunk
+        throughput (float): Bytes per second to pace the stream at (0: as fast as possible)
+        ms_per_char (float): Milliseconds of audio per character of text
+        error_rate (float): Fraction of requests that fail before the first chunk
+        midstream_error_rate (float): Fraction of requests that fail after the first chunk
+        throttle_rate (float): Fraction of requests answered with a 429 (ThrottledError)
+        retry_after (float): Retry-After hint sent with injected 429s
+        seed (int): Changes which requests fail
+    """
+
+    name = "fake"
+
+    def __init__(self, latency=0.0, chunk_size=4096, throughput=0.0, ms_per_char=60.0,
+                 error_rate=0.0, midstream_error_rate=0.0, throttle_rate=0.0, retry_after=0.1, seed=0):
+        self.latency = float(latency)
+        self.chunk_size = int(chunk_size)
+        self.throughput = float(throughput)
+        self.ms_per_char = float(ms_per_char)
+        self.error_rate = float(error_rate)
+        self.midstream_error_rate = float(midstream_error_rate)
+        self.throttle_rate = float(throttle_rate)
+        self.retry_after = float(retry_after)
+        self.seed = int(seed)
+        self.requests = 0
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        Builds a backend from a "key=value,key=value" string such as ELEVENLABS_FAKE_OPTIONS.
+        """
+        kwargs = {}
+        for item in filter(None, (part.strip() for part in (options or "").split(","))):
+            key, _, value = item.partition("=")
+            kwargs[key.strip()] = value.strip()
+        return cls(**kwargs)
+
+    @staticmethod
+    def _voice_id(voice):
+        return voice if isinstance(voice, str) or voice is None else voice.voice_id
+
+    def _draw(self, *parts):
+        """A deterministic number in [0, 1) for the given request identity."""
+        digest = hashlib.sha256(":".join(str(p) for p in (self.seed,) + parts).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+    def audio(self, text, voice, output_format=DEFAULT_OUTPUT_FORMAT):
+        """The complete audio the backend returns for a line."""
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"unsupported output format {output_format!r}")
+        duration_ms = max(1, len(text)) * self.ms_per_char
+        rate = pcm_rate(output_format)
+        if rate is None:
+            header = FAKE_MP3_HEADER
+            frames = max(1, round(duration_ms / 1000 * header.sample_rate / header.samples_per_frame))
+            return silent_frame(header) * frames
+        samples = int(rate * duration_ms / 1000)
+        frequency = 150 + 250 * self._draw("pitch", self._voice_id(voice))
+        step = 2 * math.pi * frequency / rate
+        return struct.pack(f"<{samples}h", *(int(8000 * math.sin(step * i)) for i in range(samples)))
+
+    def generate(self, text, voice, model=DEFAULT_MODEL, output_format=DEFAULT_OUTPUT_FORMAT):
+        identity = (text, self._voice_id(voice), model, output_format)
+        with self._lock:
+            self.requests += 1
+            attempt = self._attempts.get(identity, 0)
+            self._attempts[identity] = attempt + 1
+        return self._stream(identity, attempt, self.audio(text, voice, output_format))
+
+    def _stream(self, identity, attempt, data):
+        if self.latency:
+            time.sleep(self.latency)
+        if self._draw("throttle", attempt, *identity) < self.throttle_rate:
+            raise ThrottledError("too_many_concurrent_requests", retry_after=self.retry_after)
+        if self._draw("error", attempt, *identity) < self.error_rate:
+            raise InjectedError(f"injected failure for {identity[0][:20]!r}")
+        fail_midstream = self._draw("midstream", attempt, *identity) < self.midstream_error_rate
+        started = time.perf_counter()
+        sent = 0
+        for offset in range(0, len(data), self.chunk_size):
+            chunk = data[offset:offset + self.chunk_size]
+            if self.throughput:
+                # Pace the stream: don't send ahead of `throughput` bytes per second
+                ahead = sent / self.throughput - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+            yield chunk
+            sent += len(chunk)
+            if fail_midstream:
+                raise InjectedError(f"injected stream failure for {identity[0][:20]!r}")
+
+    def list_voices(self):
+        from elevenlabs.api import Voice
+
+        return [Voice(voice_id=voice_id, name=name) for voice_id, name in FAKE_VOICES]
+
+
+BACKENDS = {"elevenlabs": ElevenLabsBackend, "fake": FakeBackend}
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def create_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"unknown backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    if name == "fake":
+        return FakeBackend.from_options(os.getenv("ELEVENLABS_FAKE_OPTIONS"))
+    return BACKENDS[name]()
+
+
+def get_default_backend():
+    """
+    Returns the process-wide backend selected by ELEVENLABS_BACKEND.
+    """
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = create_backend(DEFAULT_BACKEND)
+        return _default_backend
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import threading
+
+from audio_cache import default_cache_dir
+from audio_writer import AtomicFileWriter
+from tts_backend import get_default_backend
+
+DEFAULT_CATALOG_PATH = os.getenv("ELEVENLABS_VOICE_CATALOG")
+DEFAULT_TTL = int(os.getenv("ELEVENLABS_VOICE_TTL", str(24 * 60 * 60)))
+RETRY_INTERVAL = 60
+
+
+def fetch_voices():
+    """
+    Downloads the voice list from the configured backend.
+    """
+    return get_default_backend().list_voices()
+
+
+class VoiceCatalog:
+    """
+    The account's voices, persisted on disk and indexed by id and name.
+
+    The list is loaded from `path` on first use, so startup needs no API
+    call. It is only fetched synchronously when there is no copy on disk
+    at all. Once the copy is older than `ttl` seconds, the next lookup
+    starts a refresh in a background thread and keeps serving the stale
+    list until the new one arrives. Lookups by id or name are dict hits.
+
+    Args:
+        path (str): JSON file holding the persisted voice list (default: voices.json in the cache directory)
+        ttl (float): Age in seconds after which the list is refreshed
+        fetch_fn (callable): Returns a list of Voice objects (default: the backend)
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH, ttl=DEFAULT_TTL, fetch_fn=fetch_voices):
+        self.path = path or os.path.join(default_cache_dir(), "voices.json")
+        self.ttl = ttl
+        self.fetch_fn = fetch_fn
+        self.fetched_at = 0.0
+        self.fetches = 0
+        self._retry_at = 0.0
+        self._voices = []
+        self._by_id = {}
+        self._by_name = {}
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._loaded = False
+
+    def _index(self, voices, fetched_at):
+        by_id = {voice.voice_id: voice for voice in voices}
+        by_name = {}
+        for voice in voices:
+            # Keep the first of several voices with the same name, like the old linear scans did
+            by_name.setdefault(voice.name, voice)
+        # Swap all three at once, so readers never see a half-built index
+        self._voices, self._by_id, self._by_name = list(voices), by_id, by_name
+        self.fetched_at = fetched_at
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            from elevenlabs.api import Voice
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self._index([Voice.model_validate(v) for v in data["voices"]], data["fetched_at"])
+        except Exception as e:
+            print(f"Ignoring unreadable voice catalog {self.path}: {e}")
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {"fetched_at": self.fetched_at, "voices": [v.model_dump(mode="json") for v in self._voices]}
+        with AtomicFileWriter(self.path) as writer:
+            writer.write(json.dumps(data, indent=4).encode("utf-8"))
+
+    @property
+    def stale(self):
+        return time.time() - self.fetched_at > self.ttl
+
+    def refresh(self):
+        """
+        Fetches the voice list now and persists it. On failure the current
+        (possibly stale) list is kept.
+
+        Returns:
+            bool: True if the list was refreshed
+        """
+        try:
+            voices = self.fetch_fn()
+        except Exception as e:
+            print(f"Error getting voices: {e}")
+            # Don't hit a failing API on every lookup
+            self._retry_at = time.time() + RETRY_INTERVAL
+            return False
+        with self._lock:
+            self.fetches += 1
+            self._index(voices, time.time())
+            try:
+                self._save()
+            except OSError as e:
+                print(f"Could not save voice catalog {self.path}: {e}")
+        return True
+
+    def refresh_in_background(self):
+        """
+        Starts a refresh thread unless one is already running.
+        """
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return self._refreshing
+            self._refreshing = threading.Thread(target=self.refresh, daemon=True)
+            self._refreshing.start()
+            return self._refreshing
+
+    def _ensure_fresh(self):
+        if not self._loaded:
+            # Deferred so that constructing the catalog (e.g. at import time) costs nothing
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+                    self._loaded = True
+        if time.time() < self._retry_at:
+            return
+        if not self._voices:
+            self.refresh()
+        elif self.stale:
+            self.refresh_in_background()
+
+    def all(self):
+        """
+        All voices, in the order the API returned them.
+        """
+        self._ensure_fresh()
+        return self._voices
+
+    def get(self, voice_id):
+        """
+        The Voice with this id, or None.
+        """
+        self._ensure_fresh()
+        return self._by_id.get(voice_id)
+
+    def find(self, name_or_id):
+        """
+        The Voice with this id or name, or None.
+        """
+        self._ensure_fresh()
+        return self._by_id.get(name_or_id) or self._by_name.get(name_or_id)
+
+    def stats(self):
+        return {
+            "voices": len(self._voices),
+            "age_seconds": round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+            "ttl_seconds": self.ttl,
+            "fetches": self.fetches,
+        }
+
+
+_default_catalog = None
+_default_catalog_lock = threading.Lock()
+
+
+def get_default_catalog():
+    """
+    Returns the process-wide voice catalog shared by all entry points.
+    Set ELEVENLABS_VOICE_CATALOG / ELEVENLABS_VOICE_TTL to configure it.
+    """
+    global _default_catalog
+    with _default_catalog_lock:
+        if _default_catalog is None:
+            _default_catalog = VoiceCatalog()
+        return _default_catalog
@@ -1,19 +1,44 @@
 import os
+import glob
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import Flask, Response, abort, jsonify, request, render_template_string, send_file
+from werkzeug.utils import safe_join
+from werkzeug.wsgi import wrap_file
+from config import require_api_key
+from audio_cache import cache_key, get_default_cache
+from dedup import DedupIndex
+from rate_limiter import get_default_limiter
+from metrics import get_default_metrics, recorded_stream
+from file_parts import PartsReader
+from manifest import ConversationManifest, STATUS_DONE
+from mp3_frames import audio_range, iter_stream_frames, silent_frames
+from pcm_audio import PCM_SAMPLE_WIDTH, crossfade_streams, pcm_rate, wav_header
+from segment_store import INDEX_NAME, SegmentStore
+from stream_hub import StreamHub
+from synthesis import DEFAULT_LOOKAHEAD, SynthesisEngine, lookahead
+from voice_catalog import get_default_catalog
 
-from flask import Flask, Response, request, render_template_string
-from dotenv import load_dotenv
-from elevenlabs import generate, set_api_key
-from stream_conversation import LiveConversationPlayer
-
-load_dotenv()
-api_key = os.getenv("ELEVENLABS_API_KEY")
-if not api_key:
-    raise RuntimeError("ELEVENLABS_API_KEY not set")
-set_api_key(api_key)
-
-# Use LiveConversationPlayer to fetch available voices
-player = LiveConversationPlayer()
-voices = player.get_available_voices()
+# Voices come from the persisted catalog, refreshed in the background once stale
+catalog = get_default_catalog()
+engine = SynthesisEngine(cache=get_default_cache(), limiter=get_default_limiter())
+# Identical concurrent /stream requests share one upstream call
+hub = StreamHub()
+metrics = get_default_metrics()
+# Generated conversations (loose files or --segment_store) and combined files are served from below this directory
+AUDIO_ROOT = os.path.abspath(os.getenv("ELEVENLABS_AUDIO_ROOT") or os.getenv("ELEVENLABS_SEGMENT_ROOT", "."))
+AUDIO_EXTENSIONS = (".mp3", ".wav")
+_stores = {}
+_stores_lock = threading.Lock()
+# Whole-conversation streams: limits per request, and documents registered for GET /conversation/<id>
+MAX_CONVERSATION_TURNS = 500
+MAX_CONVERSATION_LOOKAHEAD = 8
+DEFAULT_TURN_SILENCE_MS = 500
+MAX_REGISTERED_CONVERSATIONS = 256
+_conversations = OrderedDict()
+_conversations_lock = threading.Lock()
 
 app = Flask(__name__)
 
@@ -34,6 +59,17 @@ INDEX_HTML = """
 </select>
 <button onclick='play()'>Play</button>
 <audio id='audio' controls></audio>
+<h2>Conversation</h2>
+<textarea id='conversation' rows='8' cols='50' placeholder='[{"role": "agent", "text": "..."}, {"role": "customer", "text": "..."}]'></textarea><br>
+{% for role in ['agent', 'customer'] %}
+{{ role }}: <select id='voice-{{ role }}'>
+{% for v in voices %}
+<option value='{{ v.voice_id }}'{% if loop.index0 == loop.length - 1 and role == 'customer' %} selected{% endif %}>{{ v.name }}</option>
+{% endfor %}
+</select>
+{% endfor %}
+<button onclick='playConversation()'>Play conversation</button>
+<audio id='conversation-audio' controls></audio>
 <script>
 function play() {
   const text = document.getElementById('text').value;
@@ -42,6 +78,18 @@ function play() {
   audio.src = '/stream?text=' + encodeURIComponent(text) + '&voice=' + voice;
   audio.play();
 }
+async function playConversation() {
+  const body = {
+    conversation: JSON.parse(document.getElementById('conversation').value),
+    voices: {agent: document.getElementById('voice-agent').value,
+             customer: document.getElementById('voice-customer').value},
+  };
+  const response = await fetch('/conversation/register', {
+    method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(body)});
+  const audio = document.getElementById('conversation-audio');
+  audio.src = (await response.json()).url;
+  audio.play();
+}
 </script>
 </body>
 </html>
@@ -50,18 +98,291 @@ function play() {
 @app.route('/')
 def index():
 
-    return render_template_string(INDEX_HTML, voices=voices)
+    return render_template_string(INDEX_HTML, voices=catalog.all())
+
+def send_parts(parts, mimetype, etag):
+    """
+    Serves audio with ETag, If-None-Match and Range/206 support. `parts` are
+    bytes or (path, offset, length) file ranges. A single whole file goes
+    through send_file, so servers with wsgi.file_wrapper send it with
+    sendfile() (zero-copy). Anything else is read from a PartsReader, which
+    only reads the requested range.
+    """
+    if len(parts) == 1 and not isinstance(parts[0], bytes):
+        path, offset, length = parts[0]
+        if offset == 0 and length == os.path.getsize(path):
+            # send_file resolves relative paths against the app's root, not the working directory
+            return send_file(os.path.abspath(path), mimetype=mimetype, conditional=True, etag=etag)
+    reader = PartsReader(parts)
+    response = Response(wrap_file(request.environ, reader), mimetype=mimetype, direct_passthrough=True)
+    response.content_length = reader.size
+    response.set_etag(etag)
+    # Revalidate with the ETag instead of trusting a cached copy: the same URL can be regenerated
+    response.cache_control.no_cache = True
+    return response.make_conditional(request.environ, accept_ranges=True, complete_length=reader.size)
+
+def whole_file(path):
+    return (path, 0, os.path.getsize(path))
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def audio_parts(paths, output_format):
+    """
+    Parts of a line whose segments are cache entries, behind a WAV header
+    for raw PCM. Several segments are joined the way the engine joins them
+    live (see SynthesisEngine.stream): MP3 entries are served without their
+    ID3 tags and Xing frames, PCM entries are crossfaded.
+    """
+    rate = pcm_rate(output_format)
+    if len(paths) == 1:
+        files = [whole_file(paths[0])]
+    elif rate:
+        overlap = int(rate * engine.segment_crossfade_ms / 1000) * PCM_SAMPLE_WIDTH
+        files = [b"".join(crossfade_streams(([read_file(path)] for path in paths), overlap))]
+    else:
+        files = []
+        for path in paths:
+            start, end = audio_range(read_file(path))
+            files.append((path, start, end - start))
+    if rate:
+        size = sum(len(part) if isinstance(part, bytes) else part[2] for part in files)
+        return [wav_header(rate, data_size=size)] + files
+    return files
+
+def audio_mimetype(output_format):
+    return 'audio/wav' if pcm_rate(output_format) else 'audio/mpeg'
 
 @app.route('/stream')
 def stream_audio():
     text = request.args.get('text', '')
     voice_id = request.args.get('voice')
-    selected = next((v for v in voices if v.voice_id == voice_id), voices[0])
-    audio_stream = generate(text=text, voice=selected, model="eleven_multilingual_v2", stream=True)
-    def generate_chunks():
-        for chunk in audio_stream:
-            yield chunk
-    return Response(generate_chunks(), mimetype='audio/mpeg')
+    selected = catalog.get(voice_id) or catalog.all()[0]
+    key = cache_key(text, selected, engine.model, engine.output_format)
+    # Already synthesized: serve it from the cache, so seeking and replaying cost disk reads, not API calls
+    paths = engine.cache.paths(engine.cache_keys(text, selected)) if engine.cache else None
+    if paths:
+        return send_parts(audio_parts(paths, engine.output_format), audio_mimetype(engine.output_format), key)
+    audio_stream = hub.subscribe(key, lambda: engine.stream(text, selected))
+    audio_stream = recorded_stream(metrics, "web_stream", audio_stream, voice=selected.voice_id, chars=len(text))
+    # Live audio has no known length yet; Range requests work once it is in the cache
+    return Response(audio_stream, mimetype='audio/mpeg', headers={'Accept-Ranges': 'none'})
+
+def parse_conversation(document):
+    """
+    Validates a /conversation request body: a list of {"role", "text"} turns,
+    or {"conversation": [...], "voices": {role: voice name or id},
+    "silence_ms": ..., "lookahead": ...}. Roles without a voice get the
+    catalog's voices in order of appearance. Aborts with 400 on bad input.
+
+    Returns:
+        tuple: ([(role, text, voice), ...], silence in ms, look-ahead depth)
+    """
+    if isinstance(document, list):
+        document = {"conversation": document}
+    if not isinstance(document, dict) or not isinstance(document.get("conversation"), list):
+        abort(400, "expected a list of turns or an object with a 'conversation' list")
+    conversation = document["conversation"]
+    if not conversation or len(conversation) > MAX_CONVERSATION_TURNS:
+        abort(400, f"a conversation needs 1 to {MAX_CONVERSATION_TURNS} turns")
+    voices = catalog.all()
+    if not voices:
+        abort(503, "no voices available")
+    by_role = {}
+    for role, name in (document.get("voices") or {}).items():
+        voice = catalog.find(name) if isinstance(name, str) else None
+        if voice is None:
+            abort(400, f"unknown voice {name!r} for role {role!r}")
+        by_role[role] = voice
+    turns = []
+    for turn in conversation:
+        if not isinstance(turn, dict) or not isinstance(turn.get("text"), str) or not isinstance(turn.get("role"), str):
+            abort(400, "every turn needs a 'role' and a 'text'")
+        role = turn["role"]
+        if role not in by_role:
+            by_role[role] = voices[len(by_role) % len(voices)]
+        turns.append((role, turn["text"], by_role[role]))
+    try:
+        silence_ms = max(0, int(document.get("silence_ms", DEFAULT_TURN_SILENCE_MS)))
+        depth = min(MAX_CONVERSATION_LOOKAHEAD, max(0, int(document.get("lookahead", DEFAULT_LOOKAHEAD))))
+    except (TypeError, ValueError):
+        abort(400, "'silence_ms' and 'lookahead' must be numbers")
+    return turns, silence_ms, depth
+
+def conversation_stream(turns, silence_ms, depth):
+    """
+    One continuous MP3 stream of a whole conversation.
+
+    The current turn and the next `depth` turns are synthesized at once
+    (through the cache, rate limiter and request coalescing like /stream).
+    Turns are emitted in order, re-chunked along frame boundaries, with
+    pre-encoded silent frames in between, so the first turn can play while
+    later ones are still being generated. A turn that fails is skipped.
+    Repeated turns reuse the audio of their first occurrence (see dedup).
+    """
+    dedup_index = DedupIndex()
+
+    def spoken_turns():
+        # Runs on the response thread as lookahead pulls turns, so repeats are matched in order
+        for role, text, voice in turns:
+            yield role, dedup_index.add(text, voice, text) or text, voice
+
+    def open_stream(turn):
+        _, text, voice = turn
+        key = cache_key(text, voice, engine.model, engine.output_format)
+        return hub.subscribe(key, lambda: engine.stream(text, voice))
+
+    silence = None
+    gap = False
+    for index, (turn, turn_stream) in enumerate(lookahead(spoken_turns(), open_stream, depth)):
+        try:
+            for header, frames in iter_stream_frames(turn_stream):
+                if silence is None:
+                    # Matches the format of the turns, so players see one uninterrupted stream
+                    silence = silent_frames(header, silence_ms)
+                if gap:
+                    yield silence
+                    gap = False
+                yield frames
+        except Exception as e:
+            print(f"/conversation: skipping turn {index + 1} ({turn[0]}): {e}")
+        gap = silence is not None
+
+def conversation_response(turns, silence_ms, depth):
+    audio_stream = conversation_stream(turns, silence_ms, depth)
+    audio_stream = recorded_stream(metrics, "web_conversation", audio_stream, turns=len(turns),
+                                   chars=sum(len(text) for _, text, _ in turns))
+    return Response(audio_stream, mimetype='audio/mpeg', headers={'Accept-Ranges': 'none'})
+
+@app.route('/conversation', methods=['POST'])
+def conversation_audio():
+    """
+    Streams the conversation in the JSON body (see parse_conversation) as one MP3.
+    """
+    return conversation_response(*parse_conversation(request.get_json(silent=True)))
+
+@app.route('/conversation/register', methods=['POST'])
+def register_conversation():
+    """
+    Stores a conversation and returns a URL that streams it with GET, for an <audio> element.
+    """
+    document = request.get_json(silent=True)
+    parse_conversation(document)
+    conversation_id = hashlib.sha256(json.dumps(document, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    with _conversations_lock:
+        _conversations[conversation_id] = document
+        _conversations.move_to_end(conversation_id)
+        while len(_conversations) > MAX_REGISTERED_CONVERSATIONS:
+            _conversations.popitem(last=False)
+    return jsonify({"id": conversation_id, "url": f"/conversation/{conversation_id}"})
+
+@app.route('/conversation/<conversation_id>')
+def registered_conversation_audio(conversation_id):
+    with _conversations_lock:
+        document = _conversations.get(conversation_id)
+    if document is None:
+        abort(404)
+    return conversation_response(*parse_conversation(document))
+
+def conversation_dir(conversation):
+    directory = safe_join(AUDIO_ROOT, conversation)
+    if directory is None or not os.path.isdir(directory):
+        abort(404)
+    return directory
+
+def open_store(conversation):
+    """
+    The segment store in AUDIO_ROOT/<conversation>, reloaded only when its index changed.
+    """
+    directory = safe_join(AUDIO_ROOT, conversation)
+    if directory is None or not SegmentStore.exists(directory):
+        abort(404)
+    mtime = os.path.getmtime(os.path.join(directory, INDEX_NAME))
+    with _stores_lock:
+        cached = _stores.get(directory)
+        if cached is None or cached[0] != mtime:
+            cached = _stores[directory] = (mtime, SegmentStore(directory))
+        return cached[1]
+
+@app.route('/segments/<path:conversation>/index')
+def segment_index(conversation):
+    store = open_store(conversation)
+    return jsonify({"stats": store.stats(), "segments": [s._asdict() for s in store.segments()]})
+
+@app.route('/segments/<path:conversation>/lines/<int:line>')
+@app.route('/conversations/<path:conversation>/lines/<int:line>')
+def line_audio(conversation, line):
+    """
+    One line of a generated conversation: a slice of its segment store, or
+    its file as recorded in the manifest. The ETag is the line's content hash.
+    """
+    directory = conversation_dir(conversation)
+    if SegmentStore.exists(directory):
+        store = open_store(conversation)
+        segment = store.get(line)
+        if segment is None:
+            abort(404)
+        rate = pcm_rate(segment.format)
+        parts = [(store.data_path, segment.offset, segment.length)]
+        if rate:
+            parts.insert(0, wav_header(rate, data_size=segment.length))
+        return send_parts(parts, audio_mimetype(segment.format), segment.hash or f"{segment.offset}-{segment.length}")
+    entry = ConversationManifest(directory).entry(line - 1)
+    if entry is not None and entry.get("status") == STATUS_DONE:
+        path = os.path.join(directory, entry["file"])
+        etag = entry["hash"]
+    else:
+        # No manifest (e.g. an older run): find the file by its line number prefix
+        matches = [path for path in glob.glob(os.path.join(glob.escape(directory), f"{line:02d}_*"))
+                   if path.endswith(AUDIO_EXTENSIONS)]
+        path = matches[0] if matches else None
+        etag = None
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_file(os.path.abspath(path), conditional=True, etag=etag or True)
+
+@app.route('/files/<path:filename>')
+def audio_file(filename):
+    """
+    Any MP3 or WAV file below AUDIO_ROOT, e.g. a combined conversation.
+    """
+    path = safe_join(AUDIO_ROOT, filename)
+    if path is None or not path.endswith(AUDIO_EXTENSIONS) or not os.path.isfile(path):
+        abort(404)
+    return send_file(os.path.abspath(path), conditional=True)
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(get_default_cache().stats())
+
+@app.route('/ratelimit/stats')
+def ratelimit_stats():
+    return jsonify(get_default_limiter().stats())
+
+@app.route('/http/stats')
+def http_stats():
+    # Connection reuse of the pooled session shared by all /stream requests
+    client = engine.http_client
+    return jsonify(client.stats() if client is not None else {})
+
+@app.route('/voices/stats')
+def voice_stats():
+    return jsonify(catalog.stats())
+
+@app.route('/stream/stats')
+def stream_stats():
+    return jsonify(hub.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/summary')
+def metrics_summary():
+    return jsonify(metrics.summary())
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    require_api_key()
+    # threaded: each listener only waits on a shared stream, the upstream runs in its own thread
+    app.run(debug=True, threaded=True)